@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from typing import *
+
+import sys
+import time
+import tracemalloc
+
+from collections import Counter
+
+from src.util import *
+from src import lexer
+from src import parser
+from src import ast
+from src import ir3
+from src import iropt
+from src import cgreg
+from src import cglower
+from src import dataflow
+from src import typecheck
+from src import cgliveness
+
+
+def timed(fn: Callable[[], Any]) -> float:
+	start = time.perf_counter()
+	fn()
+	return time.perf_counter() - start
+
+
+def make_string_program(size: int) -> bytes:
+	# a mix of plain text and escapes, roughly like an embedded text table
+	chunk = 'the quick brown fox\\tjumps over\\n the \\"lazy\\" dog\\x21 \\065\\\\ '
+	body = (chunk * (size // len(chunk) + 1))[:size]
+
+	# don't cut an escape in half
+	while body.endswith("\\") or (body.rfind("\\") > len(body) - 4):
+		body = body[:-1]
+
+	return f'class Main {{ Void main() {{ println("{body}"); }} }}'.encode()
+
+
+def bench_strings() -> None:
+	print(f"{'size':>10}  {'lex (ms)':>10}  {'ns/byte':>8}  {'escape (ms)':>12}  {'ns/byte':>8}")
+	for size in [ 64 * 1024, 256 * 1024, 1024 * 1024 ]:
+		source = SourceFile("<bench>", make_string_program(size))
+
+		tokens: List[lexer.TokenArray] = []
+		lex_time = timed(lambda: tokens.append(lexer.tokenise(source)))
+
+		literal = next(tokens[0].text(i) for i in range(len(tokens[0])) if tokens[0].type(i) == lexer.TokenKind.StringLiteral)
+		esc_time = timed(lambda: escape_string(literal))
+
+		print(f"{size:>10}  {1000 * lex_time:>10.2f}  {1e9 * lex_time / size:>8.1f}  "
+			+ f"{1000 * esc_time:>12.2f}  {1e9 * esc_time / len(literal):>8.1f}")
+
+
+def make_large_program(methods: int) -> bytes:
+	lines = [ "class Main {", "    Void main() {", "        Foo f;", "        f = new Foo();",
+		"        println(f.m0(1));", "    }", "}", "class Foo {", "    Int a;", "    Int b;", "    Foo next;" ]
+
+	for i in range(methods):
+		call = f"this.m{i + 1}(x - 1)" if i + 1 < methods else "0"
+		lines += [
+			f"    Int m{i}(Int x) {{",
+			f"        Int y;",
+			f"        Bool c;",
+			f"        y = x * 3 + a - b / 2 + (x - {i}) * (y + 7);",
+			f"        c = (y > 10 && x < 3) || !(y == x) || y != {i};",
+			f"        if (c) {{ y = y + 1; a = a - y; }} else {{ y = y - 1; b = next.a + next.b; }}",
+			f"        while (y < 100) {{ y = y * 2; println(\"m{i}: \" + \"loop\"); }}",
+			f"        return y + {call};",
+			f"    }}"
+		]
+
+	lines.append("}")
+	return "\n".join(lines).encode()
+
+
+def count_nodes(prog: ast.Program) -> Counter:
+	counts: Counter = Counter()
+	pending: List[Any] = [ prog ]
+	while len(pending) > 0:
+		node = pending.pop()
+		if isinstance(node, list):
+			pending.extend(node)
+			continue
+
+		counts[type(node).__name__] += 1
+		for cls in type(node).__mro__:
+			for attr in getattr(cls, "__slots__", ()):
+				# don't go back up the tree
+				if attr == "parent":
+					continue
+
+				child = getattr(node, attr)
+				if isinstance(child, list) or type(child).__module__ == ast.__name__:
+					pending.append(child)
+
+	return counts
+
+
+def bench_memory() -> None:
+	methods = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+	source = SourceFile("<bench>", make_large_program(methods))
+
+	# tracing slows everything down a lot, so time a separate run.
+	parse_time = timed(lambda: parser.parse_program(parser.ParserState(source)))
+
+	tracemalloc.start()
+	prog = parser.parse_program(parser.ParserState(source))
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	counts = count_nodes(prog)
+	total = sum(counts.values())
+
+	print(f"source:     {len(source.buffer)} bytes ({methods} methods)")
+	print(f"parse time: {1000 * parse_time:.1f} ms")
+	print(f"memory:     {current / 1e6:.2f} MB retained, {peak / 1e6:.2f} MB peak")
+	print(f"nodes:      {total} ({current / total:.1f} bytes/node)")
+	for name, n in counts.most_common():
+		print(f"    {name:<14}{n:>10}")
+
+
+def make_temporaries_program(temps: int) -> bytes:
+	# each statement needs four temporaries (and `b` and `c` stay live across the whole thing, so every
+	# temporary interferes with at least something).
+	lines = [ "class Main {", "    Void main() {", "        Int a;", "        Int b;", "        Int c;",
+		"        readln(b);", "        c = 0;" ]
+
+	for i in range(temps // 4):
+		# keep the constants small enough to not need temporaries of their own.
+		lines.append(f"        c = c + (b + {i % 200}) * (b - {i % 200});")
+
+	lines += [ "        println(c);", "    }", "}" ]
+	return "\n".join(lines).encode()
+
+
+def all_pairs_interference(live_ranges: Dict[str, Set[int]]) -> Dict[str, Set[str]]:
+	# this is how the interference graph used to be built, for comparison.
+	edges: Dict[str, Set[str]] = { var: set() for var in live_ranges }
+	for a in live_ranges:
+		for b in live_ranges:
+			if a != b and len(live_ranges[a].intersection(live_ranges[b])) > 0:
+				edges[a].add(b)
+
+	return edges
+
+
+def bench_interference() -> None:
+	print(f"{'temps':>8}  {'stmts':>8}  {'edges':>8}  {'all pairs (ms)':>15}  {'sweep (ms)':>11}")
+	for temps in [ 250, 500, 1000, 2000 ]:
+		source = SourceFile("<bench>", make_temporaries_program(temps))
+		prog = typecheck.typecheck_program(parser.parse_program(parser.ParserState(source)))
+		func = next(f for f in prog.funcs if f.name == "main")
+
+		cglower.lower_function(func)
+		stmts = iropt.renumber_statements(func)
+		variables, liveness, defs, uses = cgliveness.analyse_masks(func, stmts)
+
+		live_ranges: Dict[str, Set[int]] = dict()
+		for n, mask in enumerate(liveness.statements()[0]):
+			for i in dataflow.bit_indices(mask):
+				live_ranges.setdefault(variables.items[i], set()).add(n)
+
+		graphs: List[cgreg.Graph] = []
+		sweep_time = timed(lambda: graphs.append(cgreg.build_interference_graph(stmts, variables, liveness,
+			defs, uses, live_ranges.keys())))
+
+		pairs_time = timed(lambda: all_pairs_interference(live_ranges))
+
+		edges = sum(map(len, graphs[0].edges.values())) // 2
+		print(f"{len(live_ranges):>8}  {len(stmts):>8}  {edges:>8}  {1000 * pairs_time:>15.2f}  {1000 * sweep_time:>11.2f}")
+
+
+def make_pressure_program(live: int) -> bytes:
+	# `live` variables that are all live at the same time, which is a lot more than we have registers for.
+	lines = [ "class Main {", "    Void main() {" ]
+	lines += [ f"        Int v{i};" for i in range(live) ]
+	lines += [ f"        readln(v{i});" for i in range(live) ]
+
+	for r in range(2):
+		lines += [ f"        v{i} = v{i} + v{(i + 1 + r) % live} * v{(i + 3 + r) % live};" for i in range(live) ]
+
+	lines += [ f"        println(v{i});" for i in range(live) ]
+	lines += [ "    }", "}" ]
+	return "\n".join(lines).encode()
+
+
+def bench_spills() -> None:
+	print(f"{'live':>6}  {'stmts':>8}  {'spills':>8}  {'rounds':>8}  {'alloc (ms)':>11}")
+	for live in [ 20, 40, 80, 160 ]:
+		source = SourceFile("<bench>", make_pressure_program(live))
+		prog = typecheck.typecheck_program(parser.parse_program(parser.ParserState(source)))
+		func = next(f for f in prog.funcs if f.name == "main")
+
+		cglower.lower_function(func)
+
+		stats = cgreg.AllocStats()
+		allocs: List[Any] = []
+		alloc_time = timed(lambda: allocs.append(cgreg.alloc_function(func, stats = stats)))
+
+		spills = len(allocs[0][1])
+		print(f"{live:>6}  {len(iropt.renumber_statements(func)):>8}  {spills:>8}  {stats.rounds:>8}  {1000 * alloc_time:>11.2f}")
+
+
+def bench_linear_scan() -> None:
+	print(f"{'program':>12}  {'stmts':>8}  {'colour (ms)':>12}  {'spills':>8}  {'linear (ms)':>12}  {'spills':>8}")
+	threshold = options.linear_scan_threshold()
+	for name, source_text in [ ("temps 2000", make_temporaries_program(2000)), ("temps 8000", make_temporaries_program(8000)),
+		("live 80", make_pressure_program(80)), ("live 160", make_pressure_program(160)) ]:
+
+		results: List[str] = []
+		for linear in [ False, True ]:
+			# big functions would otherwise switch over to linear scan by themselves
+			options.enable_linear_scan(linear)
+			options.set_linear_scan_threshold(threshold if linear else sys.maxsize)
+
+			source = SourceFile("<bench>", source_text)
+			prog = typecheck.typecheck_program(parser.parse_program(parser.ParserState(source)))
+			func = next(f for f in prog.funcs if f.name == "main")
+			cglower.lower_function(func)
+
+			allocs: List[Any] = []
+			alloc_time = timed(lambda: allocs.append(cgreg.alloc_function(func)))
+			results.append(f"{1000 * alloc_time:>12.2f}  {len(allocs[0][1]):>8}")
+
+		print(f"{name:>12}  {len(iropt.renumber_statements(func)):>8}  {results[0]}  {results[1]}")
+
+	options.enable_linear_scan(False)
+	options.set_linear_scan_threshold(threshold)
+
+
+benchmarks: Dict[str, Tuple[Callable[[], None], str]] = {
+	"strings":  (bench_strings, "lexing and escaping string literals of up to 1MB"),
+	"memory":   (bench_memory, "memory used by the ast of a large program ([methods], default 5000)"),
+	"interference": (bench_interference, "building the interference graph of functions with up to 2000 temporaries"),
+	"spills":   (bench_spills, "register allocation of functions with up to 160 variables live at once"),
+	"linear-scan": (bench_linear_scan, "graph colouring against linear scan, on big functions")
+}
+
+def print_usage() -> None:
+	print(f"usage: ./bench.py <benchmark> [args]")
+	for name, (_, desc) in benchmarks.items():
+		print(f"    {name:<14}{desc}")
+
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+		print_usage()
+		sys.exit(1)
+
+	benchmarks[sys.argv[1]][0]()
@@ -49,6 +49,25 @@ def parse_args(args: List[str]) -> Tuple[str, str]:
 		elif (args[0] == "--dump-ir3-opt"):
 			options.enable_print_optimised_ir(True)
 
+		elif args[0] == "--unroll":
+			if len(args) == 1 or not args[1].isdigit() or int(args[1]) < 1:
+				print(f"error: expected a positive number after '--unroll'")
+				sys.exit(1)
+
+			options.set_unroll_factor(int(args[1]))
+			args = args[1:]
+
+		elif args[0] == "--linear-scan":
+			options.enable_linear_scan()
+
+		elif args[0] == "--linear-scan-threshold":
+			if len(args) == 1 or not args[1].isdigit():
+				print(f"error: expected a number after '--linear-scan-threshold'")
+				sys.exit(1)
+
+			options.set_linear_scan_threshold(int(args[1]))
+			args = args[1:]
+
 		elif (args[0] == "-q") or (args[0] == "--quiet"):
 			dont_print_to_stdout = True
 
@@ -98,6 +117,10 @@ def print_usage():
 	print("""
 options:
     --opt           -O      enable optimisations
+    --unroll <n>            unroll small counted loops <n> times with -O (default 4, 1 to disable)
+    --linear-scan           allocate registers with linear scan instead of graph colouring
+    --linear-scan-threshold <n>
+                            always use linear scan for functions with more than <n> statements (default 5000)
     --annotate      -a      enable annotations on the generated assembly
     --no-annotate   -na     disable annotations
     --verbose       -v      print logging statements (mostly optimisation-related)
@@ -110,9 +133,8 @@ options:
 
 
 def parse_file(filename: str) -> ast.Program:
-	with open(filename, "rb") as file:
-		stream: StringView = StringView(file.read())
-		return parser.parse_program(parser.ParserState(filename, stream))
+	source: SourceFile = map_source_file(filename)
+	return parser.parse_program(parser.ParserState(source))
 
 
 if __name__ == "__main__":
@@ -124,6 +146,7 @@ if __name__ == "__main__":
 
 	prog = parse_file(input_file)
 	ir3p = typecheck.typecheck_program(prog)
+	flush_diagnostics()
 
 	asms = codegen.codegen(ir3p, ' '.join(sys.argv))
 
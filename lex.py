@@ -5,23 +5,15 @@ from src.util import *
 from src import lexer
 
 def lex_file(filename):
-	with open(sys.argv[1], "rb") as file:
-		stream: StringView = StringView(file.read())
-		loc: Location = Location(sys.argv[1], 0, 0)
-		flag: bool = True
+	tokens: lexer.TokenArray = lexer.tokenise(map_source_file(filename))
 
 	token_list: list[Token] = []
-	while flag:
-		tok, rest, loc = lexer.read_token(stream, loc)
-		stream = rest
-
+	for tok in tokens.to_tokens():
 		# for this printing thing, we just discard the content of the comment.
 		if tok.type == "comment":
 			tok.text = "comment"
 
 		token_list.append(tok)
-		if tok.type == "EOF":
-			flag = False
 
 	for tok in token_list:
 		print(tok)
@@ -7,9 +7,8 @@ from src import lexer
 from src import ast
 
 def parse_file(filename) -> ast.Program:
-	with open(sys.argv[1], "rb") as file:
-		stream: StringView = StringView(file.read())
-		return parser.parse_program(parser.ParserState(sys.argv[1], stream))
+	source: SourceFile = map_source_file(sys.argv[1])
+	return parser.parse_program(parser.ParserState(source))
 
 
 if __name__ == "__main__":
@@ -9,7 +9,10 @@ from .util import Location, escape_string
 def indent_lines(x: str) -> str:
 	return "\n".join(map(lambda s: "    " + s, x.split("\n")))
 
+# all the nodes use __slots__, since big programs have a *lot* of them.
 class Expr(ABC):
+	__slots__ = ("loc",)
+
 	def __init__(self, loc: Location) -> None:
 		self.loc: Location = loc
 
@@ -17,6 +20,8 @@ class Expr(ABC):
 	def __str__(self) -> str: ...
 
 class Stmt(ABC):
+	__slots__ = ("loc",)
+
 	def __init__(self, loc: Location) -> None:
 		self.loc: Location = loc
 
@@ -27,6 +32,8 @@ class Stmt(ABC):
 # since expressions are not explicitly statements, we need a way to represent
 # things that *could be* expressions and *also* statements -- namely function calls.
 class ExprStmt(Stmt):
+	__slots__ = ("expr",)
+
 	def __init__(self, expr: Expr) -> None:
 		super().__init__(expr.loc)
 		self.expr: Expr = expr
@@ -35,6 +42,8 @@ class ExprStmt(Stmt):
 		return f"{self.expr};"
 
 class FuncCall(Expr):
+	__slots__ = ("func", "args")
+
 	def __init__(self, loc: Location, func: Expr, args: List[Expr]) -> None:
 		super().__init__(loc)
 		self.func: Expr = func
@@ -44,6 +53,8 @@ class FuncCall(Expr):
 		return f"{self.func}({', '.join(map(str, self.args))})"
 
 class BinaryOp(Expr):
+	__slots__ = ("lhs", "rhs", "op")
+
 	def __init__(self, loc: Location, left: Expr, right: Expr, op: str) -> None:
 		super().__init__(loc)
 		self.lhs: Expr = left
@@ -54,6 +65,8 @@ class BinaryOp(Expr):
 		return f"({self.lhs} {self.op} {self.rhs})"
 
 class UnaryOp(Expr):
+	__slots__ = ("expr", "op")
+
 	def __init__(self, loc: Location, expr: Expr, op: str) -> None:
 		super().__init__(loc)
 		self.expr: Expr = expr
@@ -63,6 +76,8 @@ class UnaryOp(Expr):
 		return f"{self.op}{self.expr}"
 
 class VarRef(Expr):
+	__slots__ = ("name",)
+
 	def __init__(self, loc: Location, name: str) -> None:
 		super().__init__(loc)
 		self.name: str = name
@@ -71,6 +86,8 @@ class VarRef(Expr):
 		return f"{self.name}"
 
 class NewExpr(Expr):
+	__slots__ = ("class_name",)
+
 	def __init__(self, loc: Location, class_name: str) -> None:
 		super().__init__(loc)
 		self.class_name: str = class_name
@@ -79,6 +96,8 @@ class NewExpr(Expr):
 		return f"new {self.class_name}()"
 
 class StringLit(Expr):
+	__slots__ = ("value",)
+
 	def __init__(self, loc: Location, value: str) -> None:
 		super().__init__(loc)
 		self.value: str = value
@@ -88,6 +107,8 @@ class StringLit(Expr):
 		return f"\"{escape_string(self.value)}\""
 
 class BooleanLit(Expr):
+	__slots__ = ("value",)
+
 	def __init__(self, loc: Location, value: bool) -> None:
 		super().__init__(loc)
 		self.value: bool = value
@@ -96,6 +117,8 @@ class BooleanLit(Expr):
 		return f"{'true' if self.value else 'false'}"
 
 class IntegerLit(Expr):
+	__slots__ = ("value",)
+
 	def __init__(self, loc: Location, value: int) -> None:
 		super().__init__(loc)
 		self.value: int = value
@@ -104,6 +127,8 @@ class IntegerLit(Expr):
 		return f"{self.value}"
 
 class NullLit(Expr):
+	__slots__ = ()
+
 	def __init__(self, loc: Location) -> None:
 		super().__init__(loc)
 
@@ -111,6 +136,8 @@ class NullLit(Expr):
 		return "null"
 
 class ThisLit(Expr):
+	__slots__ = ()
+
 	def __init__(self, loc: Location) -> None:
 		super().__init__(loc)
 
@@ -118,6 +145,8 @@ class ThisLit(Expr):
 		return "this"
 
 class ParenExpr(Expr):
+	__slots__ = ("expr",)
+
 	def __init__(self, expr: Expr) -> None:
 		super().__init__(expr.loc)
 		self.expr: Expr = expr
@@ -130,6 +159,8 @@ class ParenExpr(Expr):
 			return f"({self.expr})"
 
 class DotOp(Expr):
+	__slots__ = ("lhs", "rhs")
+
 	def __init__(self, loc: Location, lhs: Expr, rhs: Expr) -> None:
 		super().__init__(loc)
 		self.lhs: Expr = lhs
@@ -139,6 +170,8 @@ class DotOp(Expr):
 		return f"{self.lhs}.{self.rhs}"
 
 class ReadLnCall(Stmt):
+	__slots__ = ("var",)
+
 	def __init__(self, loc: Location, var: str) -> None:
 		super().__init__(loc)
 		self.var: str = var
@@ -147,6 +180,8 @@ class ReadLnCall(Stmt):
 		return f"readln({self.var});"
 
 class PrintLnCall(Stmt):
+	__slots__ = ("expr",)
+
 	def __init__(self, loc: Location, expr: Expr) -> None:
 		super().__init__(loc)
 		self.expr: Expr = expr
@@ -155,6 +190,8 @@ class PrintLnCall(Stmt):
 		return f"println({self.expr});"
 
 class ReturnStmt(Stmt):
+	__slots__ = ("value",)
+
 	def __init__(self, loc: Location, value: Optional[Expr]) -> None:
 		super().__init__(loc)
 		self.value: Optional[Expr] = value
@@ -163,6 +200,8 @@ class ReturnStmt(Stmt):
 		return f"return{'' if self.value is None else (' ' + str(self.value))};"
 
 class AssignStmt(Stmt):
+	__slots__ = ("lhs", "rhs")
+
 	def __init__(self, loc: Location, lhs: Expr, rhs: Expr) -> None:
 		super().__init__(loc)
 		self.lhs: Expr = lhs
@@ -172,6 +211,8 @@ class AssignStmt(Stmt):
 		return f"{self.lhs} = {self.rhs};"
 
 class VarDecl:
+	__slots__ = ("loc", "name", "type")
+
 	def __init__(self, loc: Location, name: str, type: str) -> None:
 		self.loc: Location = loc
 		self.name: str = name
@@ -181,6 +222,8 @@ class VarDecl:
 		return f"{self.type} {self.name};"
 
 class Block:
+	__slots__ = ("stmts",)
+
 	def __init__(self, stmts: List[Stmt]) -> None:
 		self.stmts: List[Stmt] = stmts
 
@@ -188,6 +231,8 @@ class Block:
 		return "{\n" + "\n".join(map(lambda x: "    " + str(x), self.stmts)) + "\n}"
 
 class IfStmt(Stmt):
+	__slots__ = ("condition", "true_case", "else_case")
+
 	def __init__(self, loc: Location, condition: Expr, true_case: Block, else_case: Block) -> None:
 		super().__init__(loc)
 		self.condition: Expr = condition
@@ -198,6 +243,8 @@ class IfStmt(Stmt):
 		return f"if({self.condition})\n{indent_lines(str(self.true_case))}\n    else\n{indent_lines(str(self.else_case))}"
 
 class WhileLoop(Stmt):
+	__slots__ = ("condition", "body")
+
 	def __init__(self, loc: Location, condition: Expr, body: Block) -> None:
 		super().__init__(loc)
 		self.condition: Expr = condition
@@ -207,6 +254,8 @@ class WhileLoop(Stmt):
 		return f"while({self.condition})\n{indent_lines(str(self.body))}"
 
 class MethodDefn:
+	__slots__ = ("loc", "name", "parent", "args", "return_type", "vars", "body")
+
 	def __init__(self, loc: Location, name: str, parent: ClassDefn, args: List[VarDecl], return_type: str,
 				 vars: List[VarDecl], body: Block) -> None:
 		self.loc: Location = loc
@@ -225,6 +274,8 @@ class MethodDefn:
 			+ "\n    }"
 
 class ClassDefn:
+	__slots__ = ("loc", "name", "fields", "methods")
+
 	def __init__(self, loc: Location, name: str, fields: List[VarDecl], methods: List[MethodDefn]) -> None:
 		self.loc: Location = loc
 		self.name: str = name
@@ -238,6 +289,8 @@ class ClassDefn:
 			+ "\n".join(map(lambda x: "    " + str(x), self.methods)) + "\n}"
 
 class Program:
+	__slots__ = ("classes",)
+
 	def __init__(self, classes: List[ClassDefn]) -> None:
 		assert len(classes) > 0
 		self.classes: List[ClassDefn] = classes
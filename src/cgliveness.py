@@ -8,6 +8,7 @@ from . import ir3
 from . import iropt
 from . import cglower
 from . import cgpseudo
+from . import dataflow
 from .util import Location, TCException, CGException, StringView, print_warning, escape_string
 
 
@@ -15,12 +16,16 @@ from .util import Location, TCException, CGException, StringView, print_warning,
 def analyse(func: ir3.FuncDefn, all_stmts: List[ir3.Stmt]) -> Tuple[List[Set[str]], List[Set[str]], \
 	List[Set[str]], List[Set[str]]]:
 
-	successors = iropt.compute_successors(func)
-	predecessors = iropt.compute_predecessors(func)
+	variables, solution, def_masks, use_masks = analyse_masks(func, all_stmts)
+	ins, outs = solution.statements()
 
-	ins: List[Set[str]]  = list(map(lambda _: set(), range(0, len(all_stmts))))
-	outs: List[Set[str]] = list(map(lambda _: set(), range(0, len(all_stmts))))
-	queue: List[int] = list(range(0, len(all_stmts)))
+	return (list(map(variables.to_set, ins)), list(map(variables.to_set, outs)),
+		list(map(variables.to_set, def_masks)), list(map(variables.to_set, use_masks)))
+
+
+# the same thing, but without turning the bitmasks back into sets; returns (variables, solution, defs, uses).
+def analyse_masks(func: ir3.FuncDefn, all_stmts: List[ir3.Stmt]) -> Tuple[dataflow.Universe[str], \
+	dataflow.BlockSolution, List[int], List[int]]:
 
 	defs: List[Set[str]] = list(map(lambda s: iropt.get_statement_defs(s), all_stmts))
 	uses: List[Set[str]] = list(map(lambda s: iropt.get_statement_uses(s), all_stmts))
@@ -29,17 +34,11 @@ def analyse(func: ir3.FuncDefn, all_stmts: List[ir3.Stmt]) -> Tuple[List[Set[str
 	defs[0].update(map(lambda v: v.name, func.vars))
 	defs[0].update(map(lambda v: v.name, func.params))
 
-	while len(queue) > 0:
-		n = queue.pop(0)
-		stmt = all_stmts[n]
-
-		old_in = copy(ins[n])
-
-		tmp: Set[str] = set()       # stupidest language ever designed
-		outs[n] = tmp.union(*map(lambda succ: ins[succ], successors[n]))
-		ins[n]  = uses[n].union(outs[n] - defs[n])
+	variables: dataflow.Universe[str] = dataflow.Universe()
+	def_masks = list(map(variables.mask, defs))
+	use_masks = list(map(variables.mask, uses))
 
-		if old_in != ins[n] and n in predecessors:
-			queue.extend(predecessors[n])
+	solution = dataflow.solve_blocks(iropt.compute_block_graph(func), use_masks, def_masks,
+		forward = False, union = True)
 
-	return (ins, outs, defs, uses)
+	return variables, solution, def_masks, use_masks
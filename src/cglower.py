@@ -5,6 +5,7 @@ from typing import *
 from copy import *
 
 from . import ir3
+from . import ssa
 from . import iropt
 from . import cgpseudo
 from .util import options, Location, TCException, CGException, StringView, print_warning, escape_string
@@ -189,15 +190,55 @@ def lower_stmt(stmt: ir3.Stmt, ctr: List[int]) -> Tuple[List[ir3.Stmt], List[ir3
 
 
 def lower_phi_nodes(func: ir3.FuncDefn) -> None:
-	for b in func.blocks:
-		for i, stmt in enumerate(b.stmts):
-			if isinstance(stmt, cgpseudo.PhiNode):
-				# redirect the sub-assignments to instead set the main variable.
-				for _, assign in stmt.values:
-					assign.lhs = stmt.lhs
+	# this takes the function out of SSA form, turning the phis into copies (where they are needed).
+	ssa.destruct(func)
+
+
+def hoist_loop_constants(func: ir3.FuncDefn) -> None:
+	# constants that need a register (see lower_const_value) would otherwise be loaded again on every
+	# trip around a loop that uses them. instead, load them once before the outermost loop, and share
+	# the ones with the same value. this happens after the phis are gone, so the preheaders are simple.
+	loops = iropt.find_loops(func)
+	outermost: Dict[ir3.BasicBlock, iropt.Loop] = dict()
+
+	# (optional because of the lookup below; blocks outside any loop have nothing to hoist)
+	loop: Optional[iropt.Loop]
+	for loop in reversed(loops):
+		for blk in loop.blocks:
+			outermost.setdefault(blk, loop)
+
+	loaded: Dict[ir3.BasicBlock, Dict[Tuple[type, Any], str]] = dict()
+	renames: Dict[str, ir3.Value] = dict()
+	num_hoisted = 0
+
+	for blk in func.blocks[:]:
+		if (loop := outermost.get(blk)) is None:
+			continue
+
+		for stmt in blk.stmts[:]:
+			if not (isinstance(stmt, cgpseudo.AssignConstInt) or isinstance(stmt, cgpseudo.AssignConstString)):
+				continue
 
-				# and then replace the node itself with a dummy.
-				b.stmts[i] = cgpseudo.DummyStmt(stmt.loc)
+			preheader = iropt.get_preheader(func, loop, loops)
+			consts = loaded.setdefault(preheader, dict())
+			blk.stmts.remove(stmt)
+			num_hoisted += 1
+
+			if (existing := consts.get((type(stmt), stmt.rhs))) is not None:
+				renames[stmt.lhs] = ir3.VarRef(stmt.loc, existing)
+				continue
+
+			consts[(type(stmt), stmt.rhs)] = stmt.lhs
+			position = next(i for i, s in enumerate(preheader.stmts) if isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch))
+			preheader.stmts.insert(position, stmt)
+
+	if len(renames) > 0:
+		func.vars = [ v for v in func.vars if v.name not in renames ]
+		for blk in func.blocks:
+			for stmt in blk.stmts:
+				iropt.visit_values_in_stmt(lambda v: renames.get(v.name) if isinstance(v, ir3.VarRef) else None, stmt)
+
+	iropt.log_opt(func, "loop constant", "hoisted", num_hoisted)
 
 
 def lower_function(func: ir3.FuncDefn) -> None:
@@ -205,6 +246,9 @@ def lower_function(func: ir3.FuncDefn) -> None:
 	const_nums = [0]
 	func.blocks[0].stmts.insert(0, cgpseudo.DummyStmt(func.loc))
 
+	# this rewrites pretty much every statement, so the def-use index is no good anymore.
+	func.def_use = None
+
 	# first, get rid of phi nodes.
 	lower_phi_nodes(func)
 
@@ -217,3 +261,6 @@ def lower_function(func: ir3.FuncDefn) -> None:
 
 			b.stmts.extend(ss)
 			const_nums[0] += 1
+
+	if options.optimisations_enabled():
+		hoist_loop_constants(func)
@@ -231,6 +231,13 @@ def optimise_conditional_branches(fs: FuncState) -> bool:
 			# we are ok to optimise.
 			new_instr = cgarm.branch_cond(window[4].raw_operand, cgarm.Condition(cmov_cond))
 
+			# if the condition is used again later, it still needs to be set; the moves don't
+			# touch the flags, so the branch can just go after them.
+			if id(window[3]) in fs.live_conditions:
+				fs.instructions[i + 3] = new_instr
+				fs.instructions.pop(i + 4)
+				return True
+
 			# now replace the second instruction
 			fs.instructions[i + 1] = new_instr
 
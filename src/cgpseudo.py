@@ -63,14 +63,14 @@ class StoreField(ir3.Stmt):
 	def __str__(self) -> str:
 		return f"storefield: {self.type}, *{self.ptr}.{self.field} = {self.rhs};"
 
-# yes, i'm turning ir3 into SSA.
+# yes, i'm turning ir3 into SSA. (see ssa.py)
 class PhiNode(ir3.Stmt):
-	# values is a list of (var_name, assign_stmt)
-	def __init__(self, loc: Location, var: str, values: List[Tuple[str, ir3.AssignOp]]) -> None:
+	# values is a list of (value, label); the phi takes whichever value goes with the block that
+	# control came from. phis are always at the top of their block.
+	def __init__(self, loc: Location, var: str, values: List[Tuple[ir3.Value, str]]) -> None:
 		super().__init__(loc)
 		self.lhs = var
 		self.values = values
 
 	def __str__(self) -> str:
-		return f"{self.lhs} = phi {list(map(lambda x: x[0], self.values))};"
-
+		return f"{self.lhs} = phi({', '.join(map(lambda x: f'{x[1]}: {x[0]}', self.values))});"
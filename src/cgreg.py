@@ -4,12 +4,16 @@ from __future__ import annotations
 from typing import *
 from copy import *
 
+import bisect
+
 from . import ir3
 from . import iropt
 from . import cglower
 from . import cgpseudo
 from . import cgliveness
-from .util import Location, TCException, CGException, StringView, print_warning, escape_string
+from . import ssa
+from . import dataflow
+from .util import options, log, Location, TCException, CGException, StringView, print_warning, escape_string
 
 
 
@@ -20,63 +24,106 @@ def allocate_registers(func: ir3.FuncDefn) -> Tuple[Dict[str, str], Set[str], Di
 	return alloc_function(func)
 
 
-def alloc_function(func: ir3.FuncDefn, prespilled: Set[str] = set()) -> Tuple[Dict[str, str], Set[str], \
-	Dict[str, Set[int]], Set[str]]:
+class AllocStats:
+	"""
+	what alloc_function had to do to get an assignment; only the benchmarks care about this.
+	"""
+	def __init__(self) -> None:
+		self.rounds: int = 0
 
 
-	stmts = iropt.renumber_statements(func)
-	ins, outs, defs, uses = cgliveness.analyse(func, stmts)
+def alloc_function(func: ir3.FuncDefn,
+	stats: Optional[AllocStats] = None) -> Tuple[Dict[str, str], Set[str], Dict[str, Set[int]], Set[str]]:
 
-	preds = iropt.compute_predecessors(func)
+	# this might end up allocating two versions of the function: the one we were given, and a copy with
+	# some live ranges split (see below). whichever one costs less at the end is the one we keep.
+	attempts: List[Tuple[ir3.FuncDefn, int]] = [ (func, 0) ]
+	results: List[Tuple[int, Tuple[Dict[str, str], Set[str], Dict[str, Set[int]], Set[str]]]] = []
 
-	# print(f"func: {func.name}")
-	# for blk in func.blocks:
-	# 	print(f">> {blk.name}")
-	# 	for s in blk.stmts:
-	# 		print(f"{s.id:02}  {s}     -- {preds[s.id]}")
-	# 		print(f"  in =  {ins[s.id]}")
-	# 		print(f"  out = {outs[s.id]}")
+	# (the list grows while we're going through it)
+	for attempt, _ in attempts:
+		stmts = iropt.renumber_statements(attempt)
+		variables, liveness, defs, uses = cgliveness.analyse_masks(attempt, stmts)
+		ins, outs = liveness.statements()
 
-	# print("\n\n")
+		depths = get_loop_depths(attempt)
+		live = LiveSets(variables, ins, outs, defs, uses,
+			[ 10 ** depths.get(blk, 0) for blk in attempt.blocks for _ in blk.stmts ])
 
-	# live ranges only consider the IN (which makes sense based on their definition i guess)
-	live_ranges: Dict[str, Set[int]] = dict()
+		# colouring does a better job, but for really big functions linear scan is a lot faster (and
+		# doesn't need the interference graph at all).
+		graph: Optional[Graph] = None
+		if not options.linear_scan_enabled() and len(stmts) <= options.linear_scan_threshold():
+			graph = build_interference_graph(stmts, variables, liveness, defs, uses, live.range_sizes.keys())
 
-	for n, vs in enumerate(ins):
-		for v in vs:
-			live_ranges.setdefault(v, set()).add(n)
+		preassigned, first_four_args = get_preferred_registers(attempt)
 
-	graph = Graph()
+		registers = ["v1", "v2", "v3", "v4", "v5", "a1", "a2", "a3", "a4", "fp"]
+		moves = get_moves(attempt, depths) if graph is not None else []
 
-	# setup the nodes first.
-	for var in live_ranges:
-		graph.add(var)
+		# if colouring fails, everything that didn't get a register is spilled at once, and we go again.
+		# spilled variables still need a register, just not for very long, so this doesn't take many rounds.
+		spills: Set[str] = set()
+		rounds = 0
 
-	# now detect the interference. i guess the easiest way to do this is to get every pair of defs
-	pairs = [(a, b) for a in live_ranges for b in live_ranges]
-	for a, b in pairs:
-		if a == b:
-			continue
+		while True:
+			rounds += 1
+			if graph is not None:
+				assigns, failed = colour_graph(graph, registers, live.use_counts, live.range_sizes, preassigned, spills, moves)
+			else:
+				assigns, failed = linear_scan(live, registers, preassigned, spills)
+
+			if len(failed) == 0:
+				break
+
+			for var in failed:
+				if var in spills:
+					raise CGException(f"invalid double spill of '{var}'")
+
+			# before spilling anything, see if splitting live ranges does any better. that doesn't always
+			# work out (the pieces and the rest of the variable can both end up being spilled, and then the
+			# copies between them are just extra work), so it happens on a copy of the function, which gets
+			# its turn after this one. linear scan is for when we don't have time for this.
+			if attempt is func and rounds == 1 and graph is not None:
+				if (split_func := split_live_ranges(func, live, failed, len(registers))) is not None:
+					attempts.append(split_func)
+
+			insert_spill_code(attempt, live, graph, failed, first_four_args)
+			spills.update(failed)
 
-		# we iterate every (a, b) as well as (b, a), so the graph is bidirectional.
-		if len(live_ranges[a].intersection(live_ranges[b])) > 0:
-			graph.interfere(a, b)
+		if stats is not None:
+			stats.rounds += rounds
 
+		log(f"regalloc({attempt.name}): {'coloured' if graph is not None else 'linear scan'} in {rounds} "
+			+ f"{'round' if rounds == 1 else 'rounds'}, "
+			+ f"spilled {len(spills)} {'variable' if len(spills) == 1 else 'variables'}, "
+			+ f"coalesced {sum(1 for a, b in moves if a in assigns and assigns.get(a) == assigns.get(b))} of {len(moves)} copies")
 
-	# `uses` now is (essentially) a map from stmt_num -> used_vars
-	# we want to invert it.
-	var_uses: Dict[str, Set[int]] = dict()
-	for n, us in enumerate(uses):
-		for u in us:
-			var_uses.setdefault(u, set()).add(n)
 
-	# same deal for `defs`
-	var_defs: Dict[str, Set[int]] = dict()
-	for n, ds in enumerate(defs):
-		for d in ds:
-			var_defs.setdefault(d, set()).add(n)
+		# the statements where the register is live. we just compute this from the assignment.
+		reg_live_ranges: Dict[str, Set[int]] = { k: set() for k in registers }
+		for i, runs in dataflow.bit_runs(live.ins).items():
+			if (reg := assigns.get(variables.items[i])) is not None:
+				for start, end in runs:
+					reg_live_ranges.setdefault(reg, set()).update(range(start, end + 1))
 
+		# outs[0] are the variables that need to be defined at entry
+		results.append((get_alloc_cost(attempt, depths, assigns, reg_live_ranges),
+			(assigns, spills, reg_live_ranges, variables.to_set(live.outs[0]))))
 
+	# ties go to the function as it was.
+	best = min(range(len(results)), key = lambda i: results[i][0])
+	if best > 0:
+		pieces, num_split = attempts[best]
+		iropt.log_opt(func, "live range", "split", num_split)
+		func.vars, func.blocks, func.cfg, func.def_use = pieces.vars, pieces.blocks, pieces.cfg, None
+		func.cfg.func = func
+
+	return results[best][1]
+
+
+
+def get_preferred_registers(func: ir3.FuncDefn) -> Tuple[Dict[str, List[str]], Set[str]]:
 	# indicate preferences for the incoming arguments (which are not shadowed by locals) as a1-a4.
 	# the value is a dict from register -> num_prefs (ie. how many times it was preferred)
 	preassigned_tmp: Dict[str, Dict[str, int]] = dict()
@@ -132,89 +179,389 @@ def alloc_function(func: ir3.FuncDefn, prespilled: Set[str] = set()) -> Tuple[Di
 		regs = map(lambda x: x[0], regs)
 		preassigned[var] = list(regs)
 
-	registers = ["v1", "v2", "v3", "v4", "v5", "a1", "a2", "a3", "a4", "fp"]
+	return preassigned, first_four_args
+
+
+
+def get_alloc_cost(func: ir3.FuncDefn, depths: Dict[ir3.BasicBlock, int], assigns: Dict[str, str],
+	reg_live_ranges: Dict[str, Set[int]]) -> int:
+	# roughly how many extra instructions the allocation costs: the spills and restores, the copies that
+	# didn't get coalesced, and saving a1-a4 around calls (see pre_function_call), weighted (like the
+	# spill costs) by how deep in loops they are. splitting live ranges can add blocks too, so count
+	# the jumps between them as well.
+	cost = 0
+	for blk in func.blocks:
+		weight = 10 ** depths.get(blk, 0)
+		cost += weight
+
+		for stmt in blk.stmts:
+			if isinstance(stmt, cgpseudo.SpillVariable) or isinstance(stmt, cgpseudo.RestoreVariable):
+				cost += weight
+
+			elif (move := get_move(stmt)) is not None and (move[0] not in assigns or assigns.get(move[0]) != assigns.get(move[1])):
+				cost += weight
+
+			elif isinstance(stmt, ir3.FnCallStmt) or isinstance(stmt, ir3.PrintLnCall) or isinstance(stmt, ir3.ReadLnCall) \
+				or (isinstance(stmt, ir3.AssignOp) and isinstance(stmt.rhs, ir3.FnCallExpr)):
+				dests = set(assigns.get(var) for var in iropt.get_statement_defs(stmt))
+				if any(stmt.id + 1 in reg_live_ranges[r] for r in ["a1", "a2", "a3", "a4"] if r not in dests):
+					cost += 2 * weight
+
+	return cost
+
+
+
+class LiveSets:
+	"""
+	the liveness of each statement (as bitmasks over `variables`), along with the sizes of the live ranges
+	and the number of uses of each variable, which is what the spill heuristic looks at. uses are weighted
+	by how often the statement (roughly) runs, so that uses in loops count for more. this is only computed
+	from scratch once; see insert_spill_code.
+	"""
+	def __init__(self, variables: dataflow.Universe[str], ins: List[int], outs: List[int], defs: List[int],
+		uses: List[int], weights: List[int]) -> None:
+		self.variables = variables
+		self.ins = ins
+		self.outs = outs
+		self.defs = defs
+		self.uses = uses
+		self.weights = weights
+
+		# live ranges only consider the IN (which makes sense based on their definition i guess)
+		self.range_sizes: Dict[str, int] = dict()
+		self.use_counts: Dict[str, int] = dict()
+
+		for i, runs in dataflow.bit_runs(ins).items():
+			self.range_sizes[variables.items[i]] = sum(end - start + 1 for start, end in runs)
+
+		for n in range(len(uses)):
+			for i in dataflow.bit_indices(uses[n]):
+				var = variables.items[i]
+				self.use_counts[var] = self.use_counts.get(var, 0) + weights[n]
+
+	# adds statement `n` to the live ranges and use counts of the variables in `mask`.
+	def count(self, n: int, mask: int) -> None:
+		for i in dataflow.bit_indices(self.ins[n] & mask):
+			var = self.variables.items[i]
+			self.range_sizes[var] = self.range_sizes.get(var, 0) + 1
+
+		for i in dataflow.bit_indices(self.uses[n] & mask):
+			var = self.variables.items[i]
+			self.use_counts[var] = self.use_counts.get(var, 0) + self.weights[n]
+
+
+
+def split_live_ranges(func: ir3.FuncDefn, live: LiveSets, spilled: Set[str], num_regs: int) -> Optional[Tuple[ir3.FuncDefn, int]]:
+	# a variable that is live all the way through a loop without being used in it still needs its
+	# register for the whole loop, so if there are too many things live in there, it might be something
+	# that the loop actually uses that gets spilled (or the variable gets spilled everywhere, even where
+	# there is a register for it). so, for loops like that, give the variable a new name for the part
+	# of its live range that is in the loop:
+	#
+	#   preheader:  x$1 = x;
+	#   (loop, which doesn't touch x)
+	#   exit:       x = x$1;
+	#
+	# x is not live in the loop now, and x$1 has a big live range but no uses, so that is what should
+	# get spilled, and the stores and loads happen outside the loop. this is only worth it if x is used
+	# somewhere that runs (at least) as often as the loop does; otherwise spilling all of x costs about
+	# the same anyway. this doesn't touch `func`; it returns a copy with the live ranges split (and
+	# how many there were), or None if there's nothing to split.
+	loops = iropt.find_loops(func)
+	if len(loops) == 0:
+		return None
+
+	variables, ins, defs, uses = live.variables, live.ins, live.defs, live.uses
+	failed = variables.mask(spilled)
+
+	# what is used or defined by statements that run at least so many times
+	hot: Dict[int, int] = dict()
+	for n, weight in enumerate(live.weights):
+		hot[weight] = hot.get(weight, 0) | defs[n] | uses[n]
+
+	# work out what to split first (going from the outside in), since adding blocks means that the
+	# statement numbers are no good anymore.
+	splits: List[Tuple[iropt.Loop, List[str]]] = []
+	done: Dict[str, List[iropt.Loop]] = dict()
+
+	for loop in reversed(loops):
+		# the first statement defines everything (see cgliveness), so don't bother.
+		if func.blocks[0] in loop.blocks:
+			continue
+
+		# only bother with loops where something that failed to get a register is live.
+		nums = [ s.id for blk in loop.blocks for s in blk.stmts ]
+		if max(bin(ins[n]).count("1") for n in nums) < num_regs or not any(ins[n] & failed for n in nums):
+			continue
+
+		touched = 0
+		for n in nums:
+			touched |= defs[n] | uses[n]
+
+		touched_elsewhere = 0
+		for weight, mask in hot.items():
+			if weight >= live.weights[loop.header.stmts[0].id]:
+				touched_elsewhere |= mask
 
-	# print(f"\nprespilled = {prespilled}")
-	# print(f"ranges: { {k: v  for k, v in map(lambda k: (k, live_ranges[k]), prespilled) } }")
-	assigns, spills, retry = colour_graph(graph, registers, var_uses, live_ranges, preassigned, prespilled)
-	if retry:
-		# now we must spill the new variable.
-		assert len(spills) == 1
-		var = next(iter(spills))
+		names = [ var for var in sorted(variables.elements(ins[loop.header.stmts[0].id] & ~touched & touched_elsewhere))
+			if not any(loop.header in outer.blocks for outer in done.get(var, [])) ]
+
+		for var in names:
+			done.setdefault(var, []).append(loop)
+
+		if len(names) > 0:
+			splits.append((loop, names))
+
+	if len(splits) == 0:
+		return None
 
-		if var in prespilled:
-			raise CGException(f"invalid double spill of '{var}', graph = {graph.edges}")
+	# what is live into each block; the new ones get theirs from where they jump to.
+	live_ins = { blk: ins[blk.stmts[0].id] for blk in func.blocks }
 
-		# because of the way the blocks are structured and stuff, there isn't really a better way to do this.
-		u_stmts = var_uses[var]
-		d_stmts = var_defs[var]
+	func, loops, splits, live_ins = deepcopy((func, loops, splits, live_ins))
+	for loop, _ in splits:
+		preheader = iropt.get_preheader(func, loop, loops)
+		live_ins.setdefault(preheader, live_ins[loop.header])
 
-		for blk in func.blocks:
-			backup = copy(blk.stmts)
-			blk.stmts = []
-			for s in backup:
-				if (s.id in u_stmts) and (s.id in d_stmts):
-					blk.stmts.append(cgpseudo.RestoreVariable(s.loc, var))
-					blk.stmts.append(s)
-					blk.stmts.append(cgpseudo.SpillVariable(s.loc, var))
+	types = { v.name: v.type for v in func.params + func.vars }
+	num_split = 0
 
-				elif s.id in u_stmts:
-					blk.stmts.append(cgpseudo.RestoreVariable(s.loc, var))
-					blk.stmts.append(s)
+	for loop, names in splits:
+		preheader = iropt.get_preheader(func, loop, loops)
+		position = next(i for i, s in enumerate(preheader.stmts) if isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch))
 
-				elif s.id in d_stmts:
-					blk.stmts.append(s)
+		# the copies back need to only happen when we come out of the loop, so if there are other
+		# ways into the exit, they go on the edge instead.
+		mask = variables.mask(names)
+		exits: List[ir3.BasicBlock] = []
+		for blk in [ b for b in func.blocks if b in loop.blocks ]:
+			for succ in list(func.cfg.successors[blk]):
+				if succ in loop.blocks or live_ins[succ] & mask == 0:
+					continue
 
-					# if the var is one of the first 4 params and it is *not* shadowed,
-					# then we also need to spill it. for 5+ params we spill back to the
-					# callee-frame anyway, so an additional spill here is pointless
-					# for local vars, they start with an indeterminate value, so spilling
-					# is also pointless.
-					if s.id != 0 or var in first_four_args:
-						blk.stmts.append(cgpseudo.SpillVariable(s.loc, var))
+				if any(p not in loop.blocks for p in succ.predecessors):
+					succ = ssa.split_edge(func, blk, succ)
+					live_ins[succ] = live_ins[func.cfg.successors[succ][0]]
 
-				else:
-					blk.stmts.append(s)
+				if not any(e is succ for e in exits):
+					exits.append(succ)
 
-		return alloc_function(func, prespilled.union(spills))
+		for var in names:
+			k = 1
+			while f"{var}${k}" in types:
+				k += 1
 
+			piece = f"{var}${k}"
+			types[piece] = types[var]
+			func.vars.append(ir3.VarDecl(loop.header.loc, piece, types[var]))
 
-	spills.update(prespilled)
+			loc = loop.header.loc
+			preheader.stmts.insert(position, ir3.AssignOp(loc, piece, ir3.ValueExpr(loc, ir3.VarRef(loc, var))))
+			position += 1
 
+			for succ in exits:
+				if variables.bit(var) & live_ins[succ] != 0:
+					succ.stmts.insert(0, ir3.AssignOp(loc, var, ir3.ValueExpr(loc, ir3.VarRef(loc, piece))))
 
-	# the statements where the register is live. we just compute this from the assignment.
-	reg_live_ranges: Dict[str, Set[int]] = { k: set() for k in registers }
-	for var in assigns:
-		reg_live_ranges.setdefault(assigns[var], set()).update(live_ranges[var])
-		# reg_live_ranges[assigns[var]] = set(range(0, len(stmts)))
+			num_split += 1
 
-	# if func.name == "main_dummy":
-		# print(f"var ranges = {live_ranges}")
-		# print(f"reg ranges = {reg_live_ranges}")
+	return func, num_split
 
-		# print(f"preds: {preds}")
-		# for bb in func.blocks:
-			# print(f"{bb.name} preds = {list(map(lambda x: x.name, bb.predecessors))}")
 
 
-	# print(f"assigns = {assigns}")
-	# print(f"spills = {spills}")
+def insert_spill_code(func: ir3.FuncDefn, live: LiveSets, graph: Optional[Graph], spilled: Set[str],
+	first_four_args: Set[str]) -> None:
+	# spilled variables are restored right before every use, and spilled right after every definition,
+	# so they're only ever live between those and the statement itself. nothing else changes liveness,
+	# so everything else that is live there stays live across the new statements, and that's the only
+	# place where the spilled variables interfere with anything now. so instead of going through the
+	# whole function again, we only redo the statements that use or define a spilled variable.
+	variables = live.variables
+	spill_mask = variables.mask(spilled)
+	node_mask = variables.mask(graph.edges) if graph is not None else 0
 
-	# outs[0] are the variables that need to be defined at entry
-	return assigns, spills, reg_live_ranges, outs[0]
+	# if the var is one of the first 4 params and it is *not* shadowed, then we also need to spill it
+	# on entry. for 5+ params we spill back to the callee-frame anyway, so an additional spill here is
+	# pointless; for local vars, they start with an indeterminate value, so spilling is also pointless.
+	entry_spills = variables.mask(first_four_args) & spill_mask
 
+	for var in spilled:
+		if graph is not None:
+			graph.disconnect(var)
 
+		live.range_sizes[var] = 0
+		live.use_counts[var] = 0
 
-def colour_graph(graph_: Graph, registers: List[str], uses: Dict[str, Set[int]], live_ranges: Dict[str, Set[int]],
-	preassigned: Dict[str, List[str]], prespilled_: Set[str]) -> Tuple[Dict[str, str], Set[str], bool]:
+	old = (live.ins, live.outs, live.defs, live.uses, live.weights)
+	live.ins, live.outs, live.defs, live.uses, live.weights = [], [], [], [], []
 
-	graph = deepcopy(graph_)
+	# the new statements run just as often as the one they're for.
+	weight = 1
+	def append(stmt: ir3.Stmt, ins: int, outs: int, defs: int, uses: int) -> None:
+		stmt.id = len(live.ins)
+		live.ins.append(ins)
+		live.outs.append(outs)
+		live.defs.append(defs)
+		live.uses.append(uses)
+		live.weights.append(weight)
+
+	for blk in func.blocks:
+		backup = blk.stmts
+		blk.stmts = []
+
+		for s in backup:
+			n = s.id
+			ins, outs, defs, uses, weight = old[0][n], old[1][n], old[2][n], old[3][n], old[4][n]
+
+			# the first statement "defines" every variable, but it doesn't really (see cgliveness).
+			real_defs = defs if n != 0 else variables.mask(iropt.get_statement_defs(s))
+
+			restores = uses & spill_mask
+			stores = (real_defs if n != 0 else entry_spills) & spill_mask
+			if restores == 0 and stores == 0:
+				blk.stmts.append(s)
+				append(s, ins & ~spill_mask, outs & ~spill_mask, defs, uses)
+				continue
+
+			start = len(live.ins)
+			ins = (ins & ~spill_mask) | restores
+			outs = (outs & ~spill_mask) | stores
+
+			# the restores go right before the statement, and each one makes its variable live.
+			# (the variables are numbered in whatever order the sets gave them to us, so sort them by
+			# name to keep the output the same every time.)
+			live_in = ins & ~restores
+			for i in sorted(dataflow.bit_indices(restores), key = lambda i: variables.items[i]):
+				restore = cgpseudo.RestoreVariable(s.loc, variables.items[i])
+				blk.stmts.append(restore)
+				append(restore, live_in, live_in | (1 << i), 1 << i, 0)
+				live_in |= (1 << i)
+
+			blk.stmts.append(s)
+			append(s, ins, outs, defs, uses)
+
+			live_in = outs
+			for i in sorted(dataflow.bit_indices(stores), key = lambda i: variables.items[i]):
+				spill = cgpseudo.SpillVariable(s.loc, variables.items[i])
+				blk.stmts.append(spill)
+				append(spill, live_in, live_in & ~(1 << i), 0, 1 << i)
+				live_in &= ~(1 << i)
+
+			for k in range(start, len(live.ins)):
+				live.count(k, spill_mask if k == s.id else -1)
+
+			if graph is None:
+				continue
+
+			# now redo the interference (see build_interference_graph), but only the edges that
+			# involve a spilled variable, since the rest haven't changed.
+			move = get_move(s)
+			for k in range(start, len(live.ins)):
+				ds = real_defs if k == s.id else live.defs[k]
+				for i in dataflow.bit_indices(ds & node_mask):
+					others = live.outs[k] & node_mask
+					if (1 << i) & spill_mask == 0:
+						others &= spill_mask
+					if k == s.id and move is not None:
+						others &= ~variables.bit(move[1])
+
+					for j in dataflow.bit_indices(others & ~(1 << i)):
+						graph.interfere(variables.items[i], variables.items[j])
+
+			# whatever is live on entry to the function all interferes with each other.
+			if n == 0:
+				entry = live.outs[s.id] & node_mask
+				for i in dataflow.bit_indices(entry & spill_mask):
+					for j in dataflow.bit_indices(entry & ~(1 << i)):
+						graph.interfere(variables.items[i], variables.items[j])
+
+	iropt.renumber_statements(func)
+
+
+
+def build_interference_graph(stmts: List[ir3.Stmt], variables: dataflow.Universe[str], liveness: dataflow.BlockSolution,
+	defs: List[int], uses: List[int], nodes: Iterable[str]) -> Graph:
+	# two variables interfere if one of them is defined while the other one is live. so instead of
+	# comparing the live ranges of every pair of variables, we walk backwards through each block
+	# (starting from what is live out of it), and make every definition interfere with whatever is
+	# live right after it. that includes definitions that are never used, since they still clobber
+	# whatever register they get.
+	#
+	# the rows of the matrix are bitmasks over `variables`, just like the liveness sets.
+	matrix: List[int] = [ 0 ] * len(variables)
+
+	graph = liveness.graph
+	for b, (start, end) in enumerate(zip(graph.starts, graph.ends)):
+		live = liveness.block_outs[b]
+		for n in range(end - 1, start - 1, -1):
+			# the first statement "defines" every variable (see cgliveness), but those aren't real
+			# definitions; whatever is live on entry to the function is live all at once, so those
+			# just interfere with each other (below).
+			ds = defs[n] if n != 0 else variables.mask(iropt.get_statement_defs(stmts[0]))
+
+			# a copy doesn't clobber its source, so the two can share a register (and then the copy
+			# goes away; see coalesce), even if the source is still live afterwards.
+			others = live
+			if (move := get_move(stmts[n])) is not None:
+				others &= ~variables.bit(move[1])
+
+			for i in dataflow.bit_indices(ds):
+				matrix[i] |= others
+
+			live = uses[n] | (live & ~ds)
+
+		if start == 0:
+			for i in dataflow.bit_indices(live):
+				matrix[i] |= live
+
+	# only one of each pair got the edge above, so fill in the other half.
+	for i, row in enumerate(matrix):
+		for k in dataflow.bit_indices(row):
+			matrix[k] |= (1 << i)
+
+	return Graph.from_matrix(variables.items, matrix, nodes)
+
+
+
+# returns the assignments, and the variables that need to be spilled (if there are any, the assignments are no good).
+def colour_graph(graph: Graph, registers: List[str], use_counts: Dict[str, int], range_sizes: Dict[str, int],
+	preassigned: Dict[str, List[str]], prespilled: Set[str], moves: List[Tuple[str, str]]) -> Tuple[Dict[str, str], Set[str]]:
+
+	# coalescing never stops a node from being simplified, but merged nodes are harder to colour when
+	# they get pushed optimistically (and they are spilled as a whole), so it can make us spill more.
+	# if that happens, then we just colour it without coalescing; we'll get to coalesce them in the
+	# last round anyway.
+	assigns, spills = colour_coalesced(graph, registers, use_counts, range_sizes, preassigned, prespilled, moves)
+	if len(spills) > 0 and len(moves) > 0:
+		return colour_coalesced(graph, registers, use_counts, range_sizes, preassigned, prespilled, [])
+
+	return assigns, spills
+
+
+def colour_coalesced(graph_: Graph, registers: List[str], use_counts_: Dict[str, int], range_sizes_: Dict[str, int],
+	preassigned_: Dict[str, List[str]], prespilled_: Set[str], moves: List[Tuple[str, str]]) -> Tuple[Dict[str, str], Set[str]]:
+
+	graph = graph_.copy()
 	prespilled = copy(prespilled_)
 
+	# the coalesced variables are one node now, so that node gets the uses, the live range, and
+	# the preferences of all of them.
+	aliases = coalesce(graph, len(registers), moves, prespilled)
+
+	use_counts = copy(use_counts_)
+	range_sizes = copy(range_sizes_)
+	preassigned = copy(preassigned_)
+	for var, alias in aliases.items():
+		use_counts[alias] = use_counts.get(alias, 0) + use_counts.get(var, 0)
+		range_sizes[alias] = range_sizes.get(alias, 0) + range_sizes.get(var, 0)
+
+		prefs = preassigned.get(alias, [])
+		preassigned[alias] = prefs + [ reg for reg in preassigned.get(var, []) if reg not in prefs ]
+
 	stack: List[str] = []
 	preassigned_vars = set(preassigned.keys())
 
-	while len(graph.get_remaining_nodes()) > 0:
+	while graph.has_remaining_nodes():
 		# we can't select preassigned vars to simplify.
 		sel = graph.get_simplifiable_node(len(registers), exclude = preassigned_vars)
 
@@ -244,7 +591,7 @@ def colour_graph(graph_: Graph, registers: List[str], uses: Dict[str, Set[int]],
 			"""
 
 			def get_spill_cost(var: str) -> float:
-				return len(uses[var]) / (len(live_ranges[var]) + graph.get_degree(var))
+				return use_counts[var] / (range_sizes[var] + graph.get_degree(var))
 
 			remaining_unspilled = graph.get_remaining_nodes() - prespilled
 			foo: Iterable = map(lambda x: (x, get_spill_cost(x)), remaining_unspilled)
@@ -270,9 +617,10 @@ def colour_graph(graph_: Graph, registers: List[str], uses: Dict[str, Set[int]],
 
 
 	assignments: Dict[str, str] = dict()
+	spills: Set[str] = set()
 
 	# process the prespilled ones first.
-	for ps in prespilled:
+	for ps in sorted(prespilled):
 		graph.remove(ps)
 		stack.append(ps)
 
@@ -281,7 +629,7 @@ def colour_graph(graph_: Graph, registers: List[str], uses: Dict[str, Set[int]],
 		graph.unremove(var)
 		neighbours = graph.get_neighbours(var)
 
-		used_regs = set(map(lambda x: assignments[x], neighbours))
+		used_regs = set(assignments[x] for x in neighbours if x in assignments)
 		free_regs = list(filter(lambda x: x not in used_regs, registers))
 
 		if len(free_regs) > 0:
@@ -299,63 +647,331 @@ def colour_graph(graph_: Graph, registers: List[str], uses: Dict[str, Set[int]],
 				assignments[var] = free_regs[0]
 
 		else:
-			# oops, we *really* need to spill.
-			return dict(), set([ var ]), True
+			# oops, we *really* need to spill. keep going though, so that we find everything
+			# else that needs to be spilled this time round as well.
+			spills.add(var)
+
+	# if a coalesced node didn't get a register, then none of its variables did.
+	for var, alias in aliases.items():
+		if alias in spills:
+			spills.add(var)
+		else:
+			assignments[var] = assignments[alias]
+
+	if len(spills) > 0:
+		return dict(), spills
+
+	return assignments, spills
+
+
+
+def get_move(stmt: ir3.Stmt) -> Optional[Tuple[str, str]]:
+	# returns the (destination, source) of a copy from one variable to another.
+	if isinstance(stmt, ir3.AssignOp) and isinstance(stmt.rhs, ir3.ValueExpr) and isinstance(stmt.rhs.value, ir3.VarRef):
+		return (stmt.lhs, stmt.rhs.value.name)
+
+	return None
+
+
+def get_loop_depths(func: ir3.FuncDefn) -> Dict[ir3.BasicBlock, int]:
+	# how many loops each block is in (blocks that aren't in any loop are left out).
+	depths: Dict[ir3.BasicBlock, int] = dict()
+	for loop in iropt.find_loops(func):
+		for blk in loop.blocks:
+			depths[blk] = depths.get(blk, 0) + 1
+
+	return depths
+
+
+def get_moves(func: ir3.FuncDefn, depths: Dict[ir3.BasicBlock, int]) -> List[Tuple[str, str]]:
+	# the copies in the function, with the ones in the most deeply nested loops first, since those
+	# are the ones that we really want to get rid of.
+	moves: List[Tuple[int, str, str]] = []
+	for blk in func.blocks:
+		for stmt in blk.stmts:
+			if (move := get_move(stmt)) is not None:
+				moves.append((depths.get(blk, 0), *move))
+
+	moves.sort(key = lambda x: -x[0])
+	return [ (dest, src) for _, dest, src in moves ]
+
+
+def coalesce(graph: Graph, num_regs: int, moves: List[Tuple[str, str]], prespilled: Set[str]) -> Dict[str, str]:
+	# merges the two sides of each copy into one node (so they get the same register, and the copy
+	# becomes a no-op), as long as they don't interfere. this is conservative, so it never makes the
+	# graph harder to colour: either the merged node has fewer than `num_regs` neighbours of significant
+	# degree (briggs), or every neighbour of one side is already a neighbour of the other side or has
+	# an insignificant degree (george). either way, it can still be simplified.
+	#
+	# returns the node that each merged variable ended up in.
+	aliases: Dict[str, str] = dict()
+
+	def find(var: str) -> str:
+		while var in aliases:
+			var = aliases[var]
+		return var
+
+	def briggs(a: str, b: str) -> bool:
+		significant = 0
+		for t in set(graph.edges[a] + graph.edges[b]):
+			# neighbours of both lose an edge when they get merged.
+			degree = graph.get_degree(t) - (1 if graph.interferes(t, a) and graph.interferes(t, b) else 0)
+			if degree >= num_regs:
+				significant += 1
+
+		return significant < num_regs
+
+	def george(a: str, b: str) -> bool:
+		return all(graph.interferes(t, a) or graph.get_degree(t) < num_regs for t in graph.edges[b])
+
+	for dest, src in moves:
+		a, b = find(dest), find(src)
+		if a == b or not graph.contains(a) or not graph.contains(b) or graph.interferes(a, b):
+			continue
+
+		# spilled variables are only live for a statement or two anyway.
+		if a in prespilled or b in prespilled:
+			continue
+
+		# george only has to look at the neighbours of one side, so make that the smaller one (which
+		# is also the one that gets merged away, since that's cheaper).
+		if len(graph.edges[a]) < len(graph.edges[b]):
+			a, b = b, a
+
+		if george(a, b) or briggs(a, b):
+			graph.merge(a, b)
+			aliases[b] = a
+
+	return { var: find(var) for var in aliases }
+
+
 
+def get_live_segments(live: LiveSets) -> Dict[str, List[Tuple[int, int]]]:
+	# the runs of (consecutive) statements where each variable is live, either because it is live
+	# on the way in, or because it is defined there. two variables can share a register as long as
+	# none of their segments overlap, which is a little conservative (a variable that dies at a
+	# statement can't give its register to one that is defined there), but it's close enough.
+	variables = live.variables
 
-	return assignments, prespilled, False
+	# only variables that are live somewhere need a register.
+	nodes = 0
+	for mask in live.ins:
+		nodes |= mask
 
+	masks = [ ins | (defs & nodes) for ins, defs in zip(live.ins, live.defs) ]
+	return { variables.items[i]: segs for i, segs in dataflow.bit_runs(masks, first = 1).items() }
+
+
+def linear_scan(live: LiveSets, registers: List[str], preassigned: Dict[str, List[str]],
+	prespilled: Set[str]) -> Tuple[Dict[str, str], Set[str]]:
+	# this goes through the variables in the order that they become live, and gives each one the first
+	# register that isn't being used by anything it overlaps with (see get_live_segments). if there
+	# isn't one, then whichever of them stays live the longest gets spilled, which is the usual linear
+	# scan heuristic. the prespilled variables only live for a statement or two, so they never get
+	# spilled again; something else makes way for them instead.
+	#
+	# variables aren't just one interval, since spilling them leaves a lot of holes, so each register
+	# keeps the (sorted) segments that it is being used for, and who they belong to.
+	segments = get_live_segments(live)
+
+	occupied: Dict[str, List[Tuple[int, int, str]]] = { reg: [] for reg in registers }
+	assignments: Dict[str, str] = dict()
+	spills: Set[str] = set()
+
+	def get_conflicts(var: str, reg: str) -> Set[str]:
+		used = occupied[reg]
+		conflicts: Set[str] = set()
+		for start, end in segments[var]:
+			# the segments in a register don't overlap, so they end in the same order that they start;
+			# the ones that overlap this one are the ones right before where it ends.
+			k = bisect.bisect_right(used, (end, len(live.ins), "")) - 1
+			while k >= 0 and used[k][1] >= start:
+				conflicts.add(used[k][2])
+				k -= 1
+
+		return conflicts
+
+	def evict(var: str) -> None:
+		reg = assignments.pop(var)
+		occupied[reg] = [ seg for seg in occupied[reg] if seg[2] != var ]
+		spills.add(var)
+
+	def assign(var: str, reg: str) -> None:
+		assignments[var] = reg
+		for start, end in segments[var]:
+			bisect.insort(occupied[reg], (start, end, var))
+
+	for var in sorted(segments, key = lambda v: (segments[v][0][0], v)):
+		conflicts = { reg: get_conflicts(var, reg) for reg in registers }
+		free_regs = [ reg for reg in registers if len(conflicts[reg]) == 0 ]
+
+		if len(free_regs) > 0:
+			# preassignment is just a preference; no guarantees.
+			prefs = [ reg for reg in preassigned.get(var, []) if reg in free_regs ]
+			assign(var, (prefs + free_regs)[0])
+			continue
+
+		# otherwise, find the register whose variables stay live the longest, and spill them if they
+		# outlast this one (or if this one can't be spilled).
+		def get_last_use(reg: str) -> int:
+			if any(v in prespilled for v in conflicts[reg]):
+				return -1
+
+			return min(segments[v][-1][1] for v in conflicts[reg])
+
+		victim = max(registers, key = get_last_use)
+		last_use = get_last_use(victim)
+
+		if var not in prespilled and last_use <= segments[var][-1][1]:
+			spills.add(var)
+
+		elif last_use >= 0:
+			for v in sorted(conflicts[victim]):
+				evict(v)
+
+			assign(var, victim)
+
+		else:
+			raise CGException(f"failed to codegen: could not find a register for '{var}'")
+
+	if len(spills) > 0:
+		return dict(), spills
+
+	return assignments, spills
 
 
 
 class Graph:
+	"""
+	an interference graph. the edges are kept twice: as a bit-matrix (a row for each node, with a bit
+	set for each of its neighbours), so that checking for an edge is cheap, and as adjacency lists, so
+	that going through the neighbours of a node doesn't mean going through every other node. the
+	degrees only count the neighbours that haven't been removed, and are kept up to date.
+	"""
 	def __init__(self) -> None:
-		self.edges: Dict[str, Set[str]] = dict()
+		self.indices: dataflow.Universe[str] = dataflow.Universe()
+		self.matrix: List[int] = []
+		self.edges: Dict[str, List[str]] = dict()
+		self.degrees: Dict[str, int] = dict()
 		self.removed: Set[str] = set()
 
+		# the nodes in name order, so that the simplify order is always the same.
+		self.order: List[str] = []
+
+	# `matrix` has a row for each of `variables` (in order), and must be symmetric. only `nodes` are
+	# added to the graph; any edges to other variables are left out.
+	@staticmethod
+	def from_matrix(variables: List[str], matrix: List[int], nodes: Iterable[str]) -> Graph:
+		graph = Graph()
+		graph.indices = dataflow.Universe(variables)
+		graph.matrix = [ 0 ] * len(variables)
+
+		nodes = list(nodes)
+		mask = graph.indices.mask(nodes)
+		for var in nodes:
+			i = graph.indices.indices[var]
+			graph.matrix[i] = matrix[i] & mask & ~(1 << i)
+			graph.edges[var] = graph.indices.elements(graph.matrix[i])
+			graph.degrees[var] = len(graph.edges[var])
+
+		return graph
+
+	def copy(self) -> Graph:
+		ret = Graph()
+		ret.indices = self.indices
+		ret.matrix = copy(self.matrix)
+		ret.edges = { var: copy(neighbours) for var, neighbours in self.edges.items() }
+		ret.degrees = copy(self.degrees)
+		ret.removed = copy(self.removed)
+		ret.order = self.order
+		return ret
+
 	def add(self, var: str) -> None:
-		self.edges[var] = set()
+		if var in self.edges:
+			return
+
+		if self.indices.add(var) == len(self.matrix):
+			self.matrix.append(0)
+
+		self.edges[var] = []
+		self.degrees[var] = 0
+
+	def interferes(self, a: str, b: str) -> bool:
+		return (self.matrix[self.indices.indices[a]] >> self.indices.indices[b]) & 1 == 1
 
 	def interfere(self, a: str, b: str) -> None:
-		self.edges[a].add(b)
-		self.edges[b].add(a)
+		if a == b or self.interferes(a, b):
+			return
+
+		self.matrix[self.indices.indices[a]] |= (1 << self.indices.indices[b])
+		self.matrix[self.indices.indices[b]] |= (1 << self.indices.indices[a])
+		self.edges[a].append(b)
+		self.edges[b].append(a)
+
+		if b not in self.removed:
+			self.degrees[a] += 1
+		if a not in self.removed:
+			self.degrees[b] += 1
+
+	# removes all of the edges of `var` (but leaves it in the graph).
+	def disconnect(self, var: str) -> None:
+		i = self.indices.indices[var]
+		for neighbour in self.edges[var]:
+			self.matrix[self.indices.indices[neighbour]] &= ~(1 << i)
+			self.edges[neighbour].remove(var)
+			if var not in self.removed:
+				self.degrees[neighbour] -= 1
+
+		self.matrix[i] = 0
+		self.edges[var] = []
+		self.degrees[var] = 0
+
+	# merges `b` into `a`, so that `a` gets all of its edges, and `b` is no longer in the graph.
+	def merge(self, a: str, b: str) -> None:
+		for neighbour in self.edges[b]:
+			self.interfere(a, neighbour)
+
+		self.disconnect(b)
+		del self.edges[b]
+		del self.degrees[b]
 
 	def contains(self, var: str) -> bool:
 		return (var in self.edges) and (var not in self.removed)
 
 	def remove(self, var: str) -> None:
+		if var in self.removed:
+			return
+
 		self.removed.add(var)
+		for neighbour in self.edges[var]:
+			self.degrees[neighbour] -= 1
 
 	def unremove(self, var: str) -> None:
 		self.removed.remove(var)
-
-	def get_degree(self, var: str) -> int:
-		n = 0
 		for neighbour in self.edges[var]:
-			if neighbour not in self.removed:
-				n += 1
+			self.degrees[neighbour] += 1
 
-		return n
+	def get_degree(self, var: str) -> int:
+		return self.degrees[var]
 
 	def get_neighbours(self, var: str) -> Set[str]:
 		if var in self.removed:
 			return set()
 
-		ret: Set[str] = set()
-		for neigh in self.edges[var]:
-			if neigh not in self.removed:
-				ret.add(neigh)
-
-		return ret
-
-
+		return set(filter(lambda x: x not in self.removed, self.edges[var]))
 
 	def get_remaining_nodes(self) -> Set[str]:
 		return set(filter(lambda x: x not in self.removed, self.edges))
 
+	def has_remaining_nodes(self) -> bool:
+		return len(self.removed) < len(self.edges)
+
 	def get_simplifiable_node(self, max_degree: int, exclude: Set[str] = set()) -> Optional[str]:
-		for var in sorted(self.edges):
-			if (var not in self.removed) and (var not in exclude) and (self.get_degree(var) < max_degree):
+		if len(self.order) != len(self.edges):
+			self.order = sorted(self.edges)
+
+		for var in self.order:
+			if (var not in self.removed) and (var not in exclude) and (self.degrees[var] < max_degree):
 				return var
 
 		return None
@@ -178,6 +178,9 @@ class FuncState:
 		# and the local spill area has a negative offset. bools take up 4 bytes on the stack, because there's
 		# not much benefit to optimising that part, and it takes a lot of effort.
 
+		# the incoming arguments that need to be moved out of a1-a4, as (dst, src, annotation)
+		entry_moves: List[Tuple[cgarm.Register, cgarm.Operand, str]] = []
+
 		for i, param in enumerate(method.params):
 			if param.name in set(map(lambda x: x.name, method.vars)):
 				continue
@@ -193,8 +196,10 @@ class FuncState:
 					frame_size += POINTER_SIZE
 
 				if param.name in assignments:
-					if assignments[param.name] != arg_reg:
-						self.emit(cgarm.mov(assigns[param.name], arg_reg))
+					# only the ones that need to be alive on entry; a dead one might share its register
+					# with another argument.
+					if assignments[param.name] != arg_reg.name and param.name in defined_on_entry:
+						entry_moves.append((assigns[param.name], arg_reg, ""))
 
 					ploc.set_register(assigns[param.name])
 
@@ -210,6 +215,9 @@ class FuncState:
 
 			self.locations[param.name] = ploc
 
+		# these all happen at once (eg. the arguments in a2 and a3 might want to swap places)
+		self.emit_parallel_moves(entry_moves)
+
 
 		# note the negative frame_size here (since the stack grows down, and bp is nearer the top of the stack).
 		# TODO: this makes bools 4 bytes
@@ -240,6 +248,9 @@ class FuncState:
 
 		self.reg_live_ranges = reg_ranges
 
+		# the (ids of the) comparisons of conditional branches whose condition is used again later
+		self.live_conditions: Set[int] = set()
+
 		self.assigns: Dict[str, cgarm.Register] = assigns
 		self.spilled: Set[str] = spills
 
@@ -286,6 +297,11 @@ class FuncState:
 	def calculate_stack_offset(self, ofs: int) -> int:
 		# starting from the current sp, we must *ADD* our frame size,
 		# and *ADD* the extra_offset, and *ADD* the actual offset.
+		# the callee-saved registers are pushed below the local frame (see get_prologue), so we have to
+		# skip over those too to get to a spill slot. (the stack arguments already account for them)
+		if ofs < 0:
+			ofs += 4 * len(self.used_regs.intersection(self.callee_saved))
+
 		return ofs + self.frame_size + self.stack_extra_offset
 
 
@@ -362,6 +378,27 @@ class FuncState:
 		self.instructions.append(instr)
 		return instr
 
+	# moves a bunch of values into registers "all at once"; the sources can also be destinations, eg.
+	# when a4 -> a3, a3 -> a2, a2 -> a1 (or the reverse), so the order matters. a move can only go once
+	# nobody else still needs the old value of its destination. each move is (dst, src, annotation).
+	def emit_parallel_moves(self, moves: List[Tuple[cgarm.Register, cgarm.Operand, str]]) -> None:
+		def reads(src: cgarm.Operand, reg: cgarm.Register) -> bool:
+			return src.is_register() and cast(cgarm.Register, src).name == reg.name
+
+		while len(moves) > 0:
+			for idx, (dst, src, annot) in enumerate(moves):
+				if not any(reads(s, dst) for i, (_, s, _) in enumerate(moves) if i != idx):
+					self.emit(cgarm.mov(dst, src), annot = annot)
+					moves = moves[:idx] + moves[idx + 1:]
+					break
+
+			else:
+				# everything that's left is waiting for something else to be moved first, so there's a
+				# cycle (eg. a1 and a2 need to be swapped). break it by moving one of them out of the way.
+				dst = moves[0][0]
+				self.emit(cgarm.mov(cgarm.IP, dst))
+				moves = [ (d, cgarm.IP if reads(s, dst) else s, a) for d, s, a in moves ]
+
 	# annotate the *NEXT* instruction that gets emitted.
 	def annotate_next(self, msg: str) -> None:
 		self.next_annotation = msg
@@ -56,8 +56,7 @@ def codegen_binop(cs: CodegenState, fs: FuncState, expr: ir3.BinaryOp, dest_reg:
 	if expr.op == "s+" or expr.op == "/":
 		spills, stack_adjust = pre_function_call(cs, fs, stmt_id, dest_reg)
 
-		fs.emit(cgarm.mov(cgarm.A1, lhs))
-		fs.emit(cgarm.mov(cgarm.A2, rhs))
+		fs.emit_parallel_moves([ (cgarm.A1, lhs, ""), (cgarm.A2, rhs, "") ])
 		if expr.op == "s+":
 			fs.emit(cgarm.call(cs.require_string_concat_function()))
 		elif expr.op == "/":
@@ -87,8 +86,7 @@ def codegen_binop(cs: CodegenState, fs: FuncState, expr: ir3.BinaryOp, dest_reg:
 		if lty == "String" and rty == "String":
 			spills, stack_adjust = pre_function_call(cs, fs, stmt_id, dest_reg)
 
-			fs.emit(cgarm.mov(cgarm.A1, lhs))
-			fs.emit(cgarm.mov(cgarm.A2, rhs))
+			fs.emit_parallel_moves([ (cgarm.A1, lhs, ""), (cgarm.A2, rhs, "") ])
 			fs.emit(cgarm.call(cs.require_string_compare_function()))
 
 			# move the return value from A1 to the correct destination
@@ -197,6 +195,12 @@ def codegen_assign(cs: CodegenState, fs: FuncState, assign: ir3.AssignOp):
 	if not (loc := fs.get_location(assign.lhs)).have_register():
 		return
 
+	# copies between variables that were coalesced (see cgreg.coalesce) don't need to do anything.
+	if isinstance(assign.rhs, ir3.ValueExpr) and isinstance(assign.rhs.value, ir3.VarRef):
+		src = fs.get_location(assign.rhs.value.name)
+		if src.have_register() and src.register() == loc.register():
+			return
+
 	fs.annotate_next(str(assign))
 	codegen_expr(cs, fs, assign.rhs, loc.register(), assign.id)
 
@@ -230,9 +234,15 @@ def codegen_cond_branch(cs: CodegenState, fs: FuncState, cbr: ir3.CondBranch):
 			pass
 	else:
 		value = get_value(cs, fs, cbr.cond)
-		fs.emit(cgarm.cmp(value, cgarm.Constant(0)))
+		compare = fs.emit(cgarm.cmp(value, cgarm.Constant(0)))
 		fs.emit(cgarm.branch_cond(target, cgarm.Cond.NE), annot=str(cbr))
 
+		# if the condition is still needed afterwards, the peephole optimiser must leave its value
+		# alone when it turns this into a branch on the original comparison.
+		if isinstance(value, cgarm.Register) and any(map(lambda x: fs.is_register_live(value.name, x),
+			fs.stmt_successors[cbr.id])):
+			fs.live_conditions.add(id(compare))
+
 
 
 
@@ -241,23 +251,27 @@ def codegen_readln(cs: CodegenState, fs: FuncState, stmt: ir3.ReadLnCall):
 	dest = fs.get_location(stmt.name)
 	ty = fs.get_type(stmt.name)
 
-	saves, stack_adjust = pre_function_call(cs, fs, stmt.id, dest.register())
+	# same deal as assignments; if there's no register then the value is never used, but
+	# we still need to read it.
+	dest_reg = dest.register() if dest.have_register() else None
+
+	saves, stack_adjust = pre_function_call(cs, fs, stmt.id, dest_reg)
 
 	if ty == "String":
 		fs.emit(cgarm.call(cs.require_readln_string_function()), annot=str(stmt))
-		fs.emit(cgarm.mov(dest.register(), cgarm.A1))
 
 	elif ty == "Bool":
 		fs.emit(cgarm.call(cs.require_readln_bool_function()), annot=str(stmt))
-		fs.emit(cgarm.mov(dest.register(), cgarm.A1))
 
 	elif ty == "Int":
 		fs.emit(cgarm.call(cs.require_readln_int_function()), annot=str(stmt))
-		fs.emit(cgarm.mov(dest.register(), cgarm.A1))
 
 	else:
 		raise CGException(f"argument to readln has invalid type '{ty}'")
 
+	if dest_reg is not None:
+		fs.emit(cgarm.mov(dest_reg, cgarm.A1))
+
 	post_function_call(cs, fs, saves, stack_adjust)
 
 
@@ -371,9 +385,9 @@ def codegen_storestackarg(cs: CodegenState, fs: FuncState, stmt: ir3.StoreFuncti
 
 
 
-def codegen_call(cs: CodegenState, fs: FuncState, call: ir3.FnCall, dest_reg: cgarm.Register, stmt_id: int):
-	# if the number of arguments is > 4, then we set up the stack first; this
-	# is so we can just use a1 as a scratch register
+def codegen_call(cs: CodegenState, fs: FuncState, call: ir3.FnCall, dest_reg: Optional[cgarm.Register], stmt_id: int):
+	# if the number of arguments is > 4, then we set up the stack first. constants go through ip,
+	# since a1-a4 might still have arguments in them.
 
 	# sorry to disappoint, but we need backpatching now. first, generate the instruction
 	# to save whichever of a1-a4 we need to save
@@ -402,50 +416,23 @@ def codegen_call(cs: CodegenState, fs: FuncState, call: ir3.FnCall, dest_reg: cg
 			if isinstance(arg, ir3.VarRef) and arg.name in call.ignored_var_uses:
 				continue
 
-			# just always use a1 as a hint, since it's bound to get spilled anyway
 			# note the stack offset is always -4, since we do the post increment
 			val = get_value(cs, fs, arg)
 			ofs = i * 4
 
 			if val.is_constant():
-				fs.emit(cgarm.mov(cgarm.A1, val))
-				fs.emit(cgarm.store(cgarm.A1, cgarm.Memory(cgarm.SP, ofs)), annot=f"arg {4 + i}")
+				fs.emit(cgarm.mov(cgarm.IP, val))
+				fs.emit(cgarm.store(cgarm.IP, cgarm.Memory(cgarm.SP, ofs)), annot=f"arg {4 + i}")
 
 			else:
 				assert val.is_register()
 				fs.emit(cgarm.store(val, cgarm.Memory(cgarm.SP, ofs)), annot=f"arg {4 + i}")
 
 
-	# this is a little scuffed, but there can be instances where, eg. we need to
-	# move a4 -> a3, a3 -> a2, a2 -> a1 (or the reverse). in such situations, the
-	# order matters...
-	ordering: List[Tuple[int, str, str, cgarm.Operand]] = []
-
-	for i, arg in enumerate(call.args[:4]):
-		val = get_value(cs, fs, arg)
-		if val.is_register():
-			ordering.append((i, f"a{i + 1}", cast(cgarm.Register, val).name, val))
-		else:
-			ordering.append((i, f"a{i + 1}", "", val))
-
-
-	while len(ordering) > 0:
-
-		# for each thingy:
-		flag = False
-		# print(f"ordering = {ordering}")
-
-		for idx, (i, dst, src, val) in enumerate(ordering):
-			# see if anybody else sets our src
-			if src == dst or len(list(filter(lambda s: s == dst, map(lambda f: f[2], ordering)))) == 0:
-				# nobody does; we can generate now
-				fs.emit(cgarm.mov(cgarm.Register(f"a{i + 1}"), val), annot=f"arg {4 + i}")
-				ordering.pop(idx)
-				flag = True
-				break
-
-		if not flag:
-			raise CGException("failed to find a proper ordering to set arguments!")
+	# these all happen at once (see emit_parallel_moves), since eg. a4 might need to go into a3 while a3
+	# is going into a2.
+	fs.emit_parallel_moves([ (cgarm.Register(f"a{i + 1}"), get_value(cs, fs, arg), f"arg {4 + i}")
+		for i, arg in enumerate(call.args[:4]) ])
 
 	fs.emit(cgarm.call(call.name), annot=str(call))
 
@@ -454,8 +441,9 @@ def codegen_call(cs: CodegenState, fs: FuncState, call: ir3.FnCall, dest_reg: cg
 	if len(call.args) > 4:
 		fs.stack_pop_32n(len(call.args) - 4)
 
-	# move the return value into place.
-	fs.emit(cgarm.mov(dest_reg, cgarm.A1))
+	# move the return value into place (if anyone wants it).
+	if dest_reg is not None:
+		fs.emit(cgarm.mov(dest_reg, cgarm.A1))
 
 	post_function_call(cs, fs, saves, stack_adjust)
 
@@ -500,7 +488,8 @@ def codegen_stmt(cs: CodegenState, fs: FuncState, stmt: ir3.Stmt):
 		codegen_cond_branch(cs, fs, stmt)
 
 	elif isinstance(stmt, ir3.FnCallStmt):
-		codegen_call(cs, fs, stmt.call, cgarm.A1, stmt.id)
+		# the result is thrown away, so a1 still needs to be saved if it's live.
+		codegen_call(cs, fs, stmt.call, None, stmt.id)
 
 	elif isinstance(stmt, cgpseudo.AssignConstInt) or isinstance(stmt, cgpseudo.AssignConstString):
 		foo: Union[cgpseudo.AssignConstInt, cgpseudo.AssignConstString] = stmt
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from typing import *
+from collections import deque
+
+# a small framework for bit-vector dataflow problems. whatever is being tracked (expressions, variables,
+# (variable, constant) pairs, ...) is given a dense index by a Universe, and a set of them is just a
+# python int used as a bitmask -- so union/intersection/difference are single big-int operations,
+# and "copying" a set is free.
+
+T = TypeVar("T")
+
+class Universe(Generic[T]):
+	def __init__(self, items: Iterable[T] = []) -> None:
+		self.items: List[T] = []
+		self.indices: Dict[T, int] = dict()
+		for item in items:
+			self.add(item)
+
+	def __len__(self) -> int:
+		return len(self.items)
+
+	def add(self, item: T) -> int:
+		if (idx := self.indices.get(item)) is None:
+			idx = len(self.items)
+			self.indices[item] = idx
+			self.items.append(item)
+
+		return idx
+
+	def bit(self, item: T) -> int:
+		return 1 << self.add(item)
+
+	def mask(self, items: Iterable[T]) -> int:
+		ret = 0
+		for item in items:
+			ret |= 1 << self.add(item)
+
+		return ret
+
+	def elements(self, mask: int) -> List[T]:
+		return [ self.items[i] for i in bit_indices(mask) ]
+
+	def to_set(self, mask: int) -> Set[T]:
+		return set(self.elements(mask))
+
+
+def bit_indices(mask: int) -> List[int]:
+	"""returns the indices of the set bits in the mask, in ascending order"""
+	# going through the binary string is linear in the size of the mask, unlike peeling off the
+	# lowest bit repeatedly (which is linear in the size for *every* bit). the low zeros are shifted
+	# out first, since a lot of the masks only have a few bits set somewhere near the top.
+	if mask == 0:
+		return []
+
+	low = (mask & -mask).bit_length() - 1
+	bits = bin(mask >> low)[:1:-1]
+	ret: List[int] = []
+	i = bits.find("1")
+	while i != -1:
+		ret.append(low + i)
+		i = bits.find("1", i + 1)
+
+	return ret
+
+
+def reverse_postorder(num_nodes: int, successors: Sequence[Iterable[int]], entry: int = 0) -> List[int]:
+	"""
+	orders the nodes so that (ignoring back edges) every node comes after its predecessors.
+	nodes that are not reachable from the entry are placed at the end, in index order.
+	"""
+	if num_nodes == 0:
+		return []
+
+	visited = bytearray(num_nodes)
+	postorder: List[int] = []
+
+	# iterative dfs; each entry is (node, iterator over its successors)
+	visited[entry] = 1
+	stack: List[Tuple[int, Iterator[int]]] = [ (entry, iter(sorted(successors[entry]))) ]
+	while len(stack) > 0:
+		node, succs = stack[-1]
+		for succ in succs:
+			if not visited[succ]:
+				visited[succ] = 1
+				stack.append((succ, iter(sorted(successors[succ]))))
+				break
+		else:
+			stack.pop()
+			postorder.append(node)
+
+	postorder.reverse()
+	postorder.extend(n for n in range(num_nodes) if not visited[n])
+	return postorder
+
+
+# how many nodes the solver has evaluated (in total, across all problems). the fewer the better;
+# it is only kept so that the effect of solving over blocks instead of statements can be checked.
+iterations = 0
+
+def solve(num_nodes: int, predecessors: Sequence[Iterable[int]], successors: Sequence[Iterable[int]],
+	gens: List[int], kills: List[int], forward: bool, union: bool, order: List[int]) -> Tuple[List[int], List[int]]:
+	"""
+	finds the least fixpoint of
+	    meet[n] = (union or intersection of) result[m], over the predecessors m of n
+	    result[n] = gens[n] | (meet[n] & ~kills[n])
+
+	for backward problems, swap "predecessors" and "successors" above. nodes with nothing to meet
+	over get an empty meet. `order` is the initial worklist order; use reverse postorder for
+	forward problems, and postorder for backward ones.
+
+	params:  number of nodes, predecessors, successors, gen masks, kill masks, direction, meet, order
+	returns: (meet, result) -- ie. (in, out) for forward problems, and (out, in) for backward ones.
+	"""
+	global iterations
+
+	sources = predecessors if forward else successors
+	targets = successors if forward else predecessors
+
+	meets: List[int] = [ 0 ] * num_nodes
+	results: List[int] = [ 0 ] * num_nodes
+
+	worklist: Deque[int] = deque(order)
+	queued = bytearray([ 1 ]) * num_nodes
+
+	while len(worklist) > 0:
+		n = worklist.popleft()
+		queued[n] = 0
+		iterations += 1
+
+		meet = 0
+		srcs = iter(sources[n])
+		if (first := next(srcs, None)) is not None:
+			meet = results[first]
+			if union:
+				for m in srcs:
+					meet |= results[m]
+			else:
+				for m in srcs:
+					meet &= results[m]
+
+		meets[n] = meet
+		result = gens[n] | (meet & ~kills[n])
+
+		if result != results[n]:
+			results[n] = result
+			for t in targets[n]:
+				if not queued[t]:
+					queued[t] = 1
+					worklist.append(t)
+
+	return meets, results
+
+
+
+class BlockGraph:
+	"""
+	the control flow graph over straight-line runs of statements. ir3 blocks are not quite basic
+	blocks (a conditional branch can appear in the middle), so a "block" here is a run of
+	statements [start, end) by id that can only be entered at the top and left at the bottom.
+	"""
+	def __init__(self, starts: List[int], ends: List[int], successors: List[List[int]]) -> None:
+		self.starts = starts
+		self.ends = ends
+		self.successors = successors
+		self.predecessors: List[List[int]] = [ [] for _ in starts ]
+		for b, succs in enumerate(successors):
+			for s in succs:
+				self.predecessors[s].append(b)
+
+		self.order = reverse_postorder(len(starts), successors)
+
+	def __len__(self) -> int:
+		return len(self.starts)
+
+
+class BlockSolution:
+	"""
+	the fixpoint of a problem solved over a BlockGraph. the facts for individual statements are
+	only worked out (in one sweep through each block) when they are asked for.
+	"""
+	def __init__(self, graph: BlockGraph, gens: List[int], kills: List[int], forward: bool,
+		block_ins: List[int], block_outs: List[int]) -> None:
+		self.graph = graph
+		self.gens = gens
+		self.kills = kills
+		self.forward = forward
+		self.block_ins = block_ins
+		self.block_outs = block_outs
+		self.stmt_facts: Optional[Tuple[List[int], List[int]]] = None
+
+	# returns (ins, outs) for every statement
+	def statements(self) -> Tuple[List[int], List[int]]:
+		if self.stmt_facts is not None:
+			return self.stmt_facts
+
+		num_stmts = len(self.gens)
+		ins: List[int] = [ 0 ] * num_stmts
+		outs: List[int] = [ 0 ] * num_stmts
+		gens, kills = self.gens, self.kills
+
+		for b, (start, end) in enumerate(zip(self.graph.starts, self.graph.ends)):
+			if self.forward:
+				cur = self.block_ins[b]
+				for n in range(start, end):
+					ins[n] = cur
+					cur = gens[n] | (cur & ~kills[n])
+					outs[n] = cur
+			else:
+				cur = self.block_outs[b]
+				for n in range(end - 1, start - 1, -1):
+					outs[n] = cur
+					cur = gens[n] | (cur & ~kills[n])
+					ins[n] = cur
+
+		self.stmt_facts = (ins, outs)
+		return self.stmt_facts
+
+
+def solve_blocks(graph: BlockGraph, gens: List[int], kills: List[int], forward: bool, union: bool) -> BlockSolution:
+	"""
+	like solve(), but the gens and kills are given per statement, and the fixpoint is found over
+	the blocks of the graph instead; the statements of each block are summarised into a single
+	gen and kill first.
+	"""
+	block_gens: List[int] = []
+	block_kills: List[int] = []
+	for start, end in zip(graph.starts, graph.ends):
+		gen = 0
+		kill = 0
+		stmts = range(start, end) if forward else range(end - 1, start - 1, -1)
+		for n in stmts:
+			gen = gens[n] | (gen & ~kills[n])
+			kill |= kills[n]
+
+		block_gens.append(gen)
+		block_kills.append(kill)
+
+	order = graph.order if forward else graph.order[::-1]
+	meets, results = solve(len(graph), graph.predecessors, graph.successors, block_gens, block_kills,
+		forward = forward, union = union, order = order)
+
+	if forward:
+		return BlockSolution(graph, gens, kills, forward, meets, results)
+	else:
+		return BlockSolution(graph, gens, kills, forward, results, meets)
+
+
+def bit_runs(masks: List[int], first: int = 0) -> Dict[int, List[Tuple[int, int]]]:
+	"""returns, for each bit, the (inclusive) ranges of consecutive masks in which it is set"""
+	# only look at what changes from one mask to the next; consecutive masks are usually mostly the
+	# same, so this is a lot cheaper than going through every bit of every mask.
+	runs: Dict[int, List[Tuple[int, int]]] = dict()
+	prev = 0
+
+	for n in range(first, len(masks)):
+		mask = masks[n]
+		if mask == prev:
+			continue
+
+		for i in bit_indices(prev & ~mask):
+			runs[i][-1] = (runs[i][-1][0], n - 1)
+
+		for i in bit_indices(mask & ~prev):
+			runs.setdefault(i, []).append((n, -1))
+
+		prev = mask
+
+	for i in bit_indices(prev):
+		runs[i][-1] = (runs[i][-1][0], len(masks) - 1)
+
+	return runs
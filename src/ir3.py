@@ -11,7 +11,12 @@ from .util import Location, escape_string
 def indent_lines(x: str) -> str:
 	return "\n".join(map(lambda s: "    " + s, x.split("\n")))
 
+# values are immutable, so the common ones are hash-consed: constructing a value that already exists
+# (by contents) gives back the existing object, which makes equality a pointer comparison. this does
+# mean that a value's location is that of the first one created, but nobody looks at those anyway.
 class Value(ABC):
+	__slots__ = ("loc",)
+
 	def __init__(self, loc: Location) -> None:
 		self.loc: Location = loc
 
@@ -24,21 +29,42 @@ class Value(ABC):
 	@abstractmethod
 	def __hash__(self) -> int: ...
 
+	def __copy__(self) -> Value:
+		return self
+
+	def __deepcopy__(self, memo: Dict[int, Any]) -> Value:
+		return self
+
 class ConstantInt(Value):
+	__slots__ = ("value",)
+	value: int
+	interned: ClassVar[Dict[int, ConstantInt]] = dict()
+
+	def __new__(cls, loc: Location, value: int) -> ConstantInt:
+		if (self := ConstantInt.interned.get(value)) is None:
+			self = super().__new__(cls)
+			self.loc = loc
+			self.value = value
+			ConstantInt.interned[value] = self
+
+		return self
+
 	def __init__(self, loc: Location, value: int) -> None:
-		super().__init__(loc)
-		self.value: int = value
+		# all the work was done in __new__
+		pass
 
 	def __str__(self) -> str:
 		return str(self.value)
 
 	def __eq__(self, other: object) -> bool:
-		return isinstance(other, ConstantInt) and other.value == self.value
+		return self is other
 
 	def __hash__(self) -> int:
 		return hash(self.value)
 
 class ConstantString(Value):
+	__slots__ = ("value",)
+
 	def __init__(self, loc: Location, value: str) -> None:
 		super().__init__(loc)
 		self.value: str = value
@@ -53,42 +79,77 @@ class ConstantString(Value):
 		return hash(self.value)
 
 class ConstantBool(Value):
+	__slots__ = ("value",)
+	value: bool
+	interned: ClassVar[Dict[bool, ConstantBool]] = dict()
+
+	def __new__(cls, loc: Location, value: bool) -> ConstantBool:
+		if (self := ConstantBool.interned.get(value)) is None:
+			self = super().__new__(cls)
+			self.loc = loc
+			self.value = value
+			ConstantBool.interned[value] = self
+
+		return self
+
 	def __init__(self, loc: Location, value: bool) -> None:
-		super().__init__(loc)
-		self.value: bool = value
+		pass
 
 	def __str__(self) -> str:
 		return f"{'true' if self.value else 'false'}"
 
 	def __eq__(self, other: object) -> bool:
-		return isinstance(other, ConstantBool) and other.value == self.value
+		return self is other
 
 	def __hash__(self) -> int:
 		return hash(self.value)
 
 class ConstantNull(Value):
+	__slots__ = ()
+	instance: ClassVar[Optional[ConstantNull]] = None
+
+	def __new__(cls, loc: Location) -> ConstantNull:
+		if (self := ConstantNull.instance) is None:
+			self = super().__new__(cls)
+			self.loc = loc
+			ConstantNull.instance = self
+
+		return self
+
 	def __init__(self, loc: Location) -> None:
-		super().__init__(loc)
+		pass
 
 	def __str__(self) -> str:
 		return "null"
 
 	def __eq__(self, other: object) -> bool:
-		return isinstance(other, ConstantNull)
+		return self is other
 
 	def __hash__(self) -> int:
 		return hash("ConstantNull")
 
 class VarRef(Value):
+	__slots__ = ("name",)
+	name: str
+	interned: ClassVar[Dict[str, VarRef]] = dict()
+
+	def __new__(cls, loc: Location, name: str) -> VarRef:
+		if (self := VarRef.interned.get(name)) is None:
+			self = super().__new__(cls)
+			self.loc = loc
+			self.name = name
+			VarRef.interned[name] = self
+
+		return self
+
 	def __init__(self, loc: Location, name: str) -> None:
-		super().__init__(loc)
-		self.name: str = name
+		pass
 
 	def __str__(self) -> str:
 		return self.name
 
 	def __eq__(self, other: object) -> bool:
-		return isinstance(other, VarRef) and other.name == self.name
+		return self is other
 
 	def __hash__(self) -> int:
 		return hash(self.name)
@@ -97,6 +158,8 @@ class VarRef(Value):
 
 
 class VarDecl:
+	__slots__ = ("loc", "name", "type")
+
 	def __init__(self, loc: Location, name: str, type: str) -> None:
 		self.loc: Location = loc
 		self.name: str = name
@@ -109,6 +172,8 @@ class VarDecl:
 
 
 class Stmt(ABC):
+	__slots__ = ("loc", "id")
+
 	def __init__(self, loc: Location) -> None:
 		self.loc: Location = loc
 		self.id: int = 0
@@ -117,6 +182,8 @@ class Stmt(ABC):
 	def __str__(self) -> str: ...
 
 class Expr(ABC):
+	__slots__ = ("loc", "id")
+
 	def __init__(self, loc: Location) -> None:
 		self.loc: Location = loc
 		self.id: int = 0
@@ -125,12 +192,17 @@ class Expr(ABC):
 	def __str__(self) -> str: ...
 
 	# for the purposes of subexpression elimination, we need to be able
-	# to determine if expressions are equivalent.
+	# to determine if expressions are equivalent (and to look them up).
 	@abstractmethod
 	def __eq__(self, other: object) -> bool: ...
 
+	@abstractmethod
+	def __hash__(self) -> int: ...
+
 
 class BinaryOp(Expr):
+	__slots__ = ("lhs", "rhs", "op")
+
 	def __init__(self, loc: Location, lhs: Value, op: str, rhs: Value) -> None:
 		super().__init__(loc)
 		self.lhs: Value = lhs
@@ -144,7 +216,12 @@ class BinaryOp(Expr):
 		return isinstance(other, BinaryOp) and (self.lhs == other.lhs) \
 			and (self.op == other.op) and (self.rhs == other.rhs)
 
+	def __hash__(self) -> int:
+		return hash((self.lhs, self.op, self.rhs))
+
 class UnaryOp(Expr):
+	__slots__ = ("expr", "op")
+
 	def __init__(self, loc: Location, op: str, expr: Value) -> None:
 		super().__init__(loc)
 		self.expr: Value = expr
@@ -156,7 +233,12 @@ class UnaryOp(Expr):
 	def __eq__(self, other: object) -> bool:
 		return isinstance(other, UnaryOp) and (self.expr == other.expr) and (self.op == other.op)
 
+	def __hash__(self) -> int:
+		return hash((self.op, self.expr))
+
 class DotOp(Expr):
+	__slots__ = ("lhs", "rhs")
+
 	def __init__(self, loc: Location, lhs: str, rhs: str) -> None:
 		super().__init__(loc)
 		self.lhs: str = lhs
@@ -168,7 +250,12 @@ class DotOp(Expr):
 	def __eq__(self, other: object) -> bool:
 		return isinstance(other, DotOp) and (self.lhs == other.lhs) and (self.rhs == other.rhs)
 
+	def __hash__(self) -> int:
+		return hash((self.lhs, self.rhs))
+
 class ValueExpr(Expr):
+	__slots__ = ("value",)
+
 	def __init__(self, loc: Location, value: Value) -> None:
 		super().__init__(loc)
 		self.value: Value = value
@@ -179,7 +266,12 @@ class ValueExpr(Expr):
 	def __eq__(self, other: object) -> bool:
 		return isinstance(other, ValueExpr) and (self.value == other.value)
 
+	def __hash__(self) -> int:
+		return hash(self.value)
+
 class NewOp(Expr):
+	__slots__ = ("cls",)
+
 	def __init__(self, loc: Location, cls: str) -> None:
 		super().__init__(loc)
 		self.cls: str = cls
@@ -190,8 +282,13 @@ class NewOp(Expr):
 	def __eq__(self, other: object) -> bool:
 		return isinstance(other, NewOp) and (self.cls == other.cls)
 
+	def __hash__(self) -> int:
+		return hash(self.cls)
+
 
 class FnCall:
+	__slots__ = ("loc", "name", "args", "ignored_var_uses", "stack_stores")
+
 	def __init__(self, loc: Location, name: str, args: List[Value]) -> None:
 		self.loc: Location = loc
 		self.name: str = name
@@ -209,6 +306,8 @@ class FnCall:
 
 
 class FnCallExpr(Expr):
+	__slots__ = ("call",)
+
 	def __init__(self, loc: Location, call: FnCall) -> None:
 		super().__init__(loc)
 		self.call: FnCall = call
@@ -219,11 +318,16 @@ class FnCallExpr(Expr):
 	def __eq__(self, other: object) -> bool:
 		return isinstance(other, FnCallExpr) and (self.call == other.call)
 
+	def __hash__(self) -> int:
+		return hash(self.call.name)
+
 
 
 
 
 class Label(Stmt):
+	__slots__ = ("name",)
+
 	def __init__(self, loc: Location, name: str) -> None:
 		super().__init__(loc)
 		self.name: str = name
@@ -232,6 +336,8 @@ class Label(Stmt):
 		return f"\b\bLabel {self.name}:"
 
 class FnCallStmt(Stmt):
+	__slots__ = ("call",)
+
 	def __init__(self, loc: Location, call: FnCall) -> None:
 		super().__init__(loc)
 		self.call: FnCall = call
@@ -240,6 +346,8 @@ class FnCallStmt(Stmt):
 		return f"{self.call};"
 
 class AssignOp(Stmt):
+	__slots__ = ("lhs", "rhs")
+
 	def __init__(self, loc: Location, lhs: str, rhs: Expr) -> None:
 		super().__init__(loc)
 		self.lhs: str = lhs
@@ -249,6 +357,8 @@ class AssignOp(Stmt):
 		return f"{self.lhs} = {self.rhs};"
 
 class AssignDotOp(Stmt):
+	__slots__ = ("lhs1", "lhs2", "rhs", "type")
+
 	def __init__(self, loc: Location, lhs1: str, lhs2: str, rhs: Expr, ty: str) -> None:
 		super().__init__(loc)
 		self.lhs1: str = lhs1
@@ -260,6 +370,8 @@ class AssignDotOp(Stmt):
 		return f"{self.lhs1}.{self.lhs2} = {self.rhs};"
 
 class ReturnStmt(Stmt):
+	__slots__ = ("value",)
+
 	def __init__(self, loc: Location, value: Optional[Value]) -> None:
 		super().__init__(loc)
 		self.value: Optional[Value] = value
@@ -268,6 +380,8 @@ class ReturnStmt(Stmt):
 		return f"return{'' if self.value is None else (' ' + str(self.value))};"
 
 class ReadLnCall(Stmt):
+	__slots__ = ("name",)
+
 	def __init__(self, loc: Location, name: str) -> None:
 		super().__init__(loc)
 		self.name: str = name
@@ -276,6 +390,8 @@ class ReadLnCall(Stmt):
 		return f"readln({self.name});"
 
 class PrintLnCall(Stmt):
+	__slots__ = ("value",)
+
 	def __init__(self, loc: Location, value: Value) -> None:
 		super().__init__(loc)
 		self.value: Value = value
@@ -284,6 +400,8 @@ class PrintLnCall(Stmt):
 		return f"println({self.value});"
 
 class Branch(Stmt):
+	__slots__ = ("label",)
+
 	def __init__(self, loc: Location, label: str) -> None:
 		super().__init__(loc)
 		self.label: str = label
@@ -293,6 +411,8 @@ class Branch(Stmt):
 
 
 class RelOp:
+	__slots__ = ("loc", "lhs", "rhs", "op")
+
 	def __init__(self, loc: Location, lhs: Value, op: str, rhs: Value) -> None:
 		self.loc: Location = loc
 		self.lhs: Value = lhs
@@ -303,6 +423,8 @@ class RelOp:
 		return f"{self.lhs} {self.op} {self.rhs}"
 
 class CondBranch(Stmt):
+	__slots__ = ("label", "cond")
+
 	def __init__(self, loc: Location, cond: Union[Value, RelOp], label: str) -> None:
 		super().__init__(loc)
 		self.label: str = label
@@ -315,6 +437,8 @@ class CondBranch(Stmt):
 
 
 class ClassDefn:
+	__slots__ = ("loc", "name", "fields")
+
 	def __init__(self, loc: Location, name: str, fields: List[VarDecl]) -> None:
 		self.loc: Location = loc
 		self.name: str = name
@@ -325,6 +449,8 @@ class ClassDefn:
 			+ "\n".join(map(lambda x: f"    {x};", self.fields)) + "\n}"
 
 class BasicBlock:
+	__slots__ = ("name", "loc", "stmts", "predecessors")
+
 	def __init__(self, loc: Location, name: str, stmts: List[Stmt], preds: Set[BasicBlock]) -> None:
 		self.name: str = name
 		self.loc: Location = loc
@@ -338,6 +464,8 @@ class BasicBlock:
 
 
 class FuncDefn:
+	__slots__ = ("loc", "name", "parent", "params", "return_type", "vars", "blocks", "cfg", "def_use")
+
 	def __init__(self, loc: Location, name: str, parent: str, params: List[VarDecl], return_type: str,
 				 vars: List[VarDecl], blocks: List[BasicBlock]) -> None:
 		self.loc: Location = loc
@@ -347,6 +475,10 @@ class FuncDefn:
 		self.return_type: str = return_type
 		self.vars: List[VarDecl] = vars
 		self.blocks: List[BasicBlock] = blocks
+		self.cfg: CFG = CFG(self)
+
+		# this is an iropt.DefUse, which gets made when somebody first asks for it.
+		self.def_use: Any = None
 
 	def __str__(self) -> str:
 		tmp1 = ", ".join(map(str, self.params))
@@ -358,7 +490,240 @@ class FuncDefn:
 			+ "\n".join(map(str, self.blocks)) \
 			+ "\n}"
 
+# the control flow graph between the blocks of a function. it lives alongside the function and is
+# updated in place (see update_edges and remove_block) by whatever changes branches or blocks, so
+# nobody needs to go around rebuilding it by looking for branches. the block predecessors are kept
+# in BasicBlock.predecessors, as they always have been.
+class CFG:
+	__slots__ = ("func", "labels", "successors", "statements", "stmt_blocks", "block_starts", "stmt_edges", "idoms")
+
+	def __init__(self, func: FuncDefn) -> None:
+		self.func = func
+		self.labels: Dict[str, BasicBlock] = { b.name: b for b in func.blocks }
+		self.successors: Dict[BasicBlock, List[BasicBlock]] = dict()
+
+		# these are only valid after renumber(); statement i is statements[i], in block stmt_blocks[i],
+		# and block_starts is the number of the first statement in each block.
+		self.statements: List[Stmt] = []
+		self.stmt_blocks: List[BasicBlock] = []
+		self.block_starts: Dict[BasicBlock, int] = dict()
+
+		# computed on demand: statement-level (successors, predecessors), and immediate dominators.
+		self.stmt_edges: Optional[Tuple[Dict[int, Set[int]], Dict[int, Set[int]]]] = None
+		self.idoms: Optional[Dict[BasicBlock, BasicBlock]] = None
+
+		for b in func.blocks:
+			b.predecessors.clear()
+
+		for b in func.blocks:
+			self.successors[b] = []
+			self.update_edges(b)
+
+	def block(self, name: str) -> BasicBlock:
+		return self.labels[name]
+
+	def update_edges(self, block: BasicBlock) -> List[BasicBlock]:
+		"""
+		call this after changing (or removing) any of the branches in the block. returns the blocks
+		that are no longer successors, since their phis might need fixing up.
+		"""
+		# note that we count every branch in the block, even the ones after an unconditional
+		# branch; they might be dead, but they still refer to their target.
+		new_succs: List[BasicBlock] = []
+		for stmt in block.stmts:
+			if isinstance(stmt, Branch) or isinstance(stmt, CondBranch):
+				target = self.labels[stmt.label]
+				if target not in new_succs:
+					new_succs.append(target)
+
+		removed: List[BasicBlock] = []
+		for old in self.successors[block]:
+			if old not in new_succs:
+				old.predecessors.discard(block)
+				removed.append(old)
+
+		for new in new_succs:
+			new.predecessors.add(block)
+
+		self.successors[block] = new_succs
+		self.stmt_edges = None
+		self.idoms = None
+		return removed
+
+	def add_block(self, block: BasicBlock, before: BasicBlock) -> None:
+		"""adds a new block to the function, placed just before `before`."""
+		self.func.blocks.insert(self.func.blocks.index(before), block)
+		self.labels[block.name] = block
+		self.successors[block] = []
+		self.update_edges(block)
+
+	def remove_block(self, block: BasicBlock) -> None:
+		"""removes the block from the function; nothing should be branching to it anymore."""
+		self.func.blocks.remove(block)
+		del self.labels[block.name]
+
+		for succ in self.successors.pop(block):
+			succ.predecessors.discard(block)
+
+		for pred in block.predecessors:
+			if pred in self.successors and block in self.successors[pred]:
+				self.successors[pred].remove(block)
+
+		block.predecessors.clear()
+		self.stmt_edges = None
+		self.idoms = None
+
+	def renumber(self) -> List[Stmt]:
+		"""numbers the statements in order, and returns them."""
+		self.statements = []
+		self.stmt_blocks = []
+		self.block_starts = dict()
+
+		for b in self.func.blocks:
+			self.block_starts[b] = len(self.statements)
+			for s in b.stmts:
+				s.id = len(self.statements)
+				self.statements.append(s)
+				self.stmt_blocks.append(b)
+
+		self.stmt_edges = None
+		return self.statements
+
+	def block_of(self, stmt: Stmt) -> BasicBlock:
+		return self.stmt_blocks[stmt.id]
+
+	def statement_edges(self) -> Tuple[Dict[int, Set[int]], Dict[int, Set[int]]]:
+		"""returns the statement-level (successors, predecessors); this needs the statements to be numbered."""
+		if self.stmt_edges is not None:
+			return self.stmt_edges
+
+		num_stmts = len(self.statements)
+		succs: Dict[int, Set[int]] = dict()
+		preds: Dict[int, Set[int]] = { i: set() for i in range(num_stmts) }
+
+		for stmt in self.statements:
+			if isinstance(stmt, Branch):
+				succs[stmt.id] = set([ self.labels[stmt.label].stmts[0].id ])
+
+			elif isinstance(stmt, CondBranch):
+				succs[stmt.id] = set([ self.labels[stmt.label].stmts[0].id ])
+				if stmt.id + 1 < num_stmts:
+					succs[stmt.id].add(stmt.id + 1)
+
+			# returns don't fall through to whatever comes after them
+			elif isinstance(stmt, ReturnStmt) or stmt.id + 1 >= num_stmts:
+				succs[stmt.id] = set()
+
+			else:
+				succs[stmt.id] = set([ stmt.id + 1 ])
+
+			for s in succs[stmt.id]:
+				preds[s].add(stmt.id)
+
+		self.stmt_edges = (succs, preds)
+		return self.stmt_edges
+
+	def reverse_postorder(self) -> List[BasicBlock]:
+		"""the blocks reachable from the entry, in reverse postorder."""
+		entry = self.func.blocks[0]
+		visited: Set[BasicBlock] = set([ entry ])
+		postorder: List[BasicBlock] = []
+
+		stack: List[Tuple[BasicBlock, Iterator[BasicBlock]]] = [ (entry, iter(self.successors[entry])) ]
+		while len(stack) > 0:
+			block, succs = stack[-1]
+			for succ in succs:
+				if succ not in visited:
+					visited.add(succ)
+					stack.append((succ, iter(self.successors[succ])))
+					break
+			else:
+				stack.pop()
+				postorder.append(block)
+
+		postorder.reverse()
+		return postorder
+
+	def dominators(self) -> Dict[BasicBlock, BasicBlock]:
+		"""the immediate dominator of every reachable block; the entry is its own idom."""
+		if self.idoms is not None:
+			return self.idoms
+
+		# cooper, harvey & kennedy's "a simple, fast dominance algorithm"
+		order = self.reverse_postorder()
+		rpo_index = { b: i for i, b in enumerate(order) }
+
+		idoms: Dict[BasicBlock, BasicBlock] = { order[0]: order[0] }
+
+		def intersect(a: BasicBlock, b: BasicBlock) -> BasicBlock:
+			while a is not b:
+				while rpo_index[a] > rpo_index[b]:
+					a = idoms[a]
+				while rpo_index[b] > rpo_index[a]:
+					b = idoms[b]
+			return a
+
+		changed = True
+		while changed:
+			changed = False
+			for b in order[1:]:
+				new_idom: Optional[BasicBlock] = None
+				for p in b.predecessors:
+					if p in idoms:
+						new_idom = p if new_idom is None else intersect(p, new_idom)
+
+				assert new_idom is not None
+				if idoms.get(b) is not new_idom:
+					idoms[b] = new_idom
+					changed = True
+
+		self.idoms = idoms
+		return idoms
+
+	def dominates(self, a: BasicBlock, b: BasicBlock) -> bool:
+		idoms = self.dominators()
+		while b is not a:
+			if idoms[b] is b:
+				return False
+			b = idoms[b]
+
+		return True
+
+	def dominator_tree(self) -> Dict[BasicBlock, List[BasicBlock]]:
+		"""the children of every reachable block in the dominator tree."""
+		idoms = self.dominators()
+		children: Dict[BasicBlock, List[BasicBlock]] = dict()
+		for b in self.reverse_postorder():
+			children[b] = []
+			if idoms[b] is not b:
+				children[idoms[b]].append(b)
+
+		return children
+
+	def dominance_frontiers(self) -> Dict[BasicBlock, Set[BasicBlock]]:
+		"""the dominance frontier of every reachable block."""
+		# also from cooper, harvey & kennedy; only join points can be in a frontier, and they are in
+		# the frontier of everything between each of their predecessors and their immediate dominator.
+		idoms = self.dominators()
+		frontiers: Dict[BasicBlock, Set[BasicBlock]] = { b: set() for b in idoms }
+		for b in idoms:
+			preds = [ p for p in b.predecessors if p in idoms ]
+			if len(preds) < 2:
+				continue
+
+			for p in preds:
+				runner = p
+				while runner is not idoms[b]:
+					frontiers[runner].add(b)
+					runner = idoms[runner]
+
+		return frontiers
+
+
+
 class Program:
+	__slots__ = ("classes", "funcs")
+
 	def __init__(self, classes: List[ClassDefn], funcs: List[FuncDefn]) -> None:
 		self.classes: List[ClassDefn] = classes
 		self.funcs: List[FuncDefn] = funcs
@@ -381,6 +746,8 @@ class Program:
 
 # FnCall needs this, and i don't want to circularly import
 class StoreFunctionStackArg(Stmt):
+	__slots__ = ("is_first", "total_args", "arg_num", "call", "var", "gen_instr")
+
 	def __init__(self, loc: Location, var: str, is_first: bool, call: FnCall, arg_num: int, total_args: int) -> None:
 		super().__init__(loc)
 		self.is_first = is_first
@@ -4,103 +4,185 @@ from __future__ import annotations
 from typing import *
 from copy import *
 from functools import reduce, partial
+from collections import deque
+
+import time
 
 from . import ast
 from . import ir3
 from . import simp
 from . import cgpseudo
+from . import dataflow
+from . import ssa
 
 from . import util
+from .util import options
 
 
 
 def optimise(func: ir3.FuncDefn):
-	passes = 0
+	run_passes(func)
+
+	# unrolling can't just be another pass, since the loop it leaves behind is still a small counted
+	# loop (and would get unrolled again, and again...). so it happens once, after everything else
+	# has settled, and then the other passes get to clean up after it.
+	if options.unroll_factor() > 1 and unroll_loops(func, options.unroll_factor()):
+		run_passes(func)
+
+
+def run_passes(func: ir3.FuncDefn):
+	analyses = Analyses(func)
+	iterations = dataflow.iterations
+
+	invocations: Dict[str, int] = { p.name: 0 for p in PASSES }
+	changes: Dict[str, int] = { p.name: 0 for p in PASSES }
+	timings: Dict[str, float] = { p.name: 0 for p in PASSES }
+
+	worklist: Deque[int] = deque(range(len(PASSES)))
+	queued: List[bool] = [ True ] * len(PASSES)
+
+	# when the worklist runs dry, we do one more sweep of every pass to make sure that we really
+	# are at a fixpoint (the `enables` lists only need to be good guesses, not perfect).
+	changed_since_sweep = False
+	start = time.perf_counter()
 
 	# just in case we don't terminate...
-	while passes < 500:
-		passes += 1
-		all_stmts = renumber_statements(func)
-		all_exprs = renumber_expressions(all_stmts)
+	while sum(invocations.values()) < 500 * len(PASSES):
+		if len(worklist) == 0:
+			if not changed_since_sweep:
+				break
 
-		# print(func)
+			changed_since_sweep = False
+			worklist.extend(range(len(PASSES)))
+			queued = [ True ] * len(PASSES)
 
-		# these things might remove statements, which screws up the numbering.
-		# it's safer to just restart it (and renumber the statements) when any
-		# of the optimisations makes a change.
+		idx = worklist.popleft()
+		queued[idx] = False
+		opt = PASSES[idx]
 
-		if remove_unreachable_blocks(func):     continue
-		if remove_double_jumps(func):           continue
-		if remove_redundant_temporaries(func):  continue
-		if remove_unused_variables(func):       continue
+		# everything relies on the statements being numbered (in order) anyway.
+		analyses.statements()
 
-		if eliminate_common_subexpressions(func, all_stmts, all_exprs):
-			continue
+		pass_start = time.perf_counter()
+		changed = opt.run(func, analyses)
+		timings[opt.name] += time.perf_counter() - pass_start
+		invocations[opt.name] += 1
 
-		if propagate_copies(func, all_stmts):
+		if not changed:
 			continue
 
-		if propagate_constants(func, all_stmts):
-			continue
+		changes[opt.name] += 1
+		changed_since_sweep = True
+		analyses.invalidate(opt.preserves)
 
-		if evaluate_constants(func):
-			continue
+		for name in opt.enables:
+			k = PASS_INDICES[name]
+			if not queued[k]:
+				queued[k] = True
+				worklist.append(k)
 
-		if remove_unreachable_stmts(func):
-			continue
+	total = sum(invocations.values())
+	util.log(f"opt({func.name}): completed in {total} pass invocation{'' if total == 1 else 's'}, "
+		+ f"{1000 * (time.perf_counter() - start):.2f} ms")
 
-		break
+	for opt in PASSES:
+		util.log(f"opt({func.name}):     {opt.name:<22} {invocations[opt.name]:>3} runs, "
+			+ f"{changes[opt.name]:>3} changed, {1000 * timings[opt.name]:>7.2f} ms")
 
-	util.log(f"opt({func.name}): completed in {passes} pass{'' if passes == 1 else 'es'}")
-	# print(func)
+	util.log(f"opt({func.name}): {dataflow.iterations - iterations} dataflow iterations, "
+		+ f"renumbered {analyses.renumbers} time{'' if analyses.renumbers == 1 else 's'}")
 
 
 
+class Analyses:
+	"""
+	caches the things that passes need about a function, so that they are only recomputed when a
+	pass actually changes something that they depend on. everything depends on the numbering of
+	the statements, so invalidating that invalidates everything else too.
+	"""
+	def __init__(self, func: ir3.FuncDefn) -> None:
+		self.func = func
+		self.cache: Dict[str, Any] = dict()
+		self.renumbers = 0
 
+	def statements(self) -> List[ir3.Stmt]:
+		if "statements" not in self.cache:
+			self.cache["statements"] = renumber_statements(self.func)
+			self.renumbers += 1
 
-def remove_unreachable_blocks(func: ir3.FuncDefn) -> bool:
-	block_names: Dict[str, ir3.BasicBlock] = {}
-	for block in func.blocks:
-		block_names[block.name] = block
+		return self.cache["statements"]
 
-	def check_reachability(block: ir3.BasicBlock, seen: Set[str]) -> Set[str]:
-		ret: Set[str] = set()
-		ret.add(block.name)
-		if block.name in seen:
-			return ret
+	def invalidate(self, preserved: Set[str]) -> None:
+		if "statements" not in preserved:
+			self.cache.clear()
+			return
 
-		# again, we need some workarounds because ir3's branch is *not* a basic-block style jump
-		for stmt in block.stmts:
-			if isinstance(stmt, ir3.Branch):
-				ret = ret.union(check_reachability(block_names[stmt.label], seen.union(ret)))
+		for name in list(self.cache.keys()):
+			if name not in preserved:
+				del self.cache[name]
 
-			elif isinstance(stmt, ir3.CondBranch):
-				ret = ret.union(check_reachability(block_names[stmt.label], seen.union(ret)))
 
-		return ret
+class Pass:
+	def __init__(self, name: str, run: Callable[[ir3.FuncDefn, Analyses], bool], preserves: Set[str],
+		enables: List[str]) -> None:
+		self.name = name
+		self.run = run
+		self.preserves = preserves          # the analyses that are still valid after this pass changes something
+		self.enables = enables              # the passes that might find something new to do after that
 
 
-	# keep removing things until nothing changes.
-	visited: Set[str] = set()
 
-	removed_blocks = []
-	while True:
-		new_visited = check_reachability(func.blocks[0], set())
-		if new_visited == visited:
-			break
+PASSES: List[Pass] = [
+	Pass("unreachable-blocks", lambda f, a: remove_unreachable_blocks(f), preserves = set(),
+		enables = [ "double-jumps", "redundant-temporaries", "unused-variables", "gvn", "copies", "sccp" ]),
 
-		visited = new_visited
+	Pass("double-jumps", lambda f, a: remove_double_jumps(f), preserves = { "statements" },
+		enables = [ "unreachable-blocks" ]),
 
-		# remove any blocks that are not reachable
-		unreachables = set(func.blocks).difference(map(lambda x: block_names[x], visited))
-		for unr in unreachables:
-			func.blocks.remove(unr)
-			removed_blocks.append(unr)
-			# print(f"removing {unr.name}")
+	Pass("redundant-temporaries", lambda f, a: remove_redundant_temporaries(f), preserves = set(),
+		enables = [ "redundant-temporaries", "unused-variables", "gvn", "sccp" ]),
 
-	for rem in removed_blocks:
-		for blk in func.blocks:
-			blk.predecessors.discard(rem)
+	Pass("unused-variables", lambda f, a: remove_unused_variables(f), preserves = set(),
+		enables = [ "redundant-temporaries", "unused-variables", "gvn", "sccp" ]),
+
+	Pass("gvn", lambda f, a: number_values(f), preserves = { "statements" },
+		enables = [ "redundant-temporaries", "unused-variables", "copies", "sccp", "licm" ]),
+
+	Pass("copies", lambda f, a: propagate_copies(f), preserves = { "statements" },
+		enables = [ "redundant-temporaries", "unused-variables", "gvn", "copies", "sccp", "licm" ]),
+
+	Pass("sccp", lambda f, a: propagate_conditional_constants(f, a.statements()), preserves = set(),
+		enables = [ "double-jumps", "redundant-temporaries", "unused-variables", "gvn", "copies", "licm", "induction-variables" ]),
+
+	Pass("licm", lambda f, a: hoist_loop_invariants(f), preserves = set(),
+		enables = [ "gvn", "induction-variables" ]),
+
+	Pass("induction-variables", lambda f, a: reduce_induction_variables(f), preserves = set(),
+		enables = [ "redundant-temporaries", "unused-variables", "gvn", "copies", "sccp", "induction-variables" ]),
+
+	Pass("unreachable-stmts", lambda f, a: remove_unreachable_stmts(f), preserves = set(),
+		enables = [ "unreachable-blocks", "double-jumps", "redundant-temporaries", "unused-variables" ]),
+]
+
+PASS_INDICES: Dict[str, int] = { p.name: i for i, p in enumerate(PASSES) }
+
+
+
+
+
+def remove_unreachable_blocks(func: ir3.FuncDefn) -> bool:
+	# again, we need some workarounds because ir3's branch is *not* a basic-block style jump;
+	# but the cfg already counts every branch in a block as an edge.
+	reachable = set(func.cfg.reverse_postorder())
+
+	removed_blocks = [ b for b in func.blocks if b not in reachable ]
+	for unr in removed_blocks:
+		for succ in func.cfg.successors[unr]:
+			remove_phi_operands(func, succ, unr)
+
+		func.cfg.remove_block(unr)
+		for stmt in unr.stmts:
+			get_def_use(func).remove(stmt)
 
 	log_opt(func, "unreachable block", "removed", len(removed_blocks))
 	return len(removed_blocks) > 0
@@ -111,29 +193,42 @@ def remove_double_jumps(func: ir3.FuncDefn) -> bool:
 	# eg. if we have a: { ... jmp b; }, b: { jmp c; }, c: { ... }, then we can replace it
 	# with simply a: { ... jmp c; }, c: { ... } and yeet b from existence.
 
-	block_names: Dict[str, ir3.BasicBlock] = {}
-	for block in func.blocks:
-		block_names[block.name] = block
-
 	num_removed = 0
 
 	# do this weird slice thing to make a copy so we can yeet elements while iterating.
 	for blk in func.blocks[:]:
 		if len(blk.stmts) == 1 and isinstance(blk.stmts[0], ir3.Branch):
 			target = blk.stmts[0].label
+			target_blk = func.cfg.block(target)
+			if target_blk is blk:
+				continue
+
+			phis = get_phi_nodes(target_blk)
 
 			# replace all predecessors to jump to the new target. note (again) that, because
 			# ir3 doesn't have proper `if {cond} goto {label} else goto {label}` forms, we need
 			# to actually check the last *TWO* statements in a block.
 
-			for pred in blk.predecessors:
+			# (retargeting changes the predecessors, so iterate over a copy)
+			for pred in list(blk.predecessors):
+				# if the target has phis and the predecessor can go elsewhere, the edge needs a block of
+				# its own to put the phi copies in later (see ssa.destruct) -- which is this one.
+				if len(phis) > 0 and len(func.cfg.successors[pred]) > 1:
+					continue
+
 				for j in pred.stmts:
 					if (isinstance(j, ir3.Branch) or isinstance(j, ir3.CondBranch)) and j.label == blk.name:
 						j.label = target
-						block_names[target].predecessors.add(pred)
-						block_names[target].predecessors.discard(blk)
 						num_removed += 1
 
+				# the value that came through the middle block now comes from the predecessor.
+				for phi in phis:
+					phi.values.append((get_phi_value(phi, blk), pred.name))
+					get_def_use(func).update(phi)
+
+				for succ in func.cfg.update_edges(pred):
+					remove_phi_operands(func, succ, pred)
+
 	# note that we only eliminate the double jump. the unreachable-block pruning actually
 	# removes the "middle" block, since it is now unreachable.
 
@@ -149,13 +244,7 @@ def remove_redundant_temporaries(func: ir3.FuncDefn) -> bool:
 	# is only used once, and that only use is on the next line (in the same block) to assign to someone else.
 	# if so, it eliminates the redundant _t1, and does `m = a + b` directly.
 
-	# first, figure out which block each statement is in
-	parent_blocks: Dict[int, str] = dict()
-	block_names: Dict[str, ir3.BasicBlock] = dict()
-	for blk in func.blocks:
-		block_names[blk.name] = blk
-		for s in blk.stmts:
-			parent_blocks[s.id] = blk.name
+	def_use = get_def_use(func)
 
 	num_removed = 0
 	for temp in filter(lambda x: is_temporary(x.name), func.vars):
@@ -169,24 +258,24 @@ def remove_redundant_temporaries(func: ir3.FuncDefn) -> bool:
 		if not isinstance(ass, ir3.AssignOp):
 			continue
 
+		# it must only be used once (by the next statement)
+		uses = def_use.get_uses(temp.name)
+		if len(uses) != 1:
+			continue
+
 		next_id = ass.id + 1
 
 		# not in the same block; i don't want to do flow analysis, so just ignore this.
-		if (next_id not in parent_blocks) or (parent_blocks[next_id] != parent_blocks[ass.id]):
+		block = func.cfg.block_of(ass)
+		if (next_id >= len(func.cfg.stmt_blocks)) or (func.cfg.stmt_blocks[next_id] is not block):
 			continue
 
-		# get the block...
-		block = block_names[parent_blocks[ass.id]]
+		# this pass only replaces statements, so the positions in the block are still good.
+		ass_id_in_blk = ass.id - func.cfg.block_starts[block]
+		next_stmt = block.stmts[ass_id_in_blk + 1]
 
-		ass_id_in_blk = 0
-		next_id_in_blk = 0
-		for i, s in enumerate(block.stmts):
-			if s.id == next_id:
-				next_id_in_blk = i
-			elif s.id == ass.id:
-				ass_id_in_blk = i
-
-		next_stmt = block.stmts[next_id_in_blk]
+		if next_stmt is not uses[0]:
+			continue
 
 		if isinstance(next_stmt, ir3.AssignOp) or isinstance(next_stmt, ir3.AssignDotOp):
 			if isinstance(next_stmt.rhs, ir3.ValueExpr) and isinstance(next_stmt.rhs.value, ir3.VarRef):
@@ -199,6 +288,8 @@ def remove_redundant_temporaries(func: ir3.FuncDefn) -> bool:
 
 					next_stmt.rhs = ass.rhs
 					block.stmts[ass_id_in_blk] = cgpseudo.DummyStmt(ass.loc)
+					def_use.replace(ass, block.stmts[ass_id_in_blk])
+					def_use.update(next_stmt)
 					num_removed += 1
 
 	log_opt(func, "redundant temporary", "removed", num_removed)
@@ -212,29 +303,34 @@ def remove_unused_variables(func: ir3.FuncDefn) -> bool:
 
 	# we also must note to extract any side effects from the rhs of the assign.
 
-	parent_blocks: Dict[int, ir3.BasicBlock] = dict()
-	for blk in func.blocks:
-		for s in blk.stmts:
-			parent_blocks[s.id] = blk
+	def_use = get_def_use(func)
 
 	num_removed = 0
 	for var in func.vars[:]:
 		uses = get_var_uses(func, var.name)
 		if len(uses) == 0:
 			assigns = get_var_assigns(func, var.name)
+
+			# something else (eg. a readln) gives it a value, so we can't get rid of it.
+			if len(assigns) != len(def_use.get_defs(var.name)):
+				continue
+
 			for ass in assigns:
-				assert isinstance(ass, ir3.AssignOp) or isinstance(ass, ir3.AssignDotOp)
+				assert isinstance(ass, ir3.AssignOp) or isinstance(ass, cgpseudo.PhiNode)
 
-				# check if the rhs has side effects
-				side_effect = get_side_effects(ass.rhs)
+				# check if the rhs has side effects (phis don't have any)
+				side_effect = get_side_effects(ass.rhs) if isinstance(ass, ir3.AssignOp) else None
 				if side_effect is not None:
 					# if it does, replace the assign with the side effect. the variable
 					# still gets yeeted, but any side effects used to assign it (ie. function calls)
 					# are still executed.
-					parent_blocks[ass.id].stmts[parent_blocks[ass.id].stmts.index(ass)] = side_effect
+					block = func.cfg.block_of(ass)
+					block.stmts[block.stmts.index(ass)] = side_effect
+					def_use.replace(ass, side_effect)
 
 				else:
-					parent_blocks[ass.id].stmts.remove(ass)
+					func.cfg.block_of(ass).stmts.remove(ass)
+					def_use.remove(ass)
 
 			func.vars.remove(var)
 			num_removed += 1
@@ -243,217 +339,461 @@ def remove_unused_variables(func: ir3.FuncDefn) -> bool:
 	return num_removed > 0
 
 
-def eliminate_common_subexpressions(func: ir3.FuncDefn, all_stmts: List[ir3.Stmt], all_exprs: List[ir3.Expr]) -> bool:
+def number_values(func: ir3.FuncDefn) -> bool:
+	# global value numbering, over the dominator tree. every variable gets a "leader" -- the simplest
+	# value that it is known to be equal to (itself, if nothing better) -- and expressions are looked
+	# up by the leaders of their operands. since we're in SSA, if some `t = a + b` dominates `x = a + b`,
+	# then x is just t; we walk down the dominator tree keeping a table of the expressions computed
+	# by the dominating blocks, and take them out again when we leave.
+	#
+	# because the lookup goes through the leaders, `y = x * c` above is now the same as `u = t * c`,
+	# and so on; redundancies that depend on other redundancies are all found in one go.
 
-	def gen_func(stmt: ir3.Stmt, _: List[ir3.Expr]) -> Set[int]:
-		# a statement only "generates" an expression when there is an expression on its rhs.
-		# we do not want to consider dotops to "generate" their expressions (since it would
-		# be too expensive to load from memory versus just doing arithmetic), so we are left
-		# with only normal assigns. further, only consider temporaries, since they are in SSA.
-		# we also also do not consider phi nodes, since there's no expression there.
+	def_use = get_def_use(func)
+	leaders: Dict[str, ir3.Value] = dict()
 
-		# since normal vars are not constrained to SSA, for something like:
-		# b = <expr>
-		# ...
-		# x = <expr.
-		# we cannot just assign `x = b` since `b` might have been redefined somewhere in the middle.
-		# with SSA, we can be sure that is not the case.
-		if isinstance(stmt, ir3.AssignOp) and is_temporary(stmt.lhs):
-			return set([ stmt.rhs.id ])
-		else:
-			return set()
+	def get_leader(value: ir3.Value) -> ir3.Value:
+		if isinstance(value, ir3.VarRef):
+			return leaders.get(value.name, value)
+		return value
 
-	def kill_func(stmt: ir3.Stmt, all_exprs: List[ir3.Expr]) -> Set[int]:
-		stmt_defs = get_statement_defs(stmt)
+	def get_leader_name(name: str) -> str:
+		# objects are referred to by name, so they can only be replaced by another variable
+		leader = leaders.get(name)
+		return leader.name if isinstance(leader, ir3.VarRef) else name
 
-		# an expression is "killed" by this statement if the statement defines
-		# some value that the expression uses.
-		def is_killed(expr: ir3.Expr) -> bool:
-			return len(get_expr_uses(expr).intersection(stmt_defs)) > 0
+	# for `x = !y` and `x = -y`, what x is the negation of (so that !!y can be y).
+	negations: Dict[str, Tuple[str, ir3.Value]] = dict()
 
-		# a statement can kill any expression, so we need them all
-		return set(map(lambda x: x.id, filter(is_killed, all_exprs)))
+	# we can't tell which objects alias, so a field load can only be reused if nothing could have stored
+	# to a field in between; every store (or call) gives memory a new "version", which goes in the key.
+	clobbers: Dict[ir3.BasicBlock, bool] = dict()
+	for blk in func.blocks:
+		clobbers[blk] = any(is_memory_clobber(stmt) for stmt in blk.stmts)
+
+	def inherits_memory(blk: ir3.BasicBlock, idom: ir3.BasicBlock) -> bool:
+		# the memory at the top of the block is the same as at the bottom of its immediate dominator
+		# if nothing on the way from there (going backwards from here) can store anything.
+		seen: Set[ir3.BasicBlock] = set([ idom ])
+		pending = list(blk.predecessors)
+		while len(pending) > 0:
+			pred = pending.pop()
+			if pred in seen:
+				continue
+			elif clobbers[pred]:
+				return False
+
+			seen.add(pred)
+			pending.extend(pred.predecessors)
+
+		return True
+
+	def simplify(stmt: Union[ir3.AssignOp, ir3.AssignDotOp]) -> int:
+		# rewrite the operands to their leaders, and simplify the result if we can.
+		changed = 0
+		expr = stmt.rhs
+		if isinstance(expr, ir3.BinaryOp):
+			lhs, rhs = get_leader(expr.lhs), get_leader(expr.rhs)
+			changed += (lhs is not expr.lhs) + (rhs is not expr.rhs)
+			expr.lhs, expr.rhs = lhs, rhs
+
+			if (value := simplify_binary_identity(expr.lhs, expr.op, expr.rhs)) is not None:
+				stmt.rhs = ir3.ValueExpr(expr.loc, value)
+				return changed + 1
+
+		elif isinstance(expr, ir3.UnaryOp):
+			operand = get_leader(expr.expr)
+			changed += (operand is not expr.expr)
+			expr.expr = operand
+
+			# !!x = x, and --x = x
+			if isinstance(operand, ir3.VarRef) and (neg := negations.get(operand.name)) is not None:
+				if neg[0] == expr.op:
+					stmt.rhs = ir3.ValueExpr(expr.loc, neg[1])
+					return changed + 1
+
+		elif isinstance(expr, ir3.DotOp):
+			lhs_name = get_leader_name(expr.lhs)
+			changed += (lhs_name != expr.lhs)
+			expr.lhs = lhs_name
+
+		elif isinstance(expr, ir3.ValueExpr):
+			value = get_leader(expr.value)
+			changed += (value is not expr.value)
+			expr.value = value
+
+		if (new_rhs := simplify_expr(stmt.rhs)) is not None:
+			stmt.rhs = new_rhs
+			changed += 1
+
+		return changed
 
+	num_changed = 0
+	num_removed = 0
 
-	# perform forward flow analysis.
-	ins, outs, gens, kills = forward_dataflow(func, all_stmts, int, all_exprs, gen_func, kill_func, union = False)
+	table: Dict[Tuple[Any, ...], str] = dict()
+	memory = 0
+	memory_at_end: Dict[ir3.BasicBlock, int] = dict()
 
-	# gens is a map of stmt -> gen-ed expr
-	# we want to invert it. to get expr -> variable name
-	# we know that only assignments generate expressions.
-	expr_generators: Dict[int, str] = dict()
-	for n, gs in enumerate(gens):
-		# there isn't a statement that generates more than 1 expression
-		assert len(gs) <= 1
+	idoms = func.cfg.dominators()
+	children = func.cfg.dominator_tree()
 
-		if len(gs) == 1:
-			expr_id = list(gs)[0]
+	# a dfs over the dominator tree; each entry is (block, the keys it added to the table), where the
+	# second part is None if we haven't been through the block yet.
+	stack: List[Tuple[ir3.BasicBlock, Optional[List[Tuple[Any, ...]]]]] = [ (func.blocks[0], None) ]
 
-			# all generators should be an assign
-			stmt = all_stmts[n]
-			assert isinstance(stmt, ir3.AssignOp)
+	# not everything has a key (eg. function calls), hence the optional
+	key: Optional[Tuple[Any, ...]]
+	while len(stack) > 0:
+		blk, added = stack.pop()
+		if added is not None:
+			for key in added:
+				del table[key]
+			continue
 
-			# each expression is only generated by one statement
-			assert expr_id not in expr_generators
-			expr_generators[expr_id] = stmt.lhs
+		idom = idoms[blk]
+		if idom is not blk and inherits_memory(blk, idom):
+			mem = memory_at_end[idom]
+		else:
+			memory += 1
+			mem = memory
+
+		added = []
+		for stmt in blk.stmts:
+			if isinstance(stmt, ir3.AssignOp) or isinstance(stmt, ir3.AssignDotOp):
+				if (n := simplify(stmt)) > 0:
+					num_changed += n
+					def_use.update(stmt)
+
+				key = get_value_key(stmt.rhs, mem)
+				if key is not None and (existing := table.get(key)) is not None:
+					stmt.rhs = ir3.ValueExpr(stmt.rhs.loc, ir3.VarRef(stmt.rhs.loc, existing))
+					def_use.update(stmt)
+					num_removed += 1
 
+				elif key is not None and isinstance(stmt, ir3.AssignOp):
+					table[key] = stmt.lhs
+					added.append(key)
 
+				if isinstance(stmt, ir3.AssignOp):
+					if isinstance(stmt.rhs, ir3.ValueExpr):
+						leaders[stmt.lhs] = get_leader(stmt.rhs.value)
+					elif isinstance(stmt.rhs, ir3.UnaryOp):
+						negations[stmt.lhs] = (stmt.rhs.op, stmt.rhs.expr)
 
-	# there should be no expression being generated from 2 statements.
+			if is_memory_clobber(stmt):
+				memory += 1
+				mem = memory
 
-	num_removed = 0
-	for i, stmt in enumerate(all_stmts):
-		# these are the expressions that reach this statement
-		in_exprs = ins[i]
-
-		# for this statement, check if it uses one of the in_exprs. this is
-		# only possible if the statement is an assign (nobody else has expressions)
-		if isinstance(stmt, ir3.AssignOp) or isinstance(stmt, ir3.AssignDotOp):
-			# check if the expression has side effects (is a 'new' or a function call).
-			# if so, we cannot eliminate it. note that we consider 'new' here, because
-			# we obviously need unique 'new's for each use of it. (it needs to be... new) haHAA
-
-			if isinstance(stmt.rhs, ir3.FnCallExpr) or isinstance(stmt.rhs, ir3.NewOp):
-				continue
+		memory_at_end[blk] = mem
+		stack.append((blk, added))
+		stack.extend((child, None) for child in reversed(children[blk]))
 
-			# ok, now see if any expression that reaches us is equivalent:
-			for in_expr_id in in_exprs:
-				if (all_exprs[in_expr_id] == stmt.rhs) and (in_expr_id != stmt.rhs.id):
-					# match -- replace it with the variable that made it;
-					stmt.rhs = ir3.ValueExpr(stmt.rhs.loc, ir3.VarRef(stmt.rhs.loc, expr_generators[in_expr_id]))
-					num_removed += 1
+	log_opt(func, "operand", "simplified", num_changed)
+	log_opt(func, "redundant expression", "eliminated", num_removed)
+	return num_changed + num_removed > 0
 
 
-	log_opt(func, "common subexpression", "eliminated", num_removed)
-	return num_removed > 0
+def get_value_key(expr: ir3.Expr, memory: int) -> Optional[Tuple[Any, ...]]:
+	# two expressions with the same key compute the same value. the operands should already be leaders.
+	def order(value: ir3.Value) -> Tuple[str, str]:
+		return (type(value).__name__, str(value))
 
+	if isinstance(expr, ir3.BinaryOp):
+		lhs, op, rhs = expr.lhs, expr.op, expr.rhs
 
-def propagate_copies(func: ir3.FuncDefn, all_stmts: List[ir3.Stmt]) -> bool:
-	# given that:
-	# 1. we only operate on temporary variables (ie. both sides are temporaries)
-	# 2. temporaries are in SSA form
-	# 3. for `_t1 = _t0`, the definition of _t0 must be visible at this point.
+		# a > b is b < a
+		if op in [ ">", ">=" ]:
+			lhs, op, rhs = rhs, { ">": "<", ">=": "<=" }[op], lhs
 
-	def gen_func(stmt: ir3.Stmt, _: List[Any]) -> Set[str]:
-		if (isinstance(stmt, ir3.AssignOp) or isinstance(stmt, cgpseudo.PhiNode)) and is_temporary(stmt.lhs):
-			return set([ stmt.lhs ])
+		# and for these, a op b is b op a
+		elif op in [ "+", "*", "==", "!=", "&&", "||" ] and order(rhs) < order(lhs):
+			lhs, rhs = rhs, lhs
 
-		return set()
+		return ("binary", lhs, op, rhs)
 
-	# we operate in SSA for temporaries, so a value is never killed.
-	def kill_func(stmt: ir3.Stmt, _: List[Any]) -> Set[str]:
-		return set()
+	elif isinstance(expr, ir3.UnaryOp):
+		return ("unary", expr.op, expr.expr)
 
-	ins, outs, gens, kills = forward_dataflow(func, all_stmts, str, [], gen_func, kill_func, union = False)
-
-	# which statements does a particular value reach
-	reaching_stmts: Dict[str, Set[int]] = dict()
-	for n, vars in enumerate(ins):
-		for v in vars:
-			reaching_stmts.setdefault(v, set()).add(n)
-
-	# map of name -> copied_name, ie. we want to replace `copied_name` with `name`
-	copiers: Dict[str, str] = dict()
-	def visit(stmt: ir3.Stmt):
-		nonlocal copiers
-		nonlocal reaching_stmts
-		for var in reaching_stmts:
-			if stmt.id not in reaching_stmts[var]:
-				continue
+	elif isinstance(expr, ir3.DotOp):
+		return ("field", expr.lhs, expr.rhs, memory)
 
-			if isinstance(stmt, ir3.AssignOp) and isinstance(stmt.rhs, ir3.ValueExpr):
-				if isinstance(stmt.rhs.value, ir3.VarRef) and stmt.rhs.value.name == var:
-					copiers[var] = stmt.lhs
+	# plain values are already handled by the leaders; calls and `new`s are never the same twice.
+	return None
 
-	visit_stmts(visit, func)
 
-	# find all statements that are copies
-	num_removed = 0
-	for var, stmts in reaching_stmts.items():
-		if var not in copiers:
-			continue
+def simplify_binary_identity(lhs: ir3.Value, op: str, rhs: ir3.Value) -> Optional[ir3.Value]:
+	# identities that hold when both sides are the same thing (but not a constant).
+	if lhs is not rhs or not isinstance(lhs, ir3.VarRef):
+		return None
 
-		copier = copiers[var]
-		if copier == var:
-			continue
+	if op in [ "&&", "||" ]:
+		return lhs
+	elif op == "-":
+		return ir3.ConstantInt(lhs.loc, 0)
+	elif op in [ "==", "<=", ">=" ]:
+		return ir3.ConstantBool(lhs.loc, True)
+	elif op in [ "!=", "<", ">" ]:
+		return ir3.ConstantBool(lhs.loc, False)
+	else:
+		return None
 
-		for sid in stmts:
-			num_removed += replace_variables_in_stmt(all_stmts[sid], copier, ir3.VarRef(all_stmts[sid].loc, var))
 
-	log_opt(func, "copies", "propagated", num_removed, singular = "copy")
-	return num_removed > 0
+def is_memory_clobber(stmt: ir3.Stmt) -> bool:
+	# storing to a field, or calling something that might.
+	return isinstance(stmt, ir3.AssignDotOp) or isinstance(stmt, ir3.FnCallStmt) \
+		or (isinstance(stmt, ir3.AssignOp) and isinstance(stmt.rhs, ir3.FnCallExpr))
+
 
+def propagate_copies(func: ir3.FuncDefn) -> bool:
+	# everything is in SSA form by now (see ssa.py), so for a copy `x = y`, x is y everywhere: x is
+	# never reassigned, and the definition of y dominates the copy (and so every use of x). we can
+	# just go through the uses of x and make them use y instead. a phi that only merges one value
+	# (apart from itself) is really a copy of that value too.
+
+	num_removed = 0
+	for blk in func.blocks:
+		for stmt in blk.stmts:
+			value: Optional[ir3.Value] = None
+			if isinstance(stmt, ir3.AssignOp) and isinstance(stmt.rhs, ir3.ValueExpr):
+				if isinstance(stmt.rhs.value, ir3.VarRef):
+					value = stmt.rhs.value
 
-def propagate_constants(func: ir3.FuncDefn, all_stmts: List[ir3.Stmt]) -> bool:
-	# similar in theory to propagating copies.
+			elif isinstance(stmt, cgpseudo.PhiNode):
+				value = get_trivial_phi_value(stmt)
 
-	# a constant is generated when you assign a constant to a variable.
-	# pregenerate this (since we'll need it later anyway_
-	constants: Dict[str, Set[ir3.Value]] = dict()
+			if value is None:
+				continue
 
-	# which statement uses which variables
-	used_variables: Dict[int, Set[str]] = dict()
+			assert isinstance(stmt, ir3.AssignOp) or isinstance(stmt, cgpseudo.PhiNode)
+			if isinstance(value, ir3.VarRef) and value.name == stmt.lhs:
+				continue
 
-	def visit1(stmt: ir3.Stmt):
-		nonlocal constants
+			for use in get_var_uses(func, stmt.lhs):
+				num_removed += replace_variables_in_stmt(func, use, stmt.lhs, value)
 
-		if isinstance(stmt, ir3.AssignOp) and isinstance(stmt.rhs, ir3.ValueExpr):
-			if is_constant_value(stmt.rhs.value):
-				constants.setdefault(stmt.lhs, set()).add(stmt.rhs.value)
+	log_opt(func, "copies", "propagated", num_removed, singular = "copy")
+	return num_removed > 0
 
-		used_variables[stmt.id] = get_statement_uses(stmt)
 
-	visit_stmts(visit1, func)
+# the lattice that sccp works over: a variable is undefined (we haven't seen its definition run yet),
+# or some constant (an ir3.Value), or overdefined (it isn't a constant); it can only ever move down.
+SCCP_UNDEFINED = "undefined"
+SCCP_OVERDEFINED = "overdefined"
+LatticeValue = Union[ir3.Value, str]
 
-	def gen_func(stmt: ir3.Stmt, _: List[Any]) -> Set[tuple]:
-		if isinstance(stmt, ir3.AssignOp) and isinstance(stmt.rhs, ir3.ValueExpr):
-			if is_constant_value(stmt.rhs.value):
-				# print(f"{stmt.lhs} is a constant ({stmt.rhs.value}) at {stmt.id}")
-				return set([ (stmt.lhs, stmt.rhs.value) ])
+def propagate_conditional_constants(func: ir3.FuncDefn, all_stmts: List[ir3.Stmt]) -> bool:
+	# sparse conditional constant propagation (wegman and zadeck). we find the constant variables and
+	# the edges that can actually be taken at the same time: a block is only looked at once an edge
+	# into it is executable, and a branch on a constant only makes one of its edges executable. so
+	# constants that go around a loop or through an `if` that only ever goes one way are found too.
+	# since we're in SSA, a statement only needs to be looked at again when something it uses changes,
+	# so a whole chain of constants gets folded in one go.
 
-		return set()
+	def_use = get_def_use(func)
+	lattice: Dict[str, LatticeValue] = dict()
 
-	# a constant is killed if the variable (to which you assigned a constant) is re-assigned
-	def kill_func(stmt: ir3.Stmt, _: List[Any]) -> Set[tuple]:
-		if isinstance(stmt, ir3.AssignOp) or isinstance(stmt, cgpseudo.PhiNode):
-			# this kills all.
-			killed: Set[tuple] = set()
-			if stmt.lhs in constants:
-				# print(f"kill {stmt.lhs} at {stmt.id}")
-				for vals in constants[stmt.lhs]:
-					killed.add((stmt.lhs, vals))
-
-			return killed
+	# variables that are never assigned (ie. parameters) can't be constants.
+	assigned: Set[str] = set()
+	for stmt in all_stmts:
+		assigned |= get_statement_defs(stmt)
+
+	def get_value(value: ir3.Value) -> LatticeValue:
+		if isinstance(value, ir3.VarRef):
+			if value.name not in assigned:
+				return SCCP_OVERDEFINED
+			return lattice.get(value.name, SCCP_UNDEFINED)
+
+		return value
+
+	def evaluate_binary(lhs: ir3.Value, op: str, rhs: ir3.Value) -> LatticeValue:
+		a = get_value(lhs)
+		b = get_value(rhs)
+		if isinstance(a, ir3.Value) and isinstance(b, ir3.Value):
+			return fold_binary_op(a, op, b) or SCCP_OVERDEFINED
+
+		# some things are constant even if one side isn't
+		for x, y in [ (a, b), (b, a) ]:
+			if y == SCCP_OVERDEFINED and isinstance(x, ir3.Value):
+				if (op == "*" and x is ir3.ConstantInt(x.loc, 0)) \
+					or (op == "&&" and x is ir3.ConstantBool(x.loc, False)) \
+					or (op == "||" and x is ir3.ConstantBool(x.loc, True)):
+					return x
+
+		if a == SCCP_UNDEFINED or b == SCCP_UNDEFINED:
+			return SCCP_UNDEFINED
+
+		return SCCP_OVERDEFINED
+
+	def evaluate(expr: Union[ir3.Expr, ir3.Value, ir3.RelOp]) -> LatticeValue:
+		if isinstance(expr, ir3.Value):
+			return get_value(expr)
+		elif isinstance(expr, ir3.ValueExpr):
+			return get_value(expr.value)
+		elif isinstance(expr, ir3.BinaryOp) or isinstance(expr, ir3.RelOp):
+			return evaluate_binary(expr.lhs, expr.op, expr.rhs)
+		elif isinstance(expr, ir3.UnaryOp):
+			a = get_value(expr.expr)
+			if isinstance(a, ir3.Value):
+				return fold_unary_op(expr.op, a) or SCCP_OVERDEFINED
+			return a
 		else:
-			return set()
+			# field loads, calls, and allocations
+			return SCCP_OVERDEFINED
+
+	executable_edges: Set[Tuple[ir3.BasicBlock, ir3.BasicBlock]] = set()
+	visited: Set[ir3.BasicBlock] = set()
+
+	# the entry block gets a fake edge from nowhere.
+	flow_worklist: Deque[Tuple[Optional[ir3.BasicBlock], ir3.BasicBlock]] = deque([ (None, func.blocks[0]) ])
+	ssa_worklist: Deque[ir3.Stmt] = deque()
+
+	def set_value(var: str, value: LatticeValue) -> None:
+		old = lattice.get(var, SCCP_UNDEFINED)
+		if value == SCCP_UNDEFINED or old == SCCP_OVERDEFINED or value == old:
+			return
+
+		# a variable can't go from one constant to another; if it tries, it isn't a constant.
+		if isinstance(old, ir3.Value):
+			value = SCCP_OVERDEFINED
+
+		lattice[var] = value
+		ssa_worklist.extend(def_use.get_uses(var))
+
+	def visit_branches(blk: ir3.BasicBlock) -> None:
+		# see which ways we can leave the block; the branches are at the end.
+		for stmt in blk.stmts:
+			if isinstance(stmt, ir3.CondBranch):
+				cond = evaluate(stmt.cond)
+				if cond == SCCP_UNDEFINED:
+					return
+				elif isinstance(cond, ir3.ConstantBool) and not cond.value:
+					continue
+
+				flow_worklist.append((blk, func.cfg.block(stmt.label)))
+				if isinstance(cond, ir3.ConstantBool):
+					return
+
+			elif isinstance(stmt, ir3.Branch):
+				flow_worklist.append((blk, func.cfg.block(stmt.label)))
+				return
+
+			elif isinstance(stmt, ir3.ReturnStmt):
+				return
+
+	def visit_stmt(stmt: ir3.Stmt) -> None:
+		blk = func.cfg.block_of(stmt)
+		if blk not in visited:
+			return
+
+		if isinstance(stmt, cgpseudo.PhiNode):
+			# only the values coming in along edges that we can take count.
+			value: LatticeValue = SCCP_UNDEFINED
+			for v, label in stmt.values:
+				if (func.cfg.block(label), blk) in executable_edges:
+					value = meet_lattice_values(value, get_value(v))
+
+			set_value(stmt.lhs, value)
+
+		elif isinstance(stmt, ir3.AssignOp):
+			set_value(stmt.lhs, evaluate(stmt.rhs))
+
+		elif isinstance(stmt, ir3.ReadLnCall):
+			set_value(stmt.name, SCCP_OVERDEFINED)
+
+		elif isinstance(stmt, ir3.CondBranch):
+			visit_branches(blk)
+
+	while len(flow_worklist) > 0 or len(ssa_worklist) > 0:
+		while len(flow_worklist) > 0:
+			pred, blk = flow_worklist.popleft()
+			if pred is not None:
+				if (pred, blk) in executable_edges:
+					continue
+				executable_edges.add((pred, blk))
+
+			first_visit = blk not in visited
+			visited.add(blk)
+
+			# a new edge in means that the phis might have something new to merge
+			for phi in get_phi_nodes(blk):
+				visit_stmt(phi)
+
+			if not first_visit:
+				continue
 
-	ins, outs, _, _ = forward_dataflow(func, all_stmts, tuple, [], gen_func, kill_func, union = False)
+			for stmt in blk.stmts:
+				if not isinstance(stmt, cgpseudo.PhiNode):
+					visit_stmt(stmt)
 
-	preds = compute_predecessors(func)
-	succs = compute_successors(func)
+			visit_branches(blk)
 
-	num_removed = 0
-	for stmt in all_stmts:
-		avail_consts: Dict[str, Set[ir3.Value]] = dict()
-		for const in ins[stmt.id]:
-			avail_consts.setdefault(const[0], set()).add(const[1])
+		if len(ssa_worklist) > 0:
+			visit_stmt(ssa_worklist.popleft())
 
-		cands: Iterable = used_variables[stmt.id].intersection(avail_consts.keys())
-		cands = filter(lambda x: len(avail_consts[x]) == 1, cands)
 
-		for cand in cands:
-			replacement = next(iter(avail_consts[cand]))
-			num_removed += replace_variables_in_stmt(stmt, cand, deepcopy(replacement))
+	# ok, now actually change things. first, the branches that only go one way.
+	num_changed = 0
+	for blk in visited:
+		i = 0
+		while i < len(blk.stmts):
+			stmt = blk.stmts[i]
+			cond = evaluate(stmt.cond) if isinstance(stmt, ir3.CondBranch) else None
+			if isinstance(stmt, ir3.CondBranch) and isinstance(cond, ir3.ConstantBool):
+				num_changed += 1
+				if cond.value:
+					# everything after an unconditional branch is dead.
+					blk.stmts[i] = ir3.Branch(stmt.loc, stmt.label)
+					def_use.replace(stmt, blk.stmts[i])
+					for dead in blk.stmts[i + 1:]:
+						def_use.remove(dead)
+
+					del blk.stmts[i + 1:]
+				else:
+					def_use.remove(blk.stmts.pop(i))
+					continue
+
+			i += 1
+
+		for succ in func.cfg.update_edges(blk):
+			remove_phi_operands(func, succ, blk)
+
+	# then, use the constants instead of the variables. the definitions are left for the
+	# unused-variables pass to clean up.
+	for var, value in lattice.items():
+		if isinstance(value, ir3.Value):
+			for use in get_var_uses(func, var):
+				num_changed += replace_variables_in_stmt(func, use, var, value)
+
+	# now that more things are constant, fold whatever we can (even the non-constant `x * 1` and such).
+	for blk in visited:
+		for stmt in blk.stmts:
+			if isinstance(stmt, ir3.AssignOp) or isinstance(stmt, ir3.AssignDotOp):
+				if (new_rhs := simplify_expr(stmt.rhs)) is not None:
+					stmt.rhs = new_rhs
+					def_use.update(stmt)
+					num_changed += 1
 
+	log_opt(func, "constant", "propagated", num_changed)
 
-	log_opt(func, "constant", "propagated", num_removed)
-	return num_removed > 0
+	# lastly, get rid of the blocks that can never run (they can't be reached anymore).
+	return remove_unreachable_blocks(func) or num_changed > 0
 
 
-def evaluate_constants(func: ir3.FuncDefn) -> bool:
-	# after we propagate copies and constants, we're likely left with a lot of constants to fold
+def meet_lattice_values(a: LatticeValue, b: LatticeValue) -> LatticeValue:
+	if a == SCCP_UNDEFINED:
+		return b
+	elif b == SCCP_UNDEFINED:
+		return a
+	elif isinstance(a, ir3.Value) and isinstance(b, ir3.Value) and a == b:
+		return a
+	else:
+		return SCCP_OVERDEFINED
+
 
-	eval_ops = {
+def fold_binary_op(lhs: ir3.Value, op: str, rhs: ir3.Value) -> Optional[ir3.Value]:
+	# returns the result of the operation on two constants, or None if it can't be (or shouldn't be) done.
+	eval_ops: Dict[str, Callable[[Any, Any], Any]] = {
 		"==": lambda a, b: a == b,
 		"!=": lambda a, b: a != b,
 		"<=": lambda a, b: a <= b,
@@ -466,128 +806,84 @@ def evaluate_constants(func: ir3.FuncDefn) -> bool:
 		"+":  lambda a, b: a + b,
 		"-":  lambda a, b: a - b,
 		"*":  lambda a, b: a * b,
-		"/":  lambda a, b: a // b,
+		"/":  lambda a, b: abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1),
 		"s+":  lambda a, b: a + b,
 	}
 
-	num_changed = 0
-	def expr_visitor(expr: ir3.Expr) -> ir3.Expr:
-		nonlocal eval_ops
-		nonlocal num_changed
-		if isinstance(expr, ir3.UnaryOp):
-			if isinstance(expr.expr, ir3.ConstantInt) and expr.op == "-":
-				num_changed += 1
-				return ir3.ValueExpr(expr.loc, ir3.ConstantInt(expr.expr.loc, -expr.expr.value))
+	if type(lhs) != type(rhs) or op not in eval_ops:
+		return None
 
-			elif isinstance(expr.expr, ir3.ConstantBool) and expr.op == "!":
-				num_changed += 1
-				return ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.expr.loc, not expr.expr.value))
-
-		elif isinstance(expr, ir3.BinaryOp):
-			if is_constant_value(expr.lhs) and is_constant_value(expr.rhs):
-				if type(expr.lhs) != type(expr.rhs):
-					return expr
-
-				def get_result(value: Any) -> Optional[ir3.Value]:
-					if isinstance(value, bool):
-						return ir3.ConstantBool(expr.loc, value)
-					elif isinstance(value, int):
-						return ir3.ConstantInt(expr.loc, value)
-					elif isinstance(value, str):
-						return ir3.ConstantString(expr.loc, value)
-					else:
-						return None
-
-				if isinstance(expr.lhs, ir3.ConstantInt) or isinstance(expr.lhs, ir3.ConstantBool)  \
-					or isinstance(expr.lhs, ir3.ConstantString):
-
-					res = get_result(eval_ops[expr.op](expr.lhs.value, expr.rhs.value)) # type: ignore
-					if res is not None:
-						num_changed += 1
-						return ir3.ValueExpr(expr.loc, res)
-
-			elif is_constant_value(expr.lhs) or is_constant_value(expr.rhs):
-				# these are not commutative, so do them first before swapping
-
-				# x / 1 = x
-				if isinstance(expr.rhs, ir3.ConstantInt) and expr.op == "/" and expr.rhs.value == 1:
-					num_changed += 1
-					return ir3.ValueExpr(expr.loc, expr.lhs)
-
-				# x - 0 = x
-				elif isinstance(expr.rhs, ir3.ConstantInt) and expr.op == "-" and expr.rhs.value == 0:
-					num_changed += 1
-					return ir3.ValueExpr(expr.loc, expr.lhs)
+	if not (isinstance(lhs, ir3.ConstantInt) or isinstance(lhs, ir3.ConstantBool) or isinstance(lhs, ir3.ConstantString)):
+		return None
 
-				# put the constant on the left just so we don't duplicate code
-				if is_constant_value(expr.rhs):
-					the_const = expr.rhs
-					not_const = expr.lhs
-				else:
-					the_const = expr.lhs
-					not_const = expr.rhs
-
-				# x * 0 = 0
-				if isinstance(the_const, ir3.ConstantInt) and expr.op == "*" and the_const.value == 0:
-					num_changed += 1
-					return ir3.ValueExpr(expr.loc, ir3.ConstantInt(expr.loc, 0))
+	# leave this for the program to find out about.
+	if op == "/" and rhs.value == 0: # type: ignore
+		return None
 
-				# x * 1 = x
-				elif isinstance(the_const, ir3.ConstantInt) and expr.op == "*" and the_const.value == 1:
-					num_changed += 1
-					return ir3.ValueExpr(expr.loc, not_const)
+	value = eval_ops[op](lhs.value, rhs.value) # type: ignore
+	if isinstance(value, bool):
+		return ir3.ConstantBool(lhs.loc, value)
+	elif isinstance(value, int):
+		# do what the machine would: division rounds towards zero (above), and everything wraps at 32 bits
+		return ir3.ConstantInt(lhs.loc, ((value + (1 << 31)) % (1 << 32)) - (1 << 31))
+	elif isinstance(value, str):
+		return ir3.ConstantString(lhs.loc, value)
+	else:
+		return None
 
-				# x + 0 = x
-				elif isinstance(the_const, ir3.ConstantInt) and expr.op == "+" and the_const.value == 0:
-					num_changed += 1
-					return ir3.ValueExpr(expr.loc, not_const)
 
-		return expr
+def fold_unary_op(op: str, value: ir3.Value) -> Optional[ir3.Value]:
+	if isinstance(value, ir3.ConstantInt) and op == "-":
+		return ir3.ConstantInt(value.loc, -value.value)
+	elif isinstance(value, ir3.ConstantBool) and op == "!":
+		return ir3.ConstantBool(value.loc, not value.value)
+	else:
+		return None
 
 
+def simplify_expr(expr: ir3.Expr) -> Optional[ir3.Expr]:
+	# folds constant operations and the usual identities; returns None if nothing changed.
+	if isinstance(expr, ir3.UnaryOp):
+		if (res := fold_unary_op(expr.op, expr.expr)) is not None:
+			return ir3.ValueExpr(expr.loc, res)
 
-	def stmt_visitor(stmt: ir3.Stmt) -> ir3.Stmt:
-		nonlocal eval_ops
-		nonlocal num_changed
+	elif isinstance(expr, ir3.BinaryOp):
+		if is_constant_value(expr.lhs) and is_constant_value(expr.rhs):
+			if (res := fold_binary_op(expr.lhs, expr.op, expr.rhs)) is not None:
+				return ir3.ValueExpr(expr.loc, res)
 
-		# this mostly involves conditional branches.
-		if isinstance(stmt, ir3.CondBranch):
-			# if the thing inside is already a constant:
-			if isinstance(stmt.cond, ir3.Value) and is_constant_value(stmt.cond):
-				num_changed += 1
-				if not isinstance(stmt.cond, ir3.ConstantBool):
-					print(f"fucky = {type(stmt.cond)}, '{stmt}'")
+		elif is_constant_value(expr.lhs) or is_constant_value(expr.rhs):
+			# these are not commutative, so do them first before swapping
 
-				assert isinstance(stmt.cond, ir3.ConstantBool)
-				if stmt.cond.value:
-					return ir3.Branch(stmt.loc, stmt.label)
-				else:
-					return cgpseudo.DummyStmt(stmt.loc)
-
-			elif isinstance(stmt.cond, ir3.RelOp):
-				if is_constant_value(stmt.cond.lhs) and is_constant_value(stmt.cond.rhs):
-					num_changed += 1
-					if eval_ops[stmt.cond.op](stmt.cond.lhs.value, stmt.cond.rhs.value): # type: ignore
-						return ir3.Branch(stmt.loc, stmt.label)
-					else:
-						return cgpseudo.DummyStmt(stmt.loc)
+			# x / 1 = x
+			if isinstance(expr.rhs, ir3.ConstantInt) and expr.op == "/" and expr.rhs.value == 1:
+				return ir3.ValueExpr(expr.loc, expr.lhs)
 
+			# x - 0 = x
+			elif isinstance(expr.rhs, ir3.ConstantInt) and expr.op == "-" and expr.rhs.value == 0:
+				return ir3.ValueExpr(expr.loc, expr.lhs)
 
-		elif isinstance(stmt, ir3.AssignOp) or isinstance(stmt, ir3.AssignDotOp):
-			stmt.rhs = expr_visitor(stmt.rhs)
+			# put the constant on the left just so we don't duplicate code
+			if is_constant_value(expr.rhs):
+				the_const = expr.rhs
+				not_const = expr.lhs
+			else:
+				the_const = expr.lhs
+				not_const = expr.rhs
 
-			# check if we are doing `x = x`
-			if isinstance(stmt.rhs, ir3.ValueExpr) and isinstance(stmt.rhs.value, ir3.VarRef):
-				if isinstance(stmt, ir3.AssignOp) and stmt.lhs == stmt.rhs.value.name:
-					num_changed += 1
-					return cgpseudo.DummyStmt(stmt.loc)
+			# x * 0 = 0
+			if isinstance(the_const, ir3.ConstantInt) and expr.op == "*" and the_const.value == 0:
+				return ir3.ValueExpr(expr.loc, ir3.ConstantInt(expr.loc, 0))
 
-		return stmt
+			# x * 1 = x
+			elif isinstance(the_const, ir3.ConstantInt) and expr.op == "*" and the_const.value == 1:
+				return ir3.ValueExpr(expr.loc, not_const)
 
-	visit_stmts(stmt_visitor, func)
+			# x + 0 = x
+			elif isinstance(the_const, ir3.ConstantInt) and expr.op == "+" and the_const.value == 0:
+				return ir3.ValueExpr(expr.loc, not_const)
 
-	log_opt(func, "constant", "folded", num_changed)
-	return num_changed > 0
+	return None
 
 
 def remove_unreachable_stmts(func: ir3.FuncDefn) -> bool:
@@ -600,10 +896,13 @@ def remove_unreachable_stmts(func: ir3.FuncDefn) -> bool:
 		if len(blk.stmts) < 2:
 			continue
 
+		removed_before = num_removed
+
 		# yeet dummies.
 		for s in blk.stmts[:]:
 			if isinstance(s, cgpseudo.DummyStmt):
 				blk.stmts.remove(s)
+				get_def_use(func).remove(s)
 				num_removed += 1
 
 		for i in range(0, len(blk.stmts)):
@@ -611,79 +910,404 @@ def remove_unreachable_stmts(func: ir3.FuncDefn) -> bool:
 				# remove all further statements.
 				for k in range(i + 1, len(blk.stmts)):
 					# just keep popping the (i + 1)th element
-					blk.stmts.pop(i + 1)
+					get_def_use(func).remove(blk.stmts.pop(i + 1))
 					num_removed += 1
 
 				break
 
+		# we might have removed a branch
+		if num_removed > removed_before:
+			for succ in func.cfg.update_edges(blk):
+				remove_phi_operands(func, succ, blk)
+
 	log_opt(func, "unreachable statement", "removed", num_removed)
 	return num_removed > 0
 
 
 
+def hoist_loop_invariants(func: ir3.FuncDefn) -> bool:
+	# loop-invariant code motion. anything in a loop that computes the same value on every iteration
+	# (because everything it uses is defined outside the loop, or is itself invariant) can be done
+	# once, in the loop's preheader. since we're in SSA, moving the definition up to a block that
+	# dominates the whole loop can't break anything that uses it.
+	#
+	# inner loops go first; their preheaders are inside the outer loops, so anything that is also
+	# invariant in an outer loop gets moved out again when we get to that one.
+
+	loops = find_loops(func)
 
+	def_blocks: Dict[str, ir3.BasicBlock] = dict()
+	for blk in func.blocks:
+		for stmt in blk.stmts:
+			for d in get_statement_defs(stmt):
+				def_blocks[d] = blk
+
+	num_hoisted = 0
+	for loop in loops:
+		# field loads can only be moved if nothing in the loop might store to a field.
+		clobbers = any(is_memory_clobber(stmt) for blk in loop.blocks for stmt in blk.stmts)
+
+		# things that might crash (field loads on null, division by zero) can only be moved out of
+		# blocks that always run before the loop is left; otherwise we might crash when the
+		# program wouldn't have.
+		exits = [ blk for blk in loop.blocks if any(s not in loop.blocks for s in func.cfg.successors[blk]) ]
+
+		def is_invariant(value: Union[ir3.Value, str]) -> bool:
+			name = value if isinstance(value, str) else (value.name if isinstance(value, ir3.VarRef) else None)
+			return (name is None) or (def_blocks.get(name) not in loop.blocks)
+
+		def can_hoist(stmt: ir3.AssignOp, blk: ir3.BasicBlock) -> bool:
+			expr = stmt.rhs
+			always_runs = all(func.cfg.dominates(blk, e) for e in exits)
+
+			if isinstance(expr, ir3.BinaryOp):
+				if expr.op == "/" and not (isinstance(expr.rhs, ir3.ConstantInt) and expr.rhs.value != 0):
+					if not always_runs:
+						return False
+
+				return is_invariant(expr.lhs) and is_invariant(expr.rhs)
+
+			elif isinstance(expr, ir3.UnaryOp):
+				return is_invariant(expr.expr)
+
+			elif isinstance(expr, ir3.DotOp):
+				return (not clobbers) and always_runs and is_invariant(expr.lhs)
+
+			# copies and constants are the business of the other passes, and calls and `new`s
+			# have to happen every time.
+			return False
+
+		# keep going until nothing new becomes invariant; the statements are collected in an order
+		# where everything comes after the things it uses.
+		invariants: List[Tuple[ir3.AssignOp, ir3.BasicBlock]] = []
+		found = True
+		while found:
+			found = False
+			for blk in func.blocks:
+				if blk not in loop.blocks:
+					continue
+
+				for stmt in blk.stmts:
+					if isinstance(stmt, ir3.AssignOp) and def_blocks.get(stmt.lhs) in loop.blocks and can_hoist(stmt, blk):
+						invariants.append((stmt, blk))
+						del def_blocks[stmt.lhs]
+						found = True
+
+		if len(invariants) == 0:
+			continue
 
+		preheader = get_preheader(func, loop, loops)
+		position = next(i for i, s in enumerate(preheader.stmts) if isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch))
 
-# helpers
+		for stmt, blk in invariants:
+			blk.stmts.remove(stmt)
+			preheader.stmts.insert(position, stmt)
+			def_blocks[stmt.lhs] = preheader
+			position += 1
+
+		num_hoisted += len(invariants)
+
+	log_opt(func, "loop-invariant expression", "hoisted", num_hoisted)
+	return num_hoisted > 0
+
+
+def reduce_induction_variables(func: ir3.FuncDefn) -> bool:
+	# strength reduction. a basic induction variable is a header phi that goes up by the same
+	# (invariant) amount every time round the loop; anything that multiplies it by an invariant then
+	# also goes up by a fixed amount every time, so it can get a phi of its own and be updated with an
+	# add, instead of doing the multiply on every iteration.
+	#
+	# if that leaves the original variable only being used to decide when to leave the loop, the test
+	# gets rewritten in terms of the new one (when we can tell that it won't overflow), so that the
+	# original can go away entirely.
+
+	loops = find_loops(func)
+	def_use = get_def_use(func)
+
+	def_blocks: Dict[str, ir3.BasicBlock] = dict()
+	for blk in func.blocks:
+		for stmt in blk.stmts:
+			for d in get_statement_defs(stmt):
+				def_blocks[d] = blk
+
+	names = set(v.name for v in func.params + func.vars)
+	def make_var(loc: util.Location, name: str) -> str:
+		while name in names:
+			name += "_"
+
+		names.add(name)
+		func.vars.append(ir3.VarDecl(loc, name, "Int"))
+		return name
+
+	num_reduced = 0
+	num_tests = 0
+	for loop in loops:
+		ivs = find_induction_variables(func, loop, def_blocks)
+		if len(ivs) == 0:
+			continue
+
+		def is_invariant(value: ir3.Value) -> bool:
+			# (parameters aren't defined anywhere, so they're invariant too)
+			def_blk = def_blocks.get(value.name) if isinstance(value, ir3.VarRef) else None
+			return def_blk is None or def_blk not in loop.blocks
+
+		candidates: List[Tuple[ir3.AssignOp, InductionVariable, ir3.Value]] = []
+		for blk in func.blocks:
+			if blk not in loop.blocks:
+				continue
+
+			for stmt in blk.stmts:
+				if not (isinstance(stmt, ir3.AssignOp) and isinstance(stmt.rhs, ir3.BinaryOp) and stmt.rhs.op == "*"):
+					continue
+
+				lhs, rhs = stmt.rhs.lhs, stmt.rhs.rhs
+				if isinstance(rhs, ir3.VarRef) and rhs.name in ivs:
+					lhs, rhs = rhs, lhs
+
+				if isinstance(lhs, ir3.VarRef) and lhs.name in ivs and is_invariant(rhs):
+					candidates.append((stmt, ivs[lhs.name], rhs))
+
+		if len(candidates) == 0:
+			continue
+
+		preheader = get_preheader(func, loop, loops)
+		position = next(i for i, s in enumerate(preheader.stmts) if isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch))
+
+		# iv -> [ (factor, phi, next) ] for each product of it that now has its own phi
+		reduced: Dict[str, List[Tuple[ir3.Value, str, str]]] = dict()
+
+		for stmt, iv, factor in candidates:
+			loc = stmt.loc
+			init = make_var(loc, f"{stmt.lhs}$init")
+			step = make_var(loc, f"{stmt.lhs}$step")
+			cur = make_var(loc, f"{stmt.lhs}$iv")
+			nxt = make_var(loc, f"{stmt.lhs}$next")
+
+			# work out where it starts and how much it goes up by before the loop; if those are
+			# constants, sccp will sort them out.
+			new_stmts: List[ir3.Stmt] = [
+				ir3.AssignOp(loc, init, ir3.BinaryOp(loc, iv.initial_value(), "*", factor)),
+				ir3.AssignOp(loc, step, ir3.BinaryOp(loc, iv.step, "*", factor))
+			]
+			for s in new_stmts:
+				preheader.stmts.insert(position, s)
+				def_blocks[cast(ir3.AssignOp, s).lhs] = preheader
+				position += 1
+
+			phi = cgpseudo.PhiNode(loc, cur, [ (ir3.VarRef(loc, init), preheader.name), (ir3.VarRef(loc, nxt), iv.latch.name) ])
+			loop.header.stmts.insert(0, phi)
+			def_blocks[cur] = loop.header
+
+			# it goes up right next to the original, so that it's always in step.
+			update = ir3.AssignOp(loc, nxt, ir3.BinaryOp(loc, ir3.VarRef(loc, cur), "+", ir3.VarRef(loc, step)))
+			blk = def_blocks[iv.update.lhs]
+			blk.stmts.insert(blk.stmts.index(iv.update) + 1, update)
+			def_blocks[nxt] = blk
+
+			stmt.rhs = ir3.ValueExpr(loc, ir3.VarRef(loc, cur))
+
+			for s in new_stmts + [ phi, update ]:
+				def_use.add(s)
+			def_use.update(stmt)
+
+			reduced.setdefault(iv.phi.lhs, []).append((factor, cur, nxt))
+			num_reduced += 1
+
+		counted = get_counted_loop(func, loop, ivs)
+		if counted is None or counted.iv.phi.lhs not in reduced:
+			continue
+
+		# any positive constant factor will do for the test, as long as nothing overflows.
+		iv = counted.iv
+		last = counted.init + counted.step * counted.trips
+		for factor, cur, nxt in reduced[iv.phi.lhs]:
+			if not (isinstance(factor, ir3.ConstantInt) and factor.value > 0):
+				continue
+
+			k = factor.value
+			if not all(-(1 << 31) <= v * k < (1 << 31) for v in [ counted.init, last, counted.bound ]):
+				continue
+
+			old_name = iv.update.lhs if counted.uses_next else iv.phi.lhs
+			new_name = nxt if counted.uses_next else cur
+
+			def rewrite(value: ir3.Value) -> ir3.Value:
+				if isinstance(value, ir3.VarRef) and value.name == old_name:
+					return ir3.VarRef(value.loc, new_name)
+				elif isinstance(value, ir3.ConstantInt):
+					return ir3.ConstantInt(value.loc, value.value * k)
+				else:
+					return value
+
+			compare = counted.compare
+			assert isinstance(compare.rhs, ir3.BinaryOp)
+			compare.rhs = ir3.BinaryOp(compare.loc, rewrite(compare.rhs.lhs), compare.rhs.op, rewrite(compare.rhs.rhs))
+			def_use.update(compare)
+			num_tests += 1
 
-T = TypeVar("T")
-K = TypeVar("K")
-def forward_dataflow(func: ir3.FuncDefn, all_stmts: List[ir3.Stmt], set_types: Type[T], all_things: List[K],
-	get_gens: Callable[[ir3.Stmt, List[K]], Set[T]], get_kills: Callable[[ir3.Stmt, List[K]], Set[T]],
-	union: bool) -> Tuple[List[Set[T]], List[Set[T]], List[Set[T]], List[Set[T]]]:
+			# the phi and its update only keep each other alive now, so nothing else would get rid of them.
+			if def_use.get_uses(iv.phi.lhs) == [ iv.update ] and def_use.get_uses(iv.update.lhs) == [ iv.phi ]:
+				for s in [ iv.phi, iv.update ]:
+					def_blocks.pop(cast(Union[ir3.AssignOp, cgpseudo.PhiNode], s).lhs).stmts.remove(s)
+					def_use.remove(s)
 
-	# forward dataflow analysis. determines the in/out for expressions.
-	# we do this on a statement basis. similar algorithm to liveness in cgliveness.py, but forward.
+				func.vars = [ v for v in func.vars if v.name not in [ iv.phi.lhs, iv.update.lhs ] ]
+
+			break
+
+	log_opt(func, "induction variable multiplication", "strength-reduced", num_reduced)
+	log_opt(func, "loop exit test", "rewrote", num_tests)
+	return num_reduced > 0
 
-	successors = compute_successors(func)
-	predecessors = compute_predecessors(func)
 
-	ins: List[Set[T]]  = list(map(lambda _: set(), all_stmts))
-	outs: List[Set[T]] = list(map(lambda _: set(), all_stmts))
+def unroll_loops(func: ir3.FuncDefn, factor: int) -> bool:
+	# small loops that go round a known number of times get `factor` copies of their body for every
+	# trip round, so the test and the jumps only happen once for every `factor` iterations. whatever
+	# is left over (if the trip count doesn't divide evenly) is peeled off into the preheader.
+	#
+	# the original statements stay where they are as the last copy, so everything that uses them
+	# after the loop (and the phis in the header) still works; the new copies all get fresh names.
 
-	gens: List[Set[T]] = list(map(lambda s: get_gens(s, all_things), all_stmts))
-	kills: List[Set[T]] = list(map(lambda s: get_kills(s, all_things), all_stmts))
+	# bigger loops don't have much to gain, and it's a lot of extra code.
+	max_body_size = 16
 
-	queue: List[int] = list(range(0, len(all_stmts)))
-	while len(queue) > 0:
-		n = queue.pop(0)
-		stmt = all_stmts[n]
+	loops = find_loops(func)
+	def_use = get_def_use(func)
 
-		old_out = copy(outs[n])
+	def_blocks: Dict[str, ir3.BasicBlock] = dict()
+	for blk in func.blocks:
+		for stmt in blk.stmts:
+			for d in get_statement_defs(stmt):
+				def_blocks[d] = blk
+
+	types = { v.name: v.type for v in func.params + func.vars }
+	def make_var(loc: util.Location, name: str, type: str) -> str:
+		while name in types:
+			name += "_"
+
+		types[name] = type
+		func.vars.append(ir3.VarDecl(loc, name, type))
+		return name
+
+	num_unrolled = 0
+	for loop in loops:
+		header = loop.header
+		if len(loop.latches) != 1 or len(loop.blocks) > 2:
+			continue
 
-		# dumb. python is dumb
-		if len(predecessors[n]) == 0:
-			ins[n] = set()
+		latch = loop.latches[0]
+		counted = get_counted_loop(func, loop, find_induction_variables(func, loop, def_blocks))
+		if counted is None or counted.trips < factor:
+			continue
+
+		# the header has to go straight to the latch (unless it is the latch); the latch ends with the test.
+		phis = get_phi_nodes(header)
+		if header is latch:
+			body = header.stmts[len(phis):-2]
+		elif isinstance(header.stmts[-1], ir3.Branch) and len(get_phi_nodes(latch)) == 0:
+			body = header.stmts[len(phis):-1] + latch.stmts[:-2]
 		else:
-			ins[n] = reduce((set.union if union else set.intersection), map(lambda p: outs[p], predecessors[n]))
+			continue
 
-		outs[n] = gens[n].union(ins[n] - kills[n])
-		# print(f"ins({n}):   {ins[n]}")
-		# print(f"outs({n}):  {outs[n]}")
-		# print(f"gens({n}):  {gens[n]}")
-		# print(f"kills({n}): {kills[n]}")
-		# print(f"preds({n}): {predecessors[n]}")
-		# print(f"succs({n}): {successors[n]}\n")
+		if len(body) > max_body_size or any(isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch)
+			or isinstance(s, ir3.ReturnStmt) for s in body):
+			continue
 
-		if old_out != outs[n] and n in successors:
-			queue.extend(successors[n])
+		def bind_phis(env: Dict[str, ir3.Value], suffix: str) -> Tuple[List[ir3.Stmt], Dict[str, str]]:
+			# objects are referred to by name, so the phis need to be given values that are variables.
+			stmts: List[ir3.Stmt] = []
+			renames: Dict[str, str] = dict()
+			for phi in phis:
+				value = env[phi.lhs]
+				if isinstance(value, ir3.VarRef):
+					renames[phi.lhs] = value.name
+				else:
+					var = make_var(phi.loc, f"{phi.lhs}${suffix}", types[phi.lhs])
+					stmts.append(ir3.AssignOp(phi.loc, var, ir3.ValueExpr(phi.loc, value)))
+					renames[phi.lhs] = var
+
+			return stmts, renames
+
+		def copy_body(env: Dict[str, ir3.Value], suffix: str) -> List[ir3.Stmt]:
+			# returns a copy of the body, where the header phis have the values in `env`; afterwards,
+			# `env` has the values that they would have on the next trip round.
+			stmts, renames = bind_phis(env, suffix)
+			for stmt in body:
+				new = deepcopy(stmt)
+				ssa.rename_uses(new, lambda n: renames.get(n, n))
+				for d in get_statement_defs(new):
+					renames[d] = make_var(new.loc, f"{d}${suffix}", types[d])
+					ssa.rename_def(new, renames[d])
+
+				stmts.append(new)
+
+			for phi in phis:
+				value = get_phi_value(phi, latch)
+				if isinstance(value, ir3.VarRef) and value.name in renames:
+					value = ir3.VarRef(value.loc, renames[value.name])
+
+				env[phi.lhs] = value
+
+			return stmts
+
+		preheader = get_preheader(func, loop, loops)
+
+		# peel off the leftovers first, so that the loop goes round a multiple of `factor` times.
+		env: Dict[str, ir3.Value] = { phi.lhs: get_phi_value(phi, preheader) for phi in phis }
+		peeled: List[ir3.Stmt] = []
+		for i in range(counted.trips % factor):
+			peeled += copy_body(env, f"p{i + 1}")
 
-	# print(f"func: {func.name}")
-	# for blk in func.blocks:
-	# 	print(f">> {blk.name}")
-	# 	for s in blk.stmts:
-	# 		print(f"{s.id:02}  {s}     -- {predecessors[s.id]}")
-	# 		print(f"  in =  {ins[s.id]}")
-	# 		print(f"  out = {outs[s.id]}")
+		position = next(i for i, s in enumerate(preheader.stmts) if isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch))
+		preheader.stmts[position:position] = peeled
 
-	return ins, outs, gens, kills
+		for phi in phis:
+			phi.values = [ (env[phi.lhs] if label == preheader.name else value, label) for value, label in phi.values ]
+			def_use.update(phi)
 
+		env = { phi.lhs: ir3.VarRef(phi.loc, phi.lhs) for phi in phis }
+		copies: List[ir3.Stmt] = []
+		for i in range(factor - 1):
+			copies += copy_body(env, f"u{i + 1}")
 
+		# and the original body is the last copy.
+		bindings, renames = bind_phis(env, f"u{factor}")
+		copies += bindings
+		for stmt in body:
+			ssa.rename_uses(stmt, lambda n: renames.get(n, n))
+			def_use.update(stmt)
 
+		# that includes phis that go round the loop unchanged (or get swapped around), and anything
+		# after the loop that uses the phis, since it sees what they were at the start of the last copy.
+		for phi in phis:
+			phi.values = [ (ssa.rename_value(value, lambda n: renames.get(n, n)) if label == latch.name else value, label)
+				for value, label in phi.values ]
+			def_use.update(phi)
 
+		loop_stmts = set(stmt for blk in loop.blocks for stmt in blk.stmts)
+		outside = dict.fromkeys(stmt for phi in phis for stmt in def_use.get_uses(phi.lhs) if stmt not in loop_stmts)
+		for stmt in outside:
+			ssa.rename_uses(stmt, lambda n: renames.get(n, n))
+			def_use.update(stmt)
 
+		header.stmts[len(phis):len(phis)] = copies
 
-def replace_variables_in_stmt(stmt: ir3.Stmt, old_name: str, new_value: ir3.Value) -> int:
+		for stmts, blk in [ (peeled, preheader), (copies, header) ]:
+			for stmt in stmts:
+				def_use.add(stmt)
+				for d in get_statement_defs(stmt):
+					def_blocks[d] = blk
+
+		util.log(f"opt({func.name}): unrolled loop at {header.name} by {factor} ({counted.trips} iterations, "
+			+ f"{counted.trips % factor} peeled)")
+		num_unrolled += 1
+
+	return num_unrolled > 0
+
+
+# helpers
+
+def replace_variables_in_stmt(func: ir3.FuncDefn, stmt: ir3.Stmt, old_name: str, new_value: ir3.Value) -> int:
 	total = 0
 	def visit(value: ir3.Value) -> ir3.Value:
 		nonlocal total
@@ -693,12 +1317,21 @@ def replace_variables_in_stmt(stmt: ir3.Stmt, old_name: str, new_value: ir3.Valu
 		else:
 			return value
 
-	if isinstance(stmt, ir3.AssignDotOp) and isinstance(new_value, ir3.VarRef):
-		if stmt.lhs1 == old_name:
+	# objects are referred to by name, so they can only be replaced by another variable.
+	if isinstance(new_value, ir3.VarRef):
+		if isinstance(stmt, ir3.AssignDotOp) and stmt.lhs1 == old_name:
 			stmt.lhs1 = new_value.name
 			total += 1
 
+		if (isinstance(stmt, ir3.AssignOp) or isinstance(stmt, ir3.AssignDotOp)) and isinstance(stmt.rhs, ir3.DotOp):
+			if stmt.rhs.lhs == old_name:
+				stmt.rhs.lhs = new_value.name
+				total += 1
+
 	visit_values_in_stmt(visit, stmt)
+	if total > 0:
+		get_def_use(func).update(stmt)
+
 	return total
 
 
@@ -772,6 +1405,9 @@ def visit_values_in_stmt(visitor_: Callable[[ir3.Value], Optional[ir3.Value]], s
 		else:
 			stmt.cond = visitor(stmt.cond)
 
+	elif isinstance(stmt, cgpseudo.PhiNode):
+		stmt.values = [ (visitor(value), label) for value, label in stmt.values ]
+
 
 
 def is_constant_value(value: ir3.Value) -> bool:
@@ -779,53 +1415,350 @@ def is_constant_value(value: ir3.Value) -> bool:
 		or isinstance(value, ir3.ConstantString) or isinstance(value, ir3.ConstantNull)
 
 
-def compute_predecessors(func: ir3.FuncDefn) -> Dict[int, Set[int]]:
-	predecessors: Dict[int, Set[int]] = dict()
-	for b in func.blocks:
-		first_id = b.stmts[0].id
+def get_phi_nodes(block: ir3.BasicBlock) -> List[cgpseudo.PhiNode]:
+	# they're always at the top of the block.
+	phis: List[cgpseudo.PhiNode] = []
+	for stmt in block.stmts:
+		if not isinstance(stmt, cgpseudo.PhiNode):
+			break
+		phis.append(stmt)
+
+	return phis
+
+
+def get_phi_value(phi: cgpseudo.PhiNode, pred: ir3.BasicBlock) -> ir3.Value:
+	return next(value for value, label in phi.values if label == pred.name)
+
+
+def get_trivial_phi_value(phi: cgpseudo.PhiNode) -> Optional[ir3.Value]:
+	# if the phi only ever takes one value (not counting itself), return that value.
+	value: Optional[ir3.Value] = None
+	for v, _ in phi.values:
+		if (isinstance(v, ir3.VarRef) and v.name == phi.lhs) or v == value:
+			continue
+		elif value is not None:
+			return None
+
+		value = v
+
+	return value
+
+
+def remove_phi_operands(func: ir3.FuncDefn, block: ir3.BasicBlock, pred: ir3.BasicBlock) -> None:
+	# call this when the edge from pred to block goes away.
+	for phi in get_phi_nodes(block):
+		phi.values = [ (value, label) for value, label in phi.values if label != pred.name ]
+		get_def_use(func).update(phi)
+
+
+class Loop:
+	"""
+	a natural loop: the header dominates everything in the loop, and the latches are the blocks
+	with a back edge to the header.
+	"""
+	def __init__(self, header: ir3.BasicBlock) -> None:
+		self.header = header
+		self.blocks: Set[ir3.BasicBlock] = set([ header ])
+		self.latches: List[ir3.BasicBlock] = []
+
+
+def find_loops(func: ir3.FuncDefn) -> List[Loop]:
+	# returns the natural loops of the function, innermost (well, smallest) first. back edges that go
+	# to the same header are counted as the same loop.
+	idoms = func.cfg.dominators()
+	loops: Dict[ir3.BasicBlock, Loop] = dict()
+
+	for blk in func.cfg.reverse_postorder():
+		for succ in func.cfg.successors[blk]:
+			if not func.cfg.dominates(succ, blk):
+				continue
+
+			loop = loops.setdefault(succ, Loop(succ))
+			loop.latches.append(blk)
+
+			# the loop is everything that can get to the latch without going through the header.
+			pending = [ blk ]
+			while len(pending) > 0:
+				b = pending.pop()
+				if b in loop.blocks or b not in idoms:
+					continue
+
+				loop.blocks.add(b)
+				pending.extend(b.predecessors)
+
+	return sorted(loops.values(), key = lambda l: len(l.blocks))
+
+
+def get_preheader(func: ir3.FuncDefn, loop: Loop, loops: List[Loop]) -> ir3.BasicBlock:
+	# returns a block that only jumps to the header, and that every way into the loop goes through.
+	# if there isn't one already, make one; it goes into every loop that the header is in.
+	outside = [ p for p in func.blocks if p in loop.header.predecessors and p not in loop.blocks ]
+	if len(outside) == 1 and func.cfg.successors[outside[0]] == [ loop.header ]:
+		return outside[0]
+
+	header = loop.header
+	name = f"{header.name}_pre"
+	while name in func.cfg.labels:
+		name += "_"
+
+	preheader = ir3.BasicBlock(header.loc, name, [ ir3.Branch(header.loc, header.name) ], set())
+	func.cfg.add_block(preheader, before = header)
+
+	types = { v.name: v.type for v in func.params + func.vars }
+
+	# the values that come from outside the loop need to be merged in the preheader now.
+	outside_names = set(p.name for p in outside)
+	for phi in get_phi_nodes(header):
+		incoming = [ (value, label) for value, label in phi.values if label in outside_names ]
+		if len(set(value for value, _ in incoming)) == 1:
+			value = incoming[0][0]
+		else:
+			var = f"{phi.lhs}$pre"
+			func.vars.append(ir3.VarDecl(phi.loc, var, types[phi.lhs]))
+			types[var] = types[phi.lhs]
+
+			merge = cgpseudo.PhiNode(phi.loc, var, incoming)
+			preheader.stmts.insert(len(get_phi_nodes(preheader)), merge)
+			get_def_use(func).add(merge)
+			value = ir3.VarRef(phi.loc, var)
+
+		phi.values = [ (v, l) for v, l in phi.values if l not in outside_names ] + [ (value, name) ]
+		get_def_use(func).update(phi)
+
+	for pred in outside:
+		for stmt in pred.stmts:
+			if (isinstance(stmt, ir3.Branch) or isinstance(stmt, ir3.CondBranch)) and stmt.label == header.name:
+				stmt.label = name
+
+		func.cfg.update_edges(pred)
+
+	for other in loops:
+		if other is not loop and header in other.blocks:
+			other.blocks.add(preheader)
+
+	return preheader
+
+
+class InductionVariable:
+	"""
+	a basic induction variable: a phi in a loop header that starts at some value (from outside the
+	loop), and goes up by `step` (which is invariant) every time round. `update` is the statement
+	that gives it its value for the next iteration, ie. `next = phi + step`.
+	"""
+	def __init__(self, phi: cgpseudo.PhiNode, update: ir3.AssignOp, step: ir3.Value, latch: ir3.BasicBlock) -> None:
+		self.phi = phi
+		self.update = update
+		self.step = step
+		self.latch = latch
+
+	def initial_value(self) -> ir3.Value:
+		return next(value for value, label in self.phi.values if label != self.latch.name)
+
+
+def find_induction_variables(func: ir3.FuncDefn, loop: Loop, def_blocks: Dict[str, ir3.BasicBlock]) -> Dict[str, InductionVariable]:
+	# returns the basic induction variables of the loop, by the name of their phi. only loops with
+	# one latch are looked at.
+	if len(loop.latches) != 1:
+		return dict()
+
+	latch = loop.latches[0]
+	def_use = get_def_use(func)
+
+	def is_invariant(value: ir3.Value) -> bool:
+		# (parameters aren't defined anywhere, so they're invariant too)
+		def_blk = def_blocks.get(value.name) if isinstance(value, ir3.VarRef) else None
+		return def_blk is None or def_blk not in loop.blocks
+
+	ivs: Dict[str, InductionVariable] = dict()
+	for phi in get_phi_nodes(loop.header):
+		back = [ value for value, label in phi.values if label == latch.name ]
+		if len(phi.values) != 2 or len(back) != 1 or not isinstance(back[0], ir3.VarRef):
+			continue
+
+		defs = def_use.get_defs(back[0].name)
+		if len(defs) != 1 or not isinstance(defs[0], ir3.AssignOp) or not isinstance(defs[0].rhs, ir3.BinaryOp):
+			continue
+
+		update, expr = defs[0], defs[0].rhs
+		if def_blocks.get(update.lhs) not in loop.blocks:
+			continue
+
+		me = ir3.VarRef(phi.loc, phi.lhs)
+		if expr.op == "+" and expr.lhs == me and is_invariant(expr.rhs):
+			step = expr.rhs
+		elif expr.op == "+" and expr.rhs == me and is_invariant(expr.lhs):
+			step = expr.lhs
+		elif expr.op == "-" and expr.lhs == me and isinstance(expr.rhs, ir3.ConstantInt):
+			step = ir3.ConstantInt(expr.rhs.loc, -expr.rhs.value)
+		else:
+			continue
+
+		ivs[phi.lhs] = InductionVariable(phi, update, step, latch)
+
+	return ivs
+
+
+class CountedLoop:
+	"""
+	a loop that can only be left from its latch, by a test that compares one of its induction variables
+	(or the next value of it) with a constant, where we know how many times it will go round.
+	"""
+	def __init__(self, iv: InductionVariable, compare: ir3.AssignOp, uses_next: bool, init: int, step: int,
+		bound: int, trips: int) -> None:
+		self.iv = iv
+		self.compare = compare
+		self.uses_next = uses_next
+		self.init = init
+		self.step = step
+		self.bound = bound
+		self.trips = trips
+
+
+def get_counted_loop(func: ir3.FuncDefn, loop: Loop, ivs: Dict[str, InductionVariable]) -> Optional[CountedLoop]:
+	if len(loop.latches) != 1 or len(ivs) == 0:
+		return None
+
+	latch = loop.latches[0]
+	if any(s not in loop.blocks for blk in loop.blocks if blk is not latch for s in func.cfg.successors[blk]):
+		return None
+
+	# the latch needs to end with `if (cond) goto A; goto B;`, where one of them is the header
+	# and the other one leaves the loop.
+	branches = [ s for s in latch.stmts if isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch) ]
+	if len(branches) != 2 or latch.stmts[-2:] != branches or not isinstance(branches[0], ir3.CondBranch) \
+		or not isinstance(branches[1], ir3.Branch) or not isinstance(branches[0].cond, ir3.VarRef):
+		return None
+
+	if func.cfg.block(branches[0].label) is loop.header and func.cfg.block(branches[1].label) not in loop.blocks:
+		keep_going = True
+	elif func.cfg.block(branches[1].label) is loop.header and func.cfg.block(branches[0].label) not in loop.blocks:
+		keep_going = False
+	else:
+		return None
+
+	defs = get_def_use(func).get_defs(branches[0].cond.name)
+	if len(defs) != 1 or not isinstance(defs[0], ir3.AssignOp) or not isinstance(defs[0].rhs, ir3.BinaryOp):
+		return None
 
-		# for the first stmt in the block, its preds are the set of all branches to it.
-		# for subsequent stmts, its pred is just the previous statement.
-		predecessors[first_id] = set()
-		for pred in b.predecessors:
-			for j in pred.stmts:
-				if isinstance(j, ir3.Branch) and j.label == b.name:
-					predecessors[first_id].add(j.id)
-				elif isinstance(j, ir3.CondBranch) and j.label == b.name:
-					predecessors[first_id].add(j.id)
+	compare = defs[0]
+	cond = cast(ir3.BinaryOp, compare.rhs)
+	lhs, op, rhs = cond.lhs, cond.op, cond.rhs
+	if op not in [ "<", "<=", ">", ">=", "==", "!=" ]:
+		return None
 
-		for k in range(1, len(b.stmts)):
-			x = b.stmts[k].id
-			predecessors[x] = set([x - 1])
+	if isinstance(lhs, ir3.ConstantInt):
+		lhs, op, rhs = rhs, { "<": ">", "<=": ">=", ">": "<", ">=": "<=", "==": "==", "!=": "!=" }[op], lhs
 
-	return predecessors
+	if not keep_going:
+		op = { "<": ">=", "<=": ">", ">": "<=", ">=": "<", "==": "!=", "!=": "==" }[op]
+
+	if not (isinstance(lhs, ir3.VarRef) and isinstance(rhs, ir3.ConstantInt)):
+		return None
+
+	for iv in ivs.values():
+		if lhs.name == iv.phi.lhs or lhs.name == iv.update.lhs:
+			break
+	else:
+		return None
+
+	init = iv.initial_value()
+	if not (isinstance(init, ir3.ConstantInt) and isinstance(iv.step, ir3.ConstantInt)):
+		return None
+
+	# the test sees the value from the start of the iteration if it uses the phi, and the one for the
+	# next iteration otherwise.
+	uses_next = (lhs.name == iv.update.lhs)
+	base = init.value if uses_next else init.value - iv.step.value
+
+	trips = get_trip_count(base, iv.step.value, op, rhs.value)
+	if trips is None:
+		return None
+
+	return CountedLoop(iv, compare, uses_next, init.value, iv.step.value, rhs.value, trips)
+
+
+def get_trip_count(base: int, step: int, op: str, bound: int) -> Optional[int]:
+	# the loop goes round once, and then keeps going while `base + step * t <op> bound`, for t = 1, 2, ...
+	# returns how many times it goes round, or None if we can't tell (or it never stops, or it overflows).
+	keep_going: Dict[str, Callable[[int, int], bool]] = {
+		"<": lambda a, b: a < b, "<=": lambda a, b: a <= b, ">": lambda a, b: a > b,
+		">=": lambda a, b: a >= b, "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+	}
+
+	if not keep_going[op](base + step, bound):
+		return 1
+
+	if op == "<=":
+		op, bound = "<", bound + 1
+	elif op == ">=":
+		op, bound = ">", bound - 1
+
+	if op == "<" and step > 0:
+		trips = -((base - bound) // step)
+	elif op == ">" and step < 0:
+		trips = -((bound - base) // -step)
+	elif op == "!=" and step != 0 and (bound - base) % step == 0 and (bound - base) // step > 0:
+		trips = (bound - base) // step
+	else:
+		return None
+
+	if not (-(1 << 31) <= base + step * trips < (1 << 31)):
+		return None
+
+	return trips
+
+
+def compute_predecessors(func: ir3.FuncDefn) -> Dict[int, Set[int]]:
+	# the statements need to be numbered for this.
+	return func.cfg.statement_edges()[1]
 
 
 def compute_successors(func: ir3.FuncDefn) -> Dict[int, Set[int]]:
-	labels: Dict[str, int] = { b.name: b.stmts[0].id for b in func.blocks }
-	successors: Dict[int, Set[int]] = dict()
+	# the statements need to be numbered for this.
+	return func.cfg.statement_edges()[0]
 
-	num_stmts = 1 + func.blocks[-1].stmts[-1].id
 
+def compute_block_graph(func: ir3.FuncDefn) -> dataflow.BlockGraph:
+	# this needs the statements to be numbered in order. since ir3 blocks can have a conditional
+	# branch in the middle, they get split after every jump (and return).
+	starts: List[int] = []
+	ends: List[int] = []
+	lasts: List[ir3.Stmt] = []
 	for b in func.blocks:
-		first_id = b.stmts[0].id
+		start = b.stmts[0].id
 		for stmt in b.stmts:
-			if isinstance(stmt, ir3.Branch):
-				successors[stmt.id] = set([ labels[stmt.label] ])
+			if isinstance(stmt, ir3.Branch) or isinstance(stmt, ir3.CondBranch) or isinstance(stmt, ir3.ReturnStmt):
+				starts.append(start)
+				ends.append(stmt.id + 1)
+				lasts.append(stmt)
+				start = stmt.id + 1
 
-			elif isinstance(stmt, ir3.CondBranch):
-				successors[stmt.id] = set([ labels[stmt.label] ])
-				if stmt.id + 1 < num_stmts:
-					successors[stmt.id].add(stmt.id + 1)
+		if start <= b.stmts[-1].id:
+			starts.append(start)
+			ends.append(b.stmts[-1].id + 1)
+			lasts.append(b.stmts[-1])
 
-			elif stmt.id + 1 < num_stmts:
-				successors[stmt.id] = set([stmt.id + 1])
+	block_at: Dict[int, int] = { s: i for i, s in enumerate(starts) }
+	def labels(name: str) -> int:
+		return block_at[func.cfg.block(name).stmts[0].id]
 
-			else:
-				assert isinstance(stmt, ir3.Branch) or isinstance(stmt, ir3.ReturnStmt)
-				successors[stmt.id] = set()
+	successors: List[List[int]] = []
+	for i, last in enumerate(lasts):
+		succs: List[int] = []
+		if isinstance(last, ir3.Branch):
+			succs.append(labels(last.label))
+
+		elif isinstance(last, ir3.CondBranch):
+			succs.append(labels(last.label))
+			if i + 1 < len(starts) and (i + 1) != succs[0]:
+				succs.append(i + 1)
 
-	return successors
+		elif not isinstance(last, ir3.ReturnStmt) and i + 1 < len(starts):
+			succs.append(i + 1)
+
+		successors.append(succs)
+
+	return dataflow.BlockGraph(starts, ends, successors)
 
 
 def get_statement_defs(stmt: ir3.Stmt) -> Set[str]:
@@ -874,8 +1807,10 @@ def get_expr_uses(expr: ir3.Expr) -> Set[str]:
 
 	elif isinstance(expr, ir3.FnCallExpr):
 		tmp: Set[str] = set()           # stupidest language ever designed
-		for arg in expr.call.args:
-			tmp.update(get_value_uses(arg) - expr.call.ignored_var_uses)
+		for i, arg in enumerate(expr.call.args):
+			# only the stack arguments were already used (by their StoreFunctionStackArg); the same
+			# variable might still need to be passed in a register too.
+			tmp.update(get_value_uses(arg) - (expr.call.ignored_var_uses if i >= 4 else set()))
 
 		return tmp
 
@@ -886,8 +1821,10 @@ def get_expr_uses(expr: ir3.Expr) -> Set[str]:
 def get_statement_uses(stmt: ir3.Stmt) -> Set[str]:
 	if isinstance(stmt, ir3.FnCallStmt):
 		tmp: Set[str] = set()           # stupidest language ever designed
-		for arg in stmt.call.args:
-			tmp.update(get_value_uses(arg) - stmt.call.ignored_var_uses)
+		for i, arg in enumerate(stmt.call.args):
+			# only the stack arguments were already used (by their StoreFunctionStackArg); the same
+			# variable might still need to be passed in a register too.
+			tmp.update(get_value_uses(arg) - (stmt.call.ignored_var_uses if i >= 4 else set()))
 
 		return tmp
 
@@ -901,7 +1838,7 @@ def get_statement_uses(stmt: ir3.Stmt) -> Set[str]:
 		return get_expr_uses(stmt.rhs)
 
 	elif isinstance(stmt, ir3.AssignDotOp):
-		return get_expr_uses(stmt.rhs)
+		return get_expr_uses(stmt.rhs).union([ stmt.lhs1 ])
 
 	elif isinstance(stmt, ir3.CondBranch):
 		if isinstance(stmt.cond, ir3.Value):
@@ -917,7 +1854,11 @@ def get_statement_uses(stmt: ir3.Stmt) -> Set[str]:
 		return set([stmt.ptr, stmt.rhs])
 
 	elif isinstance(stmt, cgpseudo.PhiNode):
-		return set(map(lambda x: x[0], stmt.values))
+		uses = set()
+		for value, _ in stmt.values:
+			uses.update(get_value_uses(value))
+
+		return uses
 
 	elif isinstance(stmt, ir3.StoreFunctionStackArg):
 		return set([ stmt.var ])
@@ -928,80 +1869,93 @@ def get_statement_uses(stmt: ir3.Stmt) -> Set[str]:
 
 
 
-def recompute_block_predecessors(func: ir3.FuncDefn) -> None:
-	block_names: Dict[str, ir3.BasicBlock] = dict()
-	for b in func.blocks:
-		block_names[b.name] = b
-		b.predecessors.clear()
+def renumber_statements(func: ir3.FuncDefn) -> List[ir3.Stmt]:
+	return func.cfg.renumber()
 
-	for b in func.blocks:
-		for s in b.stmts:
-			if isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch):
-				block_names[s.label].predecessors.add(b)
 
+def is_temporary(name: str) -> bool:
+	return name.startswith('_')
 
 
-def renumber_statements(func: ir3.FuncDefn) -> List[ir3.Stmt]:
-	counter = 0
-	all_stmts: List[ir3.Stmt] = []
+def log_opt(func: ir3.FuncDefn, kind: str, verb: str, num: int, singular: str = ""):
+	# this is very important to me.
+	if num == 1:
+		count = kind if singular == "" else singular
+	else:
+		count = kind + "s" if singular == "" else kind
 
-	for b in func.blocks:
-		for s in b.stmts:
-			s.id = counter
-			counter += 1
-			all_stmts.append(s)
+	if num > 0:
+		util.log(f"opt({func.name}): {verb} {num} {count}")
 
-	recompute_block_predecessors(func)
-	return all_stmts
+
+def get_var_uses(func: ir3.FuncDefn, var: str) -> List[ir3.Stmt]:
+	return get_def_use(func).get_uses(var)
 
 
+def get_var_assigns(func: ir3.FuncDefn, var: str) -> List[ir3.Stmt]:
+	return list(filter(lambda x: isinstance(x, ir3.AssignOp) or isinstance(x, cgpseudo.PhiNode),
+		get_def_use(func).get_defs(var)))
 
 
+def get_def_use(func: ir3.FuncDefn) -> DefUse:
+	if func.def_use is None:
+		func.def_use = DefUse(func)
 
+	return func.def_use
 
-def renumber_expressions(all_stmts: List[ir3.Stmt]) -> List[ir3.Expr]:
-	counter = 0
-	all_exprs: List[ir3.Expr] = []
-	for stmt in all_stmts:
-		# nothing else has expressions, kekw.
-		if isinstance(stmt, ir3.AssignOp) or isinstance(stmt, ir3.AssignDotOp):
-			stmt.rhs.id = counter
-			all_exprs.append(stmt.rhs)
-			counter += 1
 
-	return all_exprs
+class DefUse:
+	"""
+	an index from each variable to the statements that define and use it. it lives on the function
+	(see get_def_use), and whatever adds, removes or changes statements during optimisation needs to
+	keep it up to date. lowering rewrites everything, so cglower just throws it away.
+	"""
+	def __init__(self, func: ir3.FuncDefn) -> None:
+		# these are dicts (with no values) instead of sets, so that they stay in program order
+		# (at least until things start changing).
+		self.defs: Dict[str, Dict[ir3.Stmt, None]] = dict()
+		self.uses: Dict[str, Dict[ir3.Stmt, None]] = dict()
 
+		# what each statement was last seen to define and use, so we can take it back out.
+		self.stmt_vars: Dict[ir3.Stmt, Tuple[Set[str], Set[str]]] = dict()
 
-def is_temporary(name: str) -> bool:
-	return name.startswith('_')
+		for blk in func.blocks:
+			for stmt in blk.stmts:
+				self.add(stmt)
 
+	def add(self, stmt: ir3.Stmt) -> None:
+		defs = get_statement_defs(stmt)
+		uses = get_statement_uses(stmt)
+		self.stmt_vars[stmt] = (defs, uses)
 
-def log_opt(func: ir3.FuncDefn, kind: str, verb: str, num: int, singular: str = ""):
-	# this is very important to me.
-	if num == 1:
-		count = kind if singular == "" else singular
-	else:
-		count = kind + "s" if singular == "" else kind
+		for d in defs:
+			self.defs.setdefault(d, dict())[stmt] = None
 
-	if num > 0:
-		util.log(f"opt({func.name}): {verb} {num} {count}")
+		for u in uses:
+			self.uses.setdefault(u, dict())[stmt] = None
 
+	def remove(self, stmt: ir3.Stmt) -> None:
+		defs, uses = self.stmt_vars.pop(stmt)
+		for d in defs:
+			del self.defs[d][stmt]
 
-def get_var_uses(func: ir3.FuncDefn, var: str) -> List[ir3.Stmt]:
-	ret: List[ir3.Stmt] = []
-	for blk in func.blocks:
-		ret.extend(filter(lambda x: is_var_used_in_stmt(x, var), blk.stmts))
+		for u in uses:
+			del self.uses[u][stmt]
 
-	return ret
+	# call this after changing a statement in place
+	def update(self, stmt: ir3.Stmt) -> None:
+		self.remove(stmt)
+		self.add(stmt)
 
+	def replace(self, old: ir3.Stmt, new: ir3.Stmt) -> None:
+		self.remove(old)
+		self.add(new)
 
-def get_var_assigns(func: ir3.FuncDefn, var: str) -> List[ir3.Stmt]:
-	ret: List[ir3.Stmt] = []
-	for blk in func.blocks:
-		ret.extend(filter(lambda x: (isinstance(x, ir3.AssignOp) or isinstance(x, cgpseudo.PhiNode)) and x.lhs == var,
-			blk.stmts))
+	def get_defs(self, var: str) -> List[ir3.Stmt]:
+		return list(self.defs.get(var, ()))
 
-	return ret
+	def get_uses(self, var: str) -> List[ir3.Stmt]:
+		return list(self.uses.get(var, ()))
 
 
 def get_side_effects(expr: ir3.Expr) -> Optional[ir3.Stmt]:
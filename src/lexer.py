@@ -3,55 +3,120 @@
 from __future__ import annotations
 from typing import *
 
-from copy import copy
-from .util import StringView, Location, ParseException, TAB_WIDTH
+from array import array
+
+import re
+
+from enum import IntEnum
+
+from .util import StringView, SourceFile, Location, ParseException
+
+class TokenKind(IntEnum):
+	EOF             = 0
+	Comment         = 1
+	Identifier      = 2
+	ClassName       = 3
+	IntegerLiteral  = 4
+	StringLiteral   = 5
+
+	EqualsTo        = 6
+	NotEqual        = 7
+	GreaterEqual    = 8
+	LessThanEqual   = 9
+	LogicalAnd      = 10
+	LogicalOr       = 11
+	Plus            = 12
+	Minus           = 13
+	Asterisk        = 14
+	Slash           = 15
+	Period          = 16
+	LParen          = 17
+	RParen          = 18
+	LBrace          = 19
+	RBrace          = 20
+	LAngle          = 21
+	RAngle          = 22
+	Semicolon       = 23
+	Comma           = 24
+	Equal           = 25
+	Exclamation     = 26
+
+	# keywords must come last (see token_text)
+	kw_if           = 27
+	kw_new          = 28
+	kw_null         = 29
+	kw_main         = 30
+	kw_else         = 31
+	kw_this         = 32
+	kw_true         = 33
+	kw_false        = 34
+	kw_class        = 35
+	kw_while        = 36
+	kw_return       = 37
+	kw_readln       = 38
+	kw_println      = 39
+	kw_Int          = 40
+	kw_Void         = 41
+	kw_Bool         = 42
+	kw_String       = 43
+
+# for going from the raw values in a TokenArray back to kinds without the enum constructor
+TOKEN_KINDS: List[TokenKind] = list(TokenKind)
 
 class Token:
+	__slots__ = ("loc", "type", "end", "_text")
+
 	@overload
-	def __init__(self, txt: StringView, ty: str, loc: Location): ...
+	def __init__(self, txt: StringView, ty: TokenKind, loc: Location): ...
 
 	@overload
-	def __init__(self, txt: str, ty: str, loc: Location): ...
+	def __init__(self, txt: str, ty: TokenKind, loc: Location): ...
 
-	def __init__(self, txt: Union[StringView, str], ty: str, loc: Location):
-		self.loc: Location = loc
-		self.type: str = ty
-		self.text: str
+	# with an end offset, the text may be left out (None) to be sliced out of the source later
+	@overload
+	def __init__(self, txt: Optional[str], ty: TokenKind, loc: Location, end: int): ...
 
-		if isinstance(txt, str):
-			self.text = txt
+	def __init__(self, txt: Union[StringView, str, None], ty: TokenKind, loc: Location, end: int = -1):
+		self.loc: Location = loc
+		self.type: TokenKind = ty
+		self.end: int = end
+		self._text: Optional[str]
+
+		# if there's no text, it gets sliced out of the source (from loc up to end) on first use;
+		# most tokens (punctuation, keywords) never need it.
+		if isinstance(txt, str) or txt is None:
+			self._text = txt
 		elif isinstance(txt, StringView):
-			self.text = txt.string()
+			self._text = txt.string()
 		else:
 			raise TypeError(f"invalid type '{type(txt)}'")
 
+	@property
+	def text(self) -> str:
+		if self._text is None:
+			self._text = token_text(self.loc.file.buffer, self.type, self.loc.offset, self.end)
+
+		return self._text
+
+	@text.setter
+	def text(self, txt: str) -> None:
+		self._text = txt
+
 	def __str__(self) -> str:
-		return f"Token({self.type}, '{self.text}')"
+		# print the name, not the value, of the kind
+		return f"Token({self.type.name}, '{self.text}')"
 
 	def __eq__(self, other: object) -> bool:
 		return isinstance(other, Token) and (self.text == other.text) and (self.type == other.type)
 
 
-def eat_whitespace(stream: StringView, loc: Location) -> Tuple[StringView, Location]:
-	"""
-	consumes whitespace from the stream.
-	params:  input stream, current location
-	returns: remaining stream, new location
-	"""
-	while True:
-		if stream.starts_with_one_of(" \r"):
-			stream.remove_prefix(1)
-			loc = loc.advancing(1)
-		elif stream.starts_with("\t"):
-			stream.remove_prefix(1)
-			loc = loc.advancing(TAB_WIDTH)
-		elif stream.starts_with("\n"):
-			stream.remove_prefix(1)
-			loc = loc.advancing_line()
-		else:
-			break
+# everything up to the next backslash or closing quote can be taken in one go
+STRING_CHUNK_REGEX = re.compile(rb'[^"\\]+')
+LINE_REST_REGEX = re.compile(rb'[^\r\n]*')
 
-	return stream, loc
+SIMPLE_ESCAPES: Dict[str, str] = {
+	"\\": "\\", "b": "\b", "n": "\n", "t": "\t", "r": "\r", "\"": "\""
+}
 
 def read_string_literal(stream: StringView, loc: Location) -> Tuple[str, StringView, int]:
 	"""
@@ -60,7 +125,8 @@ def read_string_literal(stream: StringView, loc: Location) -> Tuple[str, StringV
 	returns: escaped string, remaining stream, bytes consumed
 	"""
 	assert stream.starts_with('"')
-	value: str = ""
+	buffer = stream.buffer
+	parts: List[str] = []
 
 	def read_one_char(stream: StringView, index: int, msg: str) -> Tuple[int, str]:
 		if index + 1 == stream.size():
@@ -70,23 +136,21 @@ def read_string_literal(stream: StringView, loc: Location) -> Tuple[str, StringV
 
 	idx: int = 1
 	while idx < stream.size():
-		if stream[idx] == ord("\\"):
+		if (chunk := STRING_CHUNK_REGEX.match(buffer, idx)) is not None:
+			# bytes map 1:1 to characters in string literals
+			parts.append(str(chunk.group(), "latin-1"))
+			idx = chunk.end()
 
+		elif stream[idx] == ord('"'):
+			return "".join(parts), stream.drop(idx + 1), idx + 1
+
+		else:
 			next: str
 			idx, next = read_one_char(stream, idx, "unterminated '\\' escape")
 
-			if next == "\\":
-				value += "\\"
-			elif next == "b":
-				value += "\b"
-			elif next == "n":
-				value += "\n"
-			elif next == "t":
-				value += "\t"
-			elif next == "r":
-				value += "\r"
-			elif next == "\"":
-				value += "\""
+			if (esc_char := SIMPLE_ESCAPES.get(next)) is not None:
+				parts.append(esc_char)
+				idx += 1
 
 			elif next.isdigit():
 				for i in range(0, 3):
@@ -104,10 +168,7 @@ def read_string_literal(stream: StringView, loc: Location) -> Tuple[str, StringV
 				if esc > 127:
 					raise ParseException(loc.advancing(idx), f"invalid ASCII escape; maximum value is 127, got {esc}")
 
-				value += chr(esc)
-
-				# we incremented idx manually, so skip
-				continue
+				parts.append(chr(esc))
 
 			elif next == 'x':
 				for i in range(1, 3):
@@ -131,10 +192,7 @@ def read_string_literal(stream: StringView, loc: Location) -> Tuple[str, StringV
 				if esc > 127:
 					raise ParseException(loc.advancing(idx), f"invalid ASCII escape; maximum value is 127, got {esc}")
 
-				value += chr(esc)
-
-				# we incremented idx manually, so skip
-				continue
+				parts.append(chr(esc))
 
 			elif next == "\r" or next == "\n":
 				raise ParseException(loc.advancing(idx), "unescaped newline in string literal")
@@ -142,160 +200,196 @@ def read_string_literal(stream: StringView, loc: Location) -> Tuple[str, StringV
 			else:
 				raise ParseException(loc.advancing(idx), f"invalid escape sequence '\\{next}' in string literal")
 
+	# point at the end of the line that the literal started on, not wherever the file happens to end
+	eol = LINE_REST_REGEX.match(buffer, 1).end()    # type: ignore
+	raise ParseException(loc.advancing(eol), f"unterminated string literal, expected '\"'")
+
+
+# the lexing engine proper. rather than peeling one character at a time off a StringView (which
+# allocates a new memoryview for every character we look at), we scan the whole buffer once with a
+# precompiled regex, and produce a flat array of (kind, start, end) triples.
+
+KEYWORDS: Dict[bytes, TokenKind] = {
+	kind.name[3:].encode(): kind for kind in TokenKind if kind.name.startswith("kw_")
+}
+
+TWO_CHAR_OPERATORS: Dict[bytes, TokenKind] = {
+	b"==": TokenKind.EqualsTo,      b"!=": TokenKind.NotEqual,
+	b">=": TokenKind.GreaterEqual,  b"<=": TokenKind.LessThanEqual,
+	b"&&": TokenKind.LogicalAnd,    b"||": TokenKind.LogicalOr
+}
+
+# single-character punctuation, indexed by byte
+PUNCTUATION: List[Optional[TokenKind]] = [ None ] * 256
+for c, kind in [
+	("+", TokenKind.Plus),      ("-", TokenKind.Minus),     ("*", TokenKind.Asterisk),
+	("/", TokenKind.Slash),     (".", TokenKind.Period),    ("(", TokenKind.LParen),
+	(")", TokenKind.RParen),    ("{", TokenKind.LBrace),    ("}", TokenKind.RBrace),
+	("<", TokenKind.LAngle),    (">", TokenKind.RAngle),    (";", TokenKind.Semicolon),
+	(",", TokenKind.Comma),     ("=", TokenKind.Equal),     ("!", TokenKind.Exclamation)
+]:
+	PUNCTUATION[ord(c)] = kind
+
+# the order of the alternatives matters (eg. '//' must come before '/', and '==' before '=').
+# note that in verbose mode, whitespace inside a character class is still significant.
+TOKEN_REGEX = re.compile(rb"""
+	[ \t\r\n]*
+	(?:
+		([a-z][A-Za-z0-9_]*)                        # 1: identifier (or keyword)
+	|	(//[^\r\n]*)                                # 2: line comment
+	|	(/\*)                                       # 3: block comment; nesting is handled by hand
+	|	(\*/)                                       # 4: unpaired end-of-comment
+	|	(==|!=|>=|<=|&&|\|\|)                        # 5: two-character operators
+	|	([-+*/.(){}<>;,=!])                         # 6: single-character punctuation
+	|	([A-Z][A-Za-z0-9_]*)                        # 7: class name (or builtin type)
+	|	([0-9]+)                                    # 8: integer literal
+	|	(")                                         # 9: string literal; escapes are handled by hand
+	|	(\Z)                                        # 10: end of input
+	)""", re.VERBOSE)
+
+WHITESPACE_REGEX = re.compile(rb"[ \t\r\n]*")
+COMMENT_DELIM_REGEX = re.compile(rb"/\*|\*/")
+
+
+def scan_block_comment(buffer: memoryview, start: int, origin: Location) -> int:
+	"""
+	finds the end of a (possibly nested) block comment.
+	params:  input buffer, offset of the opening '/*', location of the start of the buffer
+	returns: offset just past the matching '*/'
+	"""
+	nesting = 1
+	pos = start + 2
+	while nesting > 0:
+		m = COMMENT_DELIM_REGEX.search(buffer, pos)
+		if m is None:
+			raise ParseException(origin.advancing(start), "unexpected end of input (expected '*/')")
 
-		elif stream[idx] == ord('"'):
-			return value, stream.drop(idx + 1), idx + 1
-		else:
-			value += chr(stream[idx])
-
-		idx += 1
+		nesting += (1 if m.group() == b"/*" else -1)
+		pos = m.end()
 
-	raise ParseException(loc.advancing(idx), f"unterminated string literal, expected '\"'")
+	return pos
 
 
-def read_identifier(stream: StringView) -> Tuple[str, StringView]:
+def scan_token(buffer: memoryview, pos: int, origin: Location) -> Tuple[TokenKind, int, int, Optional[str]]:
 	"""
-	reads an identifier from the stream. note that the first character's validity is
-	expected to be validated by the caller (since it can only be a letter)
-
-	params:  input stream
-	returns: identifier string, remaining stream
+	scans the next token, skipping any whitespace at `pos`.
+	params:  input buffer, offset, location of the start of the buffer
+	returns: token kind, start offset, end offset, unescaped value (string literals only)
 	"""
-	num_chars: int = 0
-	valid_chars: str = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_"
-	while stream.drop(num_chars).starts_with_one_of(valid_chars):
-		num_chars += 1
+	m = TOKEN_REGEX.match(buffer, pos)
+	if m is None:
+		start = WHITESPACE_REGEX.match(buffer, pos).end()    # type: ignore
+		raise ParseException(origin.advancing(start), f"invalid token '{chr(buffer[start])}'")
+
+	# every alternative is a group (at worst, the \Z one), so something always matched
+	group = m.lastindex
+	assert group is not None
+
+	start, end = m.span(group)
+
+	if group == 1:
+		return KEYWORDS.get(m.group(1), TokenKind.Identifier), start, end, None
 
-	return stream.take(num_chars).string(), stream.drop(num_chars)
+	elif group == 6:
+		return PUNCTUATION[buffer[start]], start, end, None     # type: ignore
 
+	elif group == 5:
+		return TWO_CHAR_OPERATORS[m.group(5)], start, end, None
 
+	elif group == 7:
+		return KEYWORDS.get(m.group(7), TokenKind.ClassName), start, end, None
 
+	elif group == 8:
+		return TokenKind.IntegerLiteral, start, end, None
 
+	elif group == 2:
+		return TokenKind.Comment, start, end, None
 
-# return (new_token, rest_of_the_stream)
-def read_token(stream: StringView, loc: Location) -> Tuple[Token, StringView, Location]:
-	stream, loc = eat_whitespace(stream, loc)
+	elif group == 3:
+		return TokenKind.Comment, start, scan_block_comment(buffer, start, origin), None
 
-	if stream.empty():
-		return Token("", "EOF", loc), stream, loc
+	elif group == 9:
+		value, _, n = read_string_literal(StringView(buffer[start:]), origin.advancing(start))
+		return TokenKind.StringLiteral, start, start + n, value
 
-	if stream.starts_with("=="):
-		return Token(stream.take_prefix(2), "EqualsTo", loc), stream, loc.advancing(2)
+	elif group == 4:
+		raise ParseException(origin.advancing(start), "illegal unpaired '*/'")
 
-	elif stream.starts_with("!="):
-		return Token(stream.take_prefix(2), "NotEqual", loc), stream, loc.advancing(2)
+	else:
+		return TokenKind.EOF, start, end, None
 
-	elif stream.starts_with(">="):
-		return Token(stream.take_prefix(2), "GreaterEqual", loc), stream, loc.advancing(2)
 
-	elif stream.starts_with("<="):
-		return Token(stream.take_prefix(2), "LessThanEqual", loc), stream, loc.advancing(2)
+def token_text(buffer: memoryview, kind: TokenKind, start: int, end: int) -> str:
+	text = str(buffer[start:end], "utf-8")
 
-	elif stream.starts_with("&&"):
-		return Token(stream.take_prefix(2), "LogicalAnd", loc), stream, loc.advancing(2)
+	# lowercase the rest of the identifier (keywords included)
+	if kind == TokenKind.Identifier or kind == TokenKind.ClassName or kind >= TokenKind.kw_if:
+		return text[0] + text[1:].lower()
 
-	elif stream.starts_with("||"):
-		return Token(stream.take_prefix(2), "LogicalOr", loc), stream, loc.advancing(2)
+	return text
 
-	elif stream.starts_with('"'):
-		string, rest, n = read_string_literal(stream, loc)
-		return Token(string, "StringLiteral", loc), rest, loc.advancing(n)
 
-	elif stream.starts_with_one_of(b"0123456789"):
-		nums = stream.take_while(lambda x: ord('0') <= ord(x) <= ord('9'))
-		return Token(nums, "IntegerLiteral", loc), stream.drop(nums.size()), loc.advancing(nums.size())
+class TokenArray:
+	"""
+	the output of the lexer: one (kind, start, end) entry per token, including the final EOF. string
+	literals are the only tokens whose text is not a slice of the buffer, so their values are kept on
+	the side. if lexing failed, the array stops short of the EOF and `error` is set; it is up to the
+	consumer to report it once it actually gets there.
+	"""
+	def __init__(self, source: SourceFile) -> None:
+		self.source: SourceFile = source
+		self.kinds: array = array("B")
+		self.starts: array = array("L")
+		self.ends: array = array("L")
+		self.strings: Dict[int, str] = dict()
+		self.error: Optional[ParseException] = None
 
-	elif stream.starts_with("//"):
-		line: StringView = stream.take_while(lambda x: x != "\n" and x != "\r")
-		return Token(line, "Comment", loc), stream.drop(line.size()), loc.advancing(line.size())
+	def __len__(self) -> int:
+		return len(self.kinds)
 
-	elif stream.starts_with("/*"):
-		comment: StringView = stream.clone()
+	def type(self, i: int) -> TokenKind:
+		return TOKEN_KINDS[self.kinds[i]]
 
-		stream.remove_prefix(2)
-		nesting = 1
+	def text(self, i: int) -> str:
+		if self.kinds[i] == TokenKind.StringLiteral:
+			return self.strings[i]
 
-		new_loc: Location = loc
-		while nesting > 0 and not stream.empty():
-			if stream.starts_with("/*"):
-				new_loc = new_loc.advancing(2)
-				stream.remove_prefix(2)
-				nesting += 1
-			elif stream.starts_with("*/"):
-				new_loc = new_loc.advancing(2)
-				stream.remove_prefix(2)
-				nesting -= 1
-			else:
-				if chr(stream[0]) in ['\r', '\n', '\t', ' ' ]:
-					stream, new_loc = eat_whitespace(stream, new_loc)
-				else:
-					new_loc = new_loc.advancing(1)
-					stream.remove_prefix(1)
-
-		if nesting > 0:
-			raise ParseException(loc, "unexpected end of input (expected '*/')")
-
-		content: StringView = comment.drop_last(stream.size())
-		return Token(content, "Comment", loc), stream, new_loc
-
-	elif stream.starts_with("*/"):
-		raise ParseException(loc, "illegal unpaired '*/'")
-
-	elif stream.starts_with_one_of("abcdefghijklmnopqrstuvwxyz"):
-		ident, rest = read_identifier(stream)
-
-		tok_type: str = "Identifier"
-		if ident == "if":           tok_type = "kw_if"
-		elif ident == "new":        tok_type = "kw_new"
-		elif ident == "null":       tok_type = "kw_null"
-		elif ident == "main":       tok_type = "kw_main"
-		elif ident == "else":       tok_type = "kw_else"
-		elif ident == "this":       tok_type = "kw_this"
-		elif ident == "true":       tok_type = "kw_true"
-		elif ident == "false":      tok_type = "kw_false"
-		elif ident == "class":      tok_type = "kw_class"
-		elif ident == "while":      tok_type = "kw_while"
-		elif ident == "return":     tok_type = "kw_return"
-		elif ident == "readln":     tok_type = "kw_readln"
-		elif ident == "println":    tok_type = "kw_println"
-
-		# lowercase the rest of the identififer
-		ident = ident[0] + "".join(map(str.lower, ident[1:]))
-
-		return Token(ident, tok_type, loc), stream.drop(len(ident)), loc.advancing(len(ident))
-
-	elif stream.starts_with_one_of("ABCDEFGHIJKLMNOPQRSTUVWXYZ"):
-		ident, rest = read_identifier(stream)
-
-		tok_type = "ClassName"
-		if ident == "Int":      tok_type = "kw_Int"
-		elif ident == "Void":   tok_type = "kw_Void"
-		elif ident == "Bool":   tok_type = "kw_Bool"
-		elif ident == "String": tok_type = "kw_String"
-
-		# lowercase the rest of the identififer
-		ident = ident[0] + "".join(map(str.lower, ident[1:]))
-
-		return Token(ident, tok_type, loc), stream.drop(len(ident)), loc.advancing(len(ident))
+		return token_text(self.source.buffer, self.type(i), self.starts[i], self.ends[i])
 
-	else:
-		first_char: str = chr(stream[0])
-		tok_type = ""
-		if first_char == '+':   tok_type = "Plus"
-		elif first_char == '-': tok_type = "Minus"
-		elif first_char == '*': tok_type = "Asterisk"
-		elif first_char == '/': tok_type = "Slash"
-		elif first_char == '.': tok_type = "Period"
-		elif first_char == '(': tok_type = "LParen"
-		elif first_char == ')': tok_type = "RParen"
-		elif first_char == '{': tok_type = "LBrace"
-		elif first_char == '}': tok_type = "RBrace"
-		elif first_char == '<': tok_type = "LAngle"
-		elif first_char == '>': tok_type = "RAngle"
-		elif first_char == ';': tok_type = "Semicolon"
-		elif first_char == ',': tok_type = "Comma"
-		elif first_char == '=': tok_type = "Equal"
-		elif first_char == '!': tok_type = "Exclamation"
-		else:                   raise ParseException(loc, f"invalid token '{first_char}'")
-
-		return Token(first_char, tok_type, loc), stream.drop(1), loc.advancing(1)
+	def loc(self, i: int) -> Location:
+		return Location(self.source, self.starts[i])
+
+	def to_tokens(self) -> Iterator[Token]:
+		"""materialises Token objects in order, raising any lexing error at the end"""
+		for i in range(len(self)):
+			yield Token(self.strings.get(i), self.type(i), self.loc(i), self.ends[i])
+
+		if self.error is not None:
+			raise self.error
+
+
+def tokenise(source: SourceFile) -> TokenArray:
+	buffer = source.buffer
+	origin = Location(source, 0)
+	tokens = TokenArray(source)
+
+	kinds, starts, ends = tokens.kinds, tokens.starts, tokens.ends
+	pos = 0
+
+	try:
+		while True:
+			kind, start, pos, value = scan_token(buffer, pos, origin)
+			if value is not None:
+				tokens.strings[len(kinds)] = value
+
+			kinds.append(kind)
+			starts.append(start)
+			ends.append(pos)
+
+			if kind == TokenKind.EOF:
+				break
+
+	except ParseException as e:
+		tokens.error = e
+
+	return tokens
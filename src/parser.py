@@ -3,48 +3,83 @@
 from __future__ import annotations
 from typing import *
 from copy import *
+from collections import deque
 
 from . import ast
 
 from .lexer import *
-from .util import StringView, print_warning
+from .util import SourceFile, print_warning, log
 
 class ParserState:
-	def __init__(self, filename: str, s: StringView):
-		self.stream: StringView = s
-		self.loc: Location = Location(filename, 0, 0)
-
-	def peek(self) -> Token:
-		s = self.stream.clone()
-		l = deepcopy(self.loc)
-		while True:
-			tok, s, l = read_token(s, l)
-			if tok.type != "Comment":
-				return tok
+	# how many tokens past the current one the parser is allowed to look at
+	LOOKAHEAD = 4
+
+	def __init__(self, source: SourceFile):
+		self.source: SourceFile = source
+		self.origin: Location = Location(source, 0)
+		self.loc: Location = self.origin
+
+		# where the lexer is up to; this runs ahead of `loc` by however many tokens are buffered.
+		self.lex_offset: int = 0
+
+		# each entry is (token, offset of the leading comment if any, offset after the token).
+		# comments never make it in here, so peeking is just indexing.
+		self.lookahead: Deque[Tuple[Token, int, int]] = deque()
+
+		self.lexer_calls: int = 0
+		self.tokens_consumed: int = 0
+
+	def fill(self, n: int) -> None:
+		assert n < ParserState.LOOKAHEAD
+		while len(self.lookahead) <= n:
+			# once we hit the end, just keep handing out the same EOF.
+			if len(self.lookahead) > 0 and self.lookahead[-1][0].type == TokenKind.EOF:
+				self.lookahead.append(self.lookahead[-1])
+				continue
+
+			lead: Optional[int] = None
+			while True:
+				self.lexer_calls += 1
+				kind, start, self.lex_offset, value = scan_token(self.source.buffer, self.lex_offset, self.origin)
+
+				if lead is None:
+					lead = start
+
+				if kind != TokenKind.Comment:
+					break
+
+			tok = Token(value, kind, Location(self.source, start), self.lex_offset)
+			self.lookahead.append((tok, lead, self.lex_offset))
+
+	def peek(self, n: int = 0) -> Token:
+		self.fill(n)
+		return self.lookahead[n][0]
 
 	def next(self) -> Token:
-		while True:
-			tok, self.stream, self.loc = read_token(self.stream, self.loc)
-			if tok.type != "Comment":
-				return tok
+		self.fill(0)
+		tok, _, end = self.lookahead.popleft()
+		self.loc = Location(self.source, end)
+		self.tokens_consumed += 1
+		return tok
 
-	def next_if(self, tok_type: str) -> Optional[Token]:
+	def next_if(self, tok_type: TokenKind) -> Optional[Token]:
 		if self.peek().type == tok_type:
 			return self.next()
 		else:
 			return None
 
 	def skip_whitespace(self) -> None:
-		self.stream, self.loc = eat_whitespace(self.stream, self.loc)
+		self.fill(0)
+		self.loc = Location(self.source, self.lookahead[0][1])
 
 	def empty(self) -> bool:
-		return self.peek().type == "EOF"
+		return self.peek().type == TokenKind.EOF
 
-	def expect(self, tok_type: str, get_msg: Union[str, Callable[[Token], str]] = None) -> Token:
+	def expect(self, tok_type: TokenKind, get_msg: Union[str, Callable[[Token], str]] = None) -> Token:
 		tok = self.next()
 		if tok.type != tok_type:
 			if get_msg is None:
-				tok_type_str = tok_type[3:] if tok_type.startswith('kw_') else tok_type
+				tok_type_str = tok_type.name[3:] if tok_type.name.startswith('kw_') else tok_type.name
 				if self.empty():
 					raise ParseException(self.loc, f"unexpected end of input; expected '{tok_type_str}'")
 				else:
@@ -60,104 +95,113 @@ class ParserState:
 
 	def expect_semicolon(self):
 		old_loc = self.loc
-		if (tok := self.next()).type != "Semicolon":
+		if (tok := self.next()).type != TokenKind.Semicolon:
 			if self.empty():
 				raise ParseException(old_loc, f"unexpected end of input; expected ';' after statement")
 			else:
 				raise ParseException(old_loc, f"expected ';' after statement")
 
 
+TYPENAME_TOKENS: Set[TokenKind] = {
+	TokenKind.kw_Int, TokenKind.kw_Bool, TokenKind.kw_Void, TokenKind.kw_String, TokenKind.ClassName
+}
+
+# binding power of each binary operator, keyed by token kind
+BINARY_OPERATORS: Dict[TokenKind, int] = {
+	TokenKind.Asterisk:         69,     TokenKind.Slash:            69,
+	TokenKind.Plus:             68,     TokenKind.Minus:            68,
+	TokenKind.LAngle:           67,     TokenKind.RAngle:           67,
+	TokenKind.LessThanEqual:    67,     TokenKind.GreaterEqual:     67,
+	TokenKind.EqualsTo:         67,     TokenKind.NotEqual:         67,
+	TokenKind.LogicalAnd:       66,
+	TokenKind.LogicalOr:        65
+}
+
+UNARY_OPERATORS: Dict[TokenKind, str] = {
+	TokenKind.Exclamation:  '!',
+	TokenKind.Minus:        '-'
+}
+
 def is_typename(tok: Token) -> bool:
-	return tok.type in ["kw_Int", "kw_Bool", "kw_Void", "kw_String", "ClassName"]
+	return tok.type in TYPENAME_TOKENS
 
 def get_precedence(tok: Token) -> int:
-	if tok.type in ["Asterisk", "Slash"]:
-		return 69
-	elif tok.type in ["Plus", "Minus"]:
-		return 68
-	elif tok.type in ["LAngle", "RAngle", "LessThanEqual", "GreaterEqual", "EqualsTo", "NotEqual"]:
-		return 67
-	elif tok.type == "LogicalAnd":
-		return 66
-	elif tok.type == "LogicalOr":
-		return 65
-	else:
-		return -1
+	return BINARY_OPERATORS.get(tok.type, -1)
 
 
 # expects the head to be '('
 def parse_func_call(ps: ParserState, callee: ast.Expr) -> ast.FuncCall:
-	ps.expect("LParen", f"expected '(' for function call")
+	ps.expect(TokenKind.LParen, f"expected '(' for function call")
 
 	arg_list: List[ast.Expr] = []
-	while not ps.empty() and ps.peek().type != "RParen":
+	while not ps.empty() and ps.peek().type != TokenKind.RParen:
 		arg_list.append(parse_expr(ps))
 
-		if ps.peek().type == "RParen":
+		if ps.peek().type == TokenKind.RParen:
 			break
-		elif ps.next_if("Comma"):
+		elif ps.next_if(TokenKind.Comma):
 			pass
 		else:
 			raise ParseException(ps.loc, f"unexpected token '{ps.peek().text}'")
 
-	ps.expect("RParen")
+	ps.expect(TokenKind.RParen)
 	return ast.FuncCall(callee.loc, callee, arg_list)
 
 
 def parse_atom_chain(ps: ParserState, lhs: ast.Expr) -> ast.Expr:
-	if tok := ps.next_if("Period"):
-		ident = ps.expect("Identifier", f"expected identifier after '.'")
+	while tok := ps.next_if(TokenKind.Period):
+		ident = ps.expect(TokenKind.Identifier, f"expected identifier after '.'")
 
 		rhs: ast.Expr
-		if ps.peek().type == "LParen":
+		if ps.peek().type == TokenKind.LParen:
 			rhs = parse_func_call(ps, ast.VarRef(ident.loc, ident.text))
 		else:
 			rhs = ast.VarRef(ident.loc, ident.text)
 
-		return parse_atom_chain(ps, ast.DotOp(tok.loc, lhs, rhs))
+		lhs = ast.DotOp(tok.loc, lhs, rhs)
 
-	elif ps.peek().type == "LParen":
+	if ps.peek().type == TokenKind.LParen:
 		return parse_func_call(ps, lhs)
 	else:
 		return lhs
 
 
 def parse_primary(ps: ParserState) -> ast.Expr:
-	if tok := ps.next_if("kw_true"):
+	if tok := ps.next_if(TokenKind.kw_true):
 		return ast.BooleanLit(tok.loc, True)
 
-	elif tok := ps.next_if("kw_false"):
+	elif tok := ps.next_if(TokenKind.kw_false):
 		return ast.BooleanLit(tok.loc, False)
 
-	elif tok := ps.next_if("kw_null"):
+	elif tok := ps.next_if(TokenKind.kw_null):
 		return ast.NullLit(tok.loc)
 
-	elif tok := ps.next_if("kw_this"):
+	elif tok := ps.next_if(TokenKind.kw_this):
 		return ast.ThisLit(tok.loc)
 
-	elif (str_lit := ps.next_if("StringLiteral")):
+	elif (str_lit := ps.next_if(TokenKind.StringLiteral)):
 		return ast.StringLit(str_lit.loc, str_lit.text)
 
-	elif (int_lit := ps.next_if("IntegerLiteral")):
+	elif (int_lit := ps.next_if(TokenKind.IntegerLiteral)):
 		return ast.IntegerLit(int_lit.loc, int(int_lit.text))
 
-	elif tok := ps.next_if("kw_new"):
-		cls_name = ps.expect("ClassName", "expected class name after 'new'").text
-		ps.expect("LParen")
-		ps.expect("RParen")
+	elif tok := ps.next_if(TokenKind.kw_new):
+		cls_name = ps.expect(TokenKind.ClassName, "expected class name after 'new'").text
+		ps.expect(TokenKind.LParen)
+		ps.expect(TokenKind.RParen)
 
 		new = ast.NewExpr(tok.loc, cls_name)
-		if ps.peek().type == "Period":
+		if ps.peek().type == TokenKind.Period:
 			return parse_atom_chain(ps, new)
 		else:
 			return new
 
-	elif ps.next_if("LParen"):
+	elif ps.next_if(TokenKind.LParen):
 		inside: ast.Expr = parse_expr(ps)
-		ps.expect("RParen")
+		ps.expect(TokenKind.RParen)
 		return ast.ParenExpr(inside)
 
-	elif (var_name := ps.next_if("Identifier")):
+	elif (var_name := ps.next_if(TokenKind.Identifier)):
 		vr = ast.VarRef(var_name.loc, var_name.text)
 		return parse_atom_chain(ps, vr)
 
@@ -167,43 +211,51 @@ def parse_primary(ps: ParserState) -> ast.Expr:
 
 
 def parse_unary(ps: ParserState) -> ast.Expr:
-	if tok := ps.next_if("Exclamation"):
-		return ast.UnaryOp(tok.loc, parse_unary(ps), '!')
+	prefixes: List[Tuple[Location, str]] = []
+	while (op := UNARY_OPERATORS.get(ps.peek().type)) is not None:
+		prefixes.append((ps.next().loc, op))
 
-	elif tok := ps.next_if("Minus"):
-		return ast.UnaryOp(tok.loc, parse_unary(ps), '-')
+	expr = parse_primary(ps)
+	for loc, op in reversed(prefixes):
+		expr = ast.UnaryOp(loc, expr, op)
 
-	else:
-		return parse_primary(ps)
+	return expr
 
 
 
 
 def parse_rhs(ps: ParserState, lhs: ast.Expr, prio: int) -> ast.Expr:
-	if ps.empty():
-		return lhs
+	# precedence climbing, but with an explicit stack instead of recursing whenever the operator
+	# on the right binds tighter. each entry is an operator still waiting for its right operand,
+	# along with the lhs it applies to and the priority to go back to once we're done.
+	pending: List[Tuple[ast.Expr, str, Location, int]] = []
 
 	while True:
-		if ps.peek().type == "Period":
+		if ps.peek().type == TokenKind.Period:
 			lhs = parse_atom_chain(ps, lhs)
 			continue
 
 		prec: int = get_precedence(ps.peek())
 		if prec < prio:
-			return lhs
+			if len(pending) == 0:
+				return lhs
+
+			outer, op, op_loc, prio = pending.pop()
+			lhs = ast.BinaryOp(op_loc, outer, lhs, op)
+			continue
 
 		ps.skip_whitespace()
 		op_loc = ps.loc
-		op: str = ps.next().text
+		op = ps.next().text
 
 		rhs = parse_unary(ps)
 
 		# note: there is no right-associative operator here, so this works fine without special-casing that
-		next: int = get_precedence(ps.peek())
-		if next > prec:
-			rhs = parse_rhs(ps, rhs, prec + 1)
-
-		lhs = ast.BinaryOp(op_loc, lhs, rhs, op)
+		if get_precedence(ps.peek()) > prec:
+			pending.append((lhs, op, op_loc, prio))
+			lhs, prio = rhs, prec + 1
+		else:
+			lhs = ast.BinaryOp(op_loc, lhs, rhs, op)
 
 
 def parse_expr(ps: ParserState) -> ast.Expr:
@@ -218,7 +270,7 @@ def parse_stmt_list(ps: ParserState) -> List[ast.Stmt]:
 		if is_typename(ps.peek()):
 			raise ParseException(ps.loc, "variable declarations must be at the top of the method body")
 
-		elif ps.peek().type == "RBrace":
+		elif ps.peek().type == TokenKind.RBrace:
 			break;
 
 		stmts.append(parse_stmt(ps))
@@ -227,25 +279,25 @@ def parse_stmt_list(ps: ParserState) -> List[ast.Stmt]:
 
 
 def parse_block(ps: ParserState) -> ast.Block:
-	ps.expect("LBrace", "expected '{' to start a block")
+	ps.expect(TokenKind.LBrace, "expected '{' to start a block")
 	stmts = parse_stmt_list(ps)
-	ps.expect("RBrace", "expected '}' to end a block")
+	ps.expect(TokenKind.RBrace, "expected '}' to end a block")
 	return ast.Block(stmts)
 
 
 def parse_if_stmt(ps: ParserState) -> ast.IfStmt:
-	loc = ps.expect("kw_if").loc
-	ps.expect("LParen", lambda t: f"expected '(' after 'if', found '{t.text}' instead")
+	loc = ps.expect(TokenKind.kw_if).loc
+	ps.expect(TokenKind.LParen, lambda t: f"expected '(' after 'if', found '{t.text}' instead")
 
 	condition = parse_expr(ps)
 
-	ps.expect("RParen", lambda t: f"expected ')' after if condition, found '{t.text}' instead")
+	ps.expect(TokenKind.RParen, lambda t: f"expected ')' after if condition, found '{t.text}' instead")
 
 	true_case = parse_block(ps)
 	if len(true_case.stmts) == 0:
 		raise ParseException(ps.loc, "if statement must contain at least one statement")
 
-	ps.expect("kw_else", "'else' clause is mandatory in if statements")
+	ps.expect(TokenKind.kw_else, "'else' clause is mandatory in if statements")
 
 	else_case = parse_block(ps)
 	if len(else_case.stmts) == 0:
@@ -256,12 +308,12 @@ def parse_if_stmt(ps: ParserState) -> ast.IfStmt:
 
 
 def parse_while_loop(ps: ParserState) -> ast.WhileLoop:
-	loc = ps.expect("kw_while").loc
-	ps.expect("LParen", lambda t: f"expected '(' after 'while', found '{t.text}' instead")
+	loc = ps.expect(TokenKind.kw_while).loc
+	ps.expect(TokenKind.LParen, lambda t: f"expected '(' after 'while', found '{t.text}' instead")
 
 	condition = parse_expr(ps)
 
-	ps.expect("RParen", lambda t: f"expected ')' after while condition, found '{t.text}' instead")
+	ps.expect(TokenKind.RParen, lambda t: f"expected ')' after while condition, found '{t.text}' instead")
 
 	# while loops can have an empty body... for some reason.
 	body = parse_block(ps)
@@ -269,28 +321,28 @@ def parse_while_loop(ps: ParserState) -> ast.WhileLoop:
 
 
 def parse_readln(ps: ParserState) -> ast.ReadLnCall:
-	loc = ps.expect("kw_readln").loc
-	ps.expect("LParen", lambda t: f"expected '(' after 'readln', found '{t.text}' instead")
+	loc = ps.expect(TokenKind.kw_readln).loc
+	ps.expect(TokenKind.LParen, lambda t: f"expected '(' after 'readln', found '{t.text}' instead")
 
-	ident = ps.expect("Identifier", "expected identifier in argument to 'readln'").text
+	ident = ps.expect(TokenKind.Identifier, "expected identifier in argument to 'readln'").text
 
-	ps.expect("RParen")
+	ps.expect(TokenKind.RParen)
 	ps.expect_semicolon()
 	return ast.ReadLnCall(loc, ident)
 
 def parse_println(ps: ParserState) -> ast.PrintLnCall:
-	loc = ps.expect("kw_println").loc
-	ps.expect("LParen", lambda t: f"expected '(' after 'println', found '{t.text}' instead")
+	loc = ps.expect(TokenKind.kw_println).loc
+	ps.expect(TokenKind.LParen, lambda t: f"expected '(' after 'println', found '{t.text}' instead")
 
 	ret = ast.PrintLnCall(loc, parse_expr(ps))
-	ps.expect("RParen")
+	ps.expect(TokenKind.RParen)
 	ps.expect_semicolon()
 	return ret
 
 def parse_return_stmt(ps: ParserState) -> ast.ReturnStmt:
-	loc = ps.expect("kw_return").loc
+	loc = ps.expect(TokenKind.kw_return).loc
 
-	if ps.next_if("Semicolon"):
+	if ps.next_if(TokenKind.Semicolon):
 		return ast.ReturnStmt(loc, None)
 
 	expr = parse_expr(ps)
@@ -305,19 +357,19 @@ def parse_return_stmt(ps: ParserState) -> ast.ReturnStmt:
 def parse_stmt(ps: ParserState) -> ast.Stmt:
 	tok: Token = ps.peek()
 
-	if tok.type == "kw_if":
+	if tok.type == TokenKind.kw_if:
 		return parse_if_stmt(ps)
 
-	elif tok.type == "kw_while":
+	elif tok.type == TokenKind.kw_while:
 		return parse_while_loop(ps)
 
-	elif tok.type == "kw_readln":
+	elif tok.type == TokenKind.kw_readln:
 		return parse_readln(ps)
 
-	elif tok.type == "kw_println":
+	elif tok.type == TokenKind.kw_println:
 		return parse_println(ps)
 
-	elif tok.type == "kw_return":
+	elif tok.type == TokenKind.kw_return:
 		return parse_return_stmt(ps)
 
 	else:
@@ -327,7 +379,7 @@ def parse_stmt(ps: ParserState) -> ast.Stmt:
 		expr: ast.Expr = parse_expr(ps)
 
 		# if this is an assignment, do it directly.
-		if tmp := ps.next_if("Equal"):
+		if tmp := ps.next_if(TokenKind.Equal):
 			if not isinstance(expr, ast.DotOp) and not isinstance(expr, ast.VarRef):
 				raise ParseException(expr.loc, "left-hand operand of assignment must be an identifier or a dotop")
 
@@ -354,81 +406,81 @@ def parse_typed_name(ps: ParserState) -> Tuple[str, str]:
 	name: str = ""
 
 	tok = ps.next()
-	if tok.type == "kw_Int":      ty = "Int"
-	elif tok.type == "kw_Bool":   ty = "Bool"
-	elif tok.type == "kw_Void":   ty = "Void"
-	elif tok.type == "kw_String": ty = "String"
-	elif tok.type == "ClassName": ty = tok.text
+	if tok.type == TokenKind.kw_Int:      ty = "Int"
+	elif tok.type == TokenKind.kw_Bool:   ty = "Bool"
+	elif tok.type == TokenKind.kw_Void:   ty = "Void"
+	elif tok.type == TokenKind.kw_String: ty = "String"
+	elif tok.type == TokenKind.ClassName: ty = tok.text
 	else:
 		raise ParseException(tok.loc,
 			f"expected typename (either 'Int', 'Void', 'Bool', 'String', or a class name), found '{tok.text}' instead")
 
-	name = ps.expect("Identifier").text
+	name = ps.expect(TokenKind.Identifier).text
 
 	assert len(name) > 0 and len(ty) > 0
 	return ty, name
 
 
 def parse_method_body(ps: ParserState) -> Tuple[List[ast.VarDecl], List[ast.Stmt]]:
-	ps.expect("LBrace")
+	ps.expect(TokenKind.LBrace)
 
 	# var decls must come before statements like it's 1989.
 	# we know that statements never start with a class name, so we use that to differentiate.
 	var_decls: List[ast.VarDecl] = []
 	stmts: List[ast.Stmt] = []
 
-	while not ps.empty() and ps.peek().type != "RBrace":
+	while not ps.empty() and ps.peek().type != TokenKind.RBrace:
 		if is_typename(ps.peek()):
 			ps.skip_whitespace()
 
 			loc = ps.loc
 			ty, name = parse_typed_name(ps)
 			var_decls.append(ast.VarDecl(loc, name, ty))
-			ps.expect("Semicolon", "expected ';' after variable declaration")
+			ps.expect(TokenKind.Semicolon, "expected ';' after variable declaration")
 		else:
 			stmts = parse_stmt_list(ps)
 
 	if len(stmts) == 0:
 		raise ParseException(ps.loc, "method body cannot be empty")
 
-	ps.expect("RBrace")
+	ps.expect(TokenKind.RBrace)
 	return var_decls, stmts
 
 
 def parse_arg_list(ps: ParserState) -> List[ast.VarDecl]:
-	ps.expect("LParen")
+	ps.expect(TokenKind.LParen)
 
 	ret: List[ast.VarDecl] = []
-	while not ps.empty() and ps.peek().type != "RParen":
+	while not ps.empty() and ps.peek().type != TokenKind.RParen:
 		loc = ps.loc
 		ty, name = parse_typed_name(ps)
 		ret.append(ast.VarDecl(loc, name, ty))
 
-		if ps.peek().type == "RParen":
+		if ps.peek().type == TokenKind.RParen:
 			break
-		elif ps.peek().type == "Comma":
+		elif ps.peek().type == TokenKind.Comma:
 			ps.next()
 		else:
 			raise ParseException(ps.loc, f"unexpected token '{ps.peek().text}'")
 
-	ps.expect("RParen")
+	ps.expect(TokenKind.RParen)
 	return ret
 
 
 def parse_class(ps: ParserState, is_first: bool) -> ast.ClassDefn:
-	loc = ps.expect("kw_class").loc
-	cls_name = ps.expect("ClassName").text
+	loc = ps.expect(TokenKind.kw_class).loc
+	cls_name = ps.expect(TokenKind.ClassName).text
 	cls_def = ast.ClassDefn(loc, cls_name, [], [])
 
-	ps.expect("LBrace")
+	ps.expect(TokenKind.LBrace)
 	if is_first:
-		loc = ps.expect("kw_Void", lambda t: f"first method of first class ('main') must return 'Void', not '{t.text}'").loc
-		ps.expect("kw_main", lambda t: f"first method of first class must be named 'main', not '{t.text}'")
+		loc = ps.expect(TokenKind.kw_Void, lambda t: f"first method of first class ('main') must return 'Void', not '{t.text}'").loc
+		ps.expect(TokenKind.kw_main, lambda t: f"first method of first class must be named 'main', not '{t.text}'")
 
 		arg_list = parse_arg_list(ps)
 		var_decls, stmts = parse_method_body(ps)
 
-		ps.expect("RBrace")
+		ps.expect(TokenKind.RBrace)
 
 		cls_def.methods.append(ast.MethodDefn(loc, "main", cls_def, arg_list, "Void", var_decls, ast.Block(stmts)))
 		return cls_def
@@ -438,17 +490,17 @@ def parse_class(ps: ParserState, is_first: bool) -> ast.ClassDefn:
 	# since both method and variables start with <Type> <identifier>,
 	# defer constructing the AST node till we reach the next token, which should be ';' for a field
 	# and '(' for a method.
-	while not ps.empty() and ps.peek().type != "RBrace":
+	while not ps.empty() and ps.peek().type != TokenKind.RBrace:
 		ps.skip_whitespace()
 
 		loc = ps.loc
 		ty, name = parse_typed_name(ps)
 
-		if ps.peek().type == "Semicolon":
+		if ps.peek().type == TokenKind.Semicolon:
 			cls_def.fields.append(ast.VarDecl(loc, name, ty))
 			ps.next()
 
-		elif ps.peek().type == "LParen":
+		elif ps.peek().type == TokenKind.LParen:
 			arg_list = parse_arg_list(ps)
 			var_decls, stmts = parse_method_body(ps)
 			cls_def.methods.append(ast.MethodDefn(loc, name, cls_def, arg_list, ty, var_decls, ast.Block(stmts)))
@@ -457,7 +509,7 @@ def parse_class(ps: ParserState, is_first: bool) -> ast.ClassDefn:
 			raise ParseException(ps.loc,
 				f"expected ';' to declare a field or '(' to begin a method, found '{ps.peek().text}' instead")
 
-	ps.expect("RBrace")
+	ps.expect(TokenKind.RBrace)
 	return cls_def
 
 
@@ -474,5 +526,8 @@ def parse_program(ps: ParserState) -> ast.Program:
 	except ParseException as e:
 		e.throw()
 
+	log(f"parser: {ps.lexer_calls} lexer calls for {ps.tokens_consumed} tokens "
+		+ f"({ps.lexer_calls / max(1, ps.tokens_consumed):.2f} per token)")
+
 	return ast.Program(classes)
 
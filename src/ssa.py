@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from typing import *
+
+from . import ir3
+from . import iropt
+from . import cgpseudo
+from . import dataflow
+
+from . import util
+
+# putting functions into (and taking them out of) SSA form. the optimiser works on SSA (see
+# typecheck_method), which lets it reason about a variable by looking at its one definition,
+# instead of having to find out which of its assignments can reach a particular use.
+#
+# note that we rely on ir3 blocks only having branches at the very end (ie. every definition in a
+# block comes before all of its branches), which is how typecheck makes them. this means that the
+# value of a variable leaving a block is the same along all of its outgoing edges.
+
+
+
+def construct(func: ir3.FuncDefn) -> None:
+	# this is the usual cytron et al. construction: phis go on the iterated dominance frontier of the
+	# blocks that define a variable -- but only where the variable is live ("pruned" SSA), since the
+	# rest would just be dead. then a walk down the dominator tree gives each definition a new name.
+
+	# the rename walk only sees reachable blocks, so get rid of the others first.
+	iropt.remove_unreachable_blocks(func)
+
+	cfg = func.cfg
+	entry = func.blocks[0]
+	assert len(entry.predecessors) == 0
+
+	stmts = cfg.renumber()
+	variables, ins, _ = live_variables(func, stmts)
+
+	def is_live_in(var: str, stmt: ir3.Stmt) -> bool:
+		return (ins[stmt.id] >> variables.indices[var]) & 1 == 1
+
+	# the blocks that define each variable (phis that are already there count too)
+	def_blocks: Dict[str, Dict[ir3.BasicBlock, None]] = dict()
+	for stmt in stmts:
+		for d in iropt.get_statement_defs(stmt):
+			def_blocks.setdefault(d, dict())[cfg.block_of(stmt)] = None
+
+	frontiers = cfg.dominance_frontiers()
+	new_phis: Dict[ir3.BasicBlock, List[str]] = dict()
+
+	for var, blocks in def_blocks.items():
+		worklist = list(blocks)
+		visited: Set[ir3.BasicBlock] = set()
+		while len(worklist) > 0:
+			for df in frontiers[worklist.pop()]:
+				if df in visited:
+					continue
+
+				visited.add(df)
+				if is_live_in(var, df.stmts[0]):
+					new_phis.setdefault(df, []).append(var)
+					if df not in blocks:
+						worklist.append(df)
+
+	block_order = { b: i for i, b in enumerate(func.blocks) }
+	num_phis = 0
+	for block in func.blocks:
+		preds = sorted(block.predecessors, key = lambda b: block_order[b])
+		phis: List[ir3.Stmt] = [ cgpseudo.PhiNode(block.loc, var, [ (ir3.VarRef(block.loc, var), p.name) for p in preds ])
+			for var in new_phis.get(block, []) ]
+
+		block.stmts[0:0] = phis
+		num_phis += len(phis)
+
+
+	# now the renaming. the value on entry to the function keeps the original name (so parameters
+	# still work), and each definition after that gets a new version. if the entry value is never
+	# used, the first definition can have the original name instead.
+	decls: Dict[str, ir3.VarDecl] = { v.name: v for v in func.params }
+	decls.update({ v.name: v for v in func.vars })
+
+	versions: Dict[str, int] = dict()
+	num_defs = 0
+	names: Dict[str, List[str]] = { var: [ var ] for var in def_blocks }
+
+	def new_version(var: str) -> str:
+		n = versions.get(var, 1 if is_live_in(var, stmts[0]) else 0)
+		versions[var] = n + 1
+		if n == 0:
+			return var
+
+		name = f"{var}${n}"
+		func.vars.append(ir3.VarDecl(decls[var].loc, name, decls[var].type))
+		return name
+
+	def current_name(var: str) -> str:
+		return names[var][-1] if var in names else var
+
+	children = cfg.dominator_tree()
+
+	# this is a dfs over the dominator tree; each entry is (block, the variables that it gave a new
+	# name to), where the second part is None if we haven't been through the block yet.
+	stack: List[Tuple[ir3.BasicBlock, Optional[List[str]]]] = [ (entry, None) ]
+	while len(stack) > 0:
+		block, defined = stack.pop()
+		if defined is not None:
+			for var in defined:
+				names[var].pop()
+			continue
+
+		defined = []
+		for stmt in block.stmts:
+			# the operands of phis belong to the predecessors, so they get renamed over there.
+			if not isinstance(stmt, cgpseudo.PhiNode):
+				rename_uses(stmt, current_name)
+
+			for d in iropt.get_statement_defs(stmt):
+				names[d].append(new_version(d))
+				rename_def(stmt, names[d][-1])
+				defined.append(d)
+				num_defs += 1
+
+		for succ in cfg.successors[block]:
+			for phi in iropt.get_phi_nodes(succ):
+				phi.values = [ (rename_value(value, current_name) if label == block.name else value, label)
+					for value, label in phi.values ]
+
+		stack.append((block, defined))
+		for child in reversed(children[block]):
+			stack.append((child, None))
+
+	# the index is keyed on the old names.
+	func.def_use = None
+	util.log(f"ssa({func.name}): inserted {num_phis} phi{'' if num_phis == 1 else 's'}, "
+		+ f"renamed {num_defs} definition{'' if num_defs == 1 else 's'}")
+
+
+
+def destruct(func: ir3.FuncDefn) -> None:
+	# phis are really parallel copies on the incoming edges, done all at once when the edge is taken.
+	# to avoid most of the copies, a phi's result is first merged with its operands (so that they
+	# become the same variable) whenever their live ranges don't overlap; this is always the case
+	# for the phis that typecheck makes for short-circuiting.
+	#
+	# whatever is left over is turned into a parallel copy on each edge, which is then put into some
+	# (sequential) order. if the predecessor can also go somewhere else, the edge gets a block of its
+	# own for the copies, so that they don't happen on any other path.
+
+	cfg = func.cfg
+	phi_blocks = [ b for b in func.blocks if len(iropt.get_phi_nodes(b)) > 0 ]
+	if len(phi_blocks) == 0:
+		return
+
+	block_order = { b: i for i, b in enumerate(func.blocks) }
+	stmts = cfg.renumber()
+	variables, ins, outs = live_variables(func, stmts)
+
+	def_stmts: Dict[str, List[int]] = dict()
+	phi_defs: Dict[str, ir3.BasicBlock] = dict()
+	for stmt in stmts:
+		for d in iropt.get_statement_defs(stmt):
+			def_stmts.setdefault(d, []).append(stmt.id)
+			if isinstance(stmt, cgpseudo.PhiNode):
+				phi_defs[d] = cfg.block_of(stmt)
+
+	# whether `a` is live just after `b` is defined (anything that isn't defined anywhere is
+	# defined on entry to the function)
+	def live_at_def(a: str, b: str) -> bool:
+		if a not in variables.indices:
+			return False
+
+		bit = 1 << variables.indices[a]
+		if b not in def_stmts:
+			return (ins[0] & bit) != 0
+
+		return any((outs[d] & bit) != 0 for d in def_stmts[b])
+
+	def interferes(a: str, b: str) -> bool:
+		# the phis of a block happen all at once, so their results always need separate variables
+		if a in phi_defs and phi_defs.get(b) is phi_defs[a]:
+			return True
+
+		return live_at_def(a, b) or live_at_def(b, a)
+
+	params = set(map(lambda v: v.name, func.params))
+
+	# each variable maps to the variable that it was merged into, and each of those to everything
+	# that was merged into it.
+	merged_into: Dict[str, str] = dict()
+	members: Dict[str, List[str]] = dict()
+
+	def merge(a: str, b: str) -> bool:
+		a = merged_into.get(a, a)
+		b = merged_into.get(b, b)
+		if a == b:
+			return True
+
+		ma = members.get(a, [ a ])
+		mb = members.get(b, [ b ])
+
+		# only one parameter can keep its name.
+		if sum(1 for m in ma + mb if m in params) > 1:
+			return False
+
+		if any(interferes(x, y) for x in ma for y in mb):
+			return False
+
+		# prefer keeping the names of parameters, then the original name of a variable.
+		keep = min(ma + mb, key = lambda m: (m not in params, "$" in m))
+		for m in ma + mb:
+			merged_into[m] = keep
+
+		members.pop(a, None)
+		members.pop(b, None)
+		members[keep] = ma + mb
+		return True
+
+	for block in phi_blocks:
+		for phi in iropt.get_phi_nodes(block):
+			for value, _ in phi.values:
+				if isinstance(value, ir3.VarRef):
+					merge(phi.lhs, value.name)
+
+	def get_name(var: str) -> str:
+		return merged_into.get(var, var)
+
+	for stmt in stmts:
+		rename_uses(stmt, get_name)
+		for d in iropt.get_statement_defs(stmt):
+			rename_def(stmt, get_name(d))
+
+	func.vars = [ v for v in func.vars if get_name(v.name) == v.name ]
+	decls: Dict[str, ir3.VarDecl] = { v.name: v for v in func.params }
+	decls.update({ v.name: v for v in func.vars })
+
+	num_copies = 0
+	for block in phi_blocks:
+		phis = iropt.get_phi_nodes(block)
+		del block.stmts[:len(phis)]
+
+		for pred in sorted(block.predecessors, key = lambda b: block_order[b]):
+			copies = [ (phi.lhs, iropt.get_phi_value(phi, pred)) for phi in phis ]
+			copies = [ (d, v) for d, v in copies if not (isinstance(v, ir3.VarRef) and v.name == d) ]
+			if len(copies) == 0:
+				continue
+
+			num_branches = sum(1 for s in pred.stmts if isinstance(s, ir3.Branch) or isinstance(s, ir3.CondBranch))
+			if num_branches > 1:
+				pred = split_edge(func, pred, block)
+
+			# now the only branch is the last statement, so the copies go right before it.
+			assigns = [ ir3.AssignOp(block.loc, d, ir3.ValueExpr(block.loc, v)) for d, v in sequentialise(func, decls, copies) ]
+			pred.stmts[-1:-1] = assigns
+			num_copies += len(assigns)
+
+	func.def_use = None
+	util.log(f"ssa({func.name}): {num_copies} cop{'y' if num_copies == 1 else 'ies'} left after coalescing phis")
+
+
+
+def sequentialise(func: ir3.FuncDefn, decls: Dict[str, ir3.VarDecl], copies: List[Tuple[str, ir3.Value]]) \
+	-> List[Tuple[str, ir3.Value]]:
+
+	# a copy can be done once nothing else still needs the old value of its destination. if every
+	# remaining copy is stuck, then they form cycles (eg. a swap), so one of the destinations
+	# gets saved in a temporary first.
+	pending: Dict[str, ir3.Value] = dict(copies)
+	ordered: List[Tuple[str, ir3.Value]] = []
+
+	while len(pending) > 0:
+		needed = set(v.name for v in pending.values() if isinstance(v, ir3.VarRef))
+		ready = [ d for d in pending if d not in needed ]
+
+		if len(ready) > 0:
+			for d in ready:
+				ordered.append((d, pending.pop(d)))
+			continue
+
+		dest = next(iter(pending))
+		tmp = f"{dest}$tmp"
+		if tmp not in decls:
+			decls[tmp] = ir3.VarDecl(decls[dest].loc, tmp, decls[dest].type)
+			func.vars.append(decls[tmp])
+
+		ordered.append((tmp, ir3.VarRef(func.loc, dest)))
+		for d, v in pending.items():
+			if isinstance(v, ir3.VarRef) and v.name == dest:
+				pending[d] = ir3.VarRef(func.loc, tmp)
+
+	return ordered
+
+
+def split_edge(func: ir3.FuncDefn, pred: ir3.BasicBlock, succ: ir3.BasicBlock) -> ir3.BasicBlock:
+	# put a new block on the edge, which just jumps to the old target.
+	name = f"{pred.name}_{succ.name}"
+	middle = ir3.BasicBlock(succ.loc, name, [ ir3.Branch(succ.loc, succ.name) ], set())
+
+	for stmt in pred.stmts:
+		if (isinstance(stmt, ir3.Branch) or isinstance(stmt, ir3.CondBranch)) and stmt.label == succ.name:
+			stmt.label = name
+
+	func.cfg.add_block(middle, before = succ)
+	func.cfg.update_edges(pred)
+
+	for phi in iropt.get_phi_nodes(succ):
+		phi.values = [ (value, name if label == pred.name else label) for value, label in phi.values ]
+
+	return middle
+
+
+def live_variables(func: ir3.FuncDefn, stmts: List[ir3.Stmt]) -> Tuple[dataflow.Universe[str], List[int], List[int]]:
+	# returns (variables, ins, outs) for each statement. the statements need to be numbered.
+	# the operands of a phi are used on the edge from their block, not by the phi itself, so
+	# they count as being used at the end of that block instead.
+	variables: dataflow.Universe[str] = dataflow.Universe()
+	for v in func.params + func.vars:
+		variables.add(v.name)
+
+	defs: List[int] = [ 0 ] * len(stmts)
+	uses: List[int] = [ 0 ] * len(stmts)
+
+	for stmt in stmts:
+		defs[stmt.id] = variables.mask(iropt.get_statement_defs(stmt))
+		if not isinstance(stmt, cgpseudo.PhiNode):
+			uses[stmt.id] |= variables.mask(iropt.get_statement_uses(stmt))
+			continue
+
+		for value, label in stmt.values:
+			if isinstance(value, ir3.VarRef):
+				uses[func.cfg.block(label).stmts[-1].id] |= variables.bit(value.name)
+
+	ins, outs = dataflow.solve_blocks(iropt.compute_block_graph(func), uses, defs,
+		forward = False, union = True).statements()
+
+	return variables, ins, outs
+
+
+def rename_value(value: ir3.Value, rename: Callable[[str], str]) -> ir3.Value:
+	if isinstance(value, ir3.VarRef) and (new := rename(value.name)) != value.name:
+		return ir3.VarRef(value.loc, new)
+
+	return value
+
+
+def rename_uses(stmt: ir3.Stmt, rename: Callable[[str], str]) -> None:
+	iropt.visit_values_in_stmt(lambda v: rename_value(v, rename), stmt)
+
+	# objects are referred to by name, not by value.
+	if isinstance(stmt, ir3.AssignDotOp):
+		stmt.lhs1 = rename(stmt.lhs1)
+
+	if (isinstance(stmt, ir3.AssignOp) or isinstance(stmt, ir3.AssignDotOp)) and isinstance(stmt.rhs, ir3.DotOp):
+		stmt.rhs.lhs = rename(stmt.rhs.lhs)
+
+
+def rename_def(stmt: ir3.Stmt, name: str) -> None:
+	if isinstance(stmt, ir3.AssignOp) or isinstance(stmt, cgpseudo.PhiNode):
+		stmt.lhs = name
+
+	elif isinstance(stmt, ir3.ReadLnCall):
+		stmt.name = name
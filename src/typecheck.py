@@ -8,6 +8,7 @@ from functools import reduce
 from . import ast
 from . import ir3
 from . import simp
+from . import ssa
 from . import iropt
 from . import cgpseudo
 
@@ -527,7 +528,7 @@ def typecheck_cond(ts: TypecheckState, expr: ast.Expr) -> Tuple[List[ir3.Stmt],
 
 					# now in the left-false case
 					lfalse_block,
-					assign1 := ir3.AssignOp(expr.loc, tmp1.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, False))),
+					ir3.AssignOp(expr.loc, tmp1.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, False))),
 					ir3.Branch(expr.loc, merge_block.name),
 
 					# now in the lhs-true case
@@ -540,17 +541,20 @@ def typecheck_cond(ts: TypecheckState, expr: ast.Expr) -> Tuple[List[ir3.Stmt],
 
 					# rhs-false case
 					rfalse_block,
-					assign2 := ir3.AssignOp(expr.loc, tmp2.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, False))),
+					ir3.AssignOp(expr.loc, tmp2.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, False))),
 					ir3.Branch(expr.loc, merge_block.name),
 
 					# true case
 					rtrue_block,
-					assign3 := ir3.AssignOp(expr.loc, tmp3.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, True))),
+					ir3.AssignOp(expr.loc, tmp3.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, True))),
 					ir3.Branch(expr.loc, merge_block.name),
 
 					merge_block,
-					cgpseudo.PhiNode(expr.loc, result.name,
-						[(tmp1.name, assign1), (tmp2.name, assign2), (tmp3.name, assign3)])
+					cgpseudo.PhiNode(expr.loc, result.name, [
+						(ir3.VarRef(expr.loc, tmp1.name), lfalse_block.name),
+						(ir3.VarRef(expr.loc, tmp2.name), rfalse_block.name),
+						(ir3.VarRef(expr.loc, tmp3.name), rtrue_block.name)
+					])
 				]
 
 				return (stmts, ir3.VarRef(expr.loc, result.name))
@@ -577,17 +581,20 @@ def typecheck_cond(ts: TypecheckState, expr: ast.Expr) -> Tuple[List[ir3.Stmt],
 
 					# false-false case:
 					false_false_block,
-					assign1 := ir3.AssignOp(expr.loc, tmp1.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, False))),
+					ir3.AssignOp(expr.loc, tmp1.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, False))),
 					ir3.Branch(expr.loc, merge_block.name),
 
 					# true case:
 					true_block,
-					assign2 := ir3.AssignOp(expr.loc, tmp2.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, True))),
+					ir3.AssignOp(expr.loc, tmp2.name, ir3.ValueExpr(expr.loc, ir3.ConstantBool(expr.loc, True))),
 					ir3.Branch(expr.loc, merge_block.name),
 
 					# merge:
 					merge_block,
-					cgpseudo.PhiNode(expr.loc, result.name, [(tmp1.name, assign1), (tmp2.name, assign2)])
+					cgpseudo.PhiNode(expr.loc, result.name, [
+						(ir3.VarRef(expr.loc, tmp1.name), false_false_block.name),
+						(ir3.VarRef(expr.loc, tmp2.name), true_block.name)
+					])
 				]
 				return (stmts, ir3.VarRef(expr.loc, result.name))
 
@@ -1016,6 +1023,7 @@ def typecheck_method(ts: TypecheckState, meth: ast.MethodDefn) -> ir3.FuncDefn:
 		iropt.print_with_stmt_nums(func)
 
 	if options.optimisations_enabled():
+		ssa.construct(func)
 		iropt.optimise(func)
 
 	if options.should_print_optimised_ir():
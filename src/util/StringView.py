@@ -4,6 +4,8 @@
 from __future__ import annotations
 from typing import *
 
+import mmap
+
 class StringView:
 	@overload
 	def __init__(self, data: str) -> None: ...
@@ -11,7 +13,10 @@ class StringView:
 	@overload
 	def __init__(self, data: bytes) -> None: ...
 
-	def __init__(self, data: Union[str, bytes, memoryview]) -> None:
+	@overload
+	def __init__(self, data: memoryview) -> None: ...
+
+	def __init__(self, data: Union[str, bytes, memoryview, mmap.mmap]) -> None:
 		self.buffer: memoryview
 
 		if isinstance(data, str):
@@ -20,6 +25,8 @@ class StringView:
 			self.buffer = memoryview(data)
 		elif isinstance(data, memoryview):
 			self.buffer = data
+		elif isinstance(data, mmap.mmap):
+			self.buffer = memoryview(data)
 		else:
 			raise TypeError(f"invalid type {type(data)}")
 
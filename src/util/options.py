@@ -10,6 +10,9 @@ __is_verbose = False
 __print_lowered_ir = False
 __print_opt_ir = False
 __print_ir = False
+__unroll_factor = 4
+__linear_scan = False
+__linear_scan_threshold = 5000
 
 
 def should_print_lowered_ir():
@@ -79,3 +82,32 @@ def disable_optimisations():
 	global __opts_enabled
 	__opts_enabled = False
 
+
+# how many copies of the body small counted loops get when they're unrolled (with -O); 1 turns
+# unrolling off.
+def unroll_factor() -> int:
+	global __unroll_factor
+	return __unroll_factor
+
+def set_unroll_factor(n: int):
+	global __unroll_factor
+	__unroll_factor = n
+
+
+# use linear scan instead of graph colouring for register allocation. it is always used for functions
+# with more (lowered) statements than the threshold, where colouring takes too long.
+def linear_scan_enabled() -> bool:
+	global __linear_scan
+	return __linear_scan
+
+def enable_linear_scan(en: bool = True):
+	global __linear_scan
+	__linear_scan = en
+
+def linear_scan_threshold() -> int:
+	global __linear_scan_threshold
+	return __linear_scan_threshold
+
+def set_linear_scan_threshold(n: int):
+	global __linear_scan_threshold
+	__linear_scan_threshold = n
@@ -3,8 +3,11 @@
 from __future__ import annotations
 from typing import *
 
+import re
 import sys
 import os
+import mmap
+import bisect
 
 from . import options
 
@@ -12,39 +15,112 @@ def read_entire_file(filename: str) -> str:
 	with open(filename, "rb") as f:
 		return f.read().decode("utf-8")
 
+class EscapeTable(Dict[int, str]):
+	def __missing__(self, c: int) -> str:
+		return "\\x%02x" % c
+
+# maps each byte-sized character to its escaped form, for use with str.translate
+ESCAPE_TABLE = EscapeTable({
+	c: (chr(c) if 32 <= c <= 126 else "\\x%02x" % c) for c in range(256)
+})
+
+ESCAPE_TABLE.update({
+	ord('\n'): "\\n", ord('\r'): "\\r", ord('\t'): "\\t", ord('"'): '\\\"'
+})
+
 def escape_string(s: str) -> str:
-	out: str = ""
-	for c in s:
-		if c == '\n':
-			out += "\\n"
-		elif c == '\r':
-			out += "\\r"
-		elif c == '\t':
-			out += "\\t"
-		elif c == '"':
-			out += '\\\"'
-		elif 32 <= ord(c) <= 126:
-			out += c
-		else:
-			out += ("\\x%02x" % ord(c))
-
-	return out
+	return s.translate(ESCAPE_TABLE)
 
 
-class Location:
-	def __init__(self, filename: str, l: int, col: int):
+class SourceFile:
+	"""
+	the contents of one input file. the line table is only built the first time someone asks for a
+	line or column, which (outside of error messages and annotations) is hardly ever.
+	"""
+	def __init__(self, filename: str, contents: Union[bytes, memoryview, mmap.mmap]):
 		self.filename: str = filename
-		self.column: int = col
-		self.line: int = l
+		self.buffer: memoryview = memoryview(contents)
+		self.line_starts: Optional[List[int]] = None
+
+	# every location in the file points here, so copying ast or ir3 nodes must not copy the file.
+	def __copy__(self) -> SourceFile:
+		return self
+
+	def __deepcopy__(self, memo: Dict[int, Any]) -> SourceFile:
+		return self
+
+	def get_line_starts(self) -> List[int]:
+		if self.line_starts is None:
+			self.line_starts = [0] + [ m.end() for m in re.finditer(b"\n", self.buffer) ]
+
+		return self.line_starts
+
+	def line_count(self) -> int:
+		line_starts = self.get_line_starts()
+
+		# a trailing newline doesn't start a new line
+		return len(line_starts) - (1 if line_starts[-1] == len(self.buffer) else 0)
+
+	def get_line(self, line: int) -> bytes:
+		line_starts = self.get_line_starts()
+		end = line_starts[line + 1] if line + 1 < len(line_starts) else len(self.buffer)
+
+		return bytes(self.buffer[line_starts[line]:end]).rstrip(b"\r\n")
+
+	def line_and_column(self, offset: int) -> Tuple[int, int]:
+		line_starts = self.get_line_starts()
+		line = bisect.bisect_right(line_starts, offset) - 1
+
+		prefix = bytes(self.buffer[line_starts[line]:offset])
+		return (line, len(prefix) + (TAB_WIDTH - 1) * prefix.count(b"\t"))
+
+
+def map_source_file(filename: str) -> SourceFile:
+	"""
+	maps the file into memory instead of reading it, so the front end works directly on the
+	page cache. the mapping stays alive for as long as anything refers to the SourceFile.
+	"""
+	with open(filename, "rb") as f:
+		try:
+			return SourceFile(filename, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+		except ValueError:
+			# empty files can't be mapped
+			return SourceFile(filename, b"")
+
+
+class Location:
+	__slots__ = ("file", "offset")
+
+	def __init__(self, file: SourceFile, offset: int):
+		self.file: SourceFile = file
+		self.offset: int = offset
+
+	@property
+	def filename(self) -> str:
+		return self.file.filename
+
+	@property
+	def line(self) -> int:
+		return self.file.line_and_column(self.offset)[0]
+
+	@property
+	def column(self) -> int:
+		return self.file.line_and_column(self.offset)[1]
 
 	def advancing(self, n: int) -> Location:
-		return Location(self.filename, self.line, self.column + n)
+		return Location(self.file, self.offset + n)
+
+	# locations never change, so copies of whatever they're attached to can share them (and we
+	# really don't want to copy the source file along with them).
+	def __copy__(self) -> Location:
+		return self
 
-	def advancing_line(self) -> Location:
-		return Location(self.filename, self.line + 1, 0)
+	def __deepcopy__(self, memo: Dict[int, Any]) -> Location:
+		return self
 
 	def __str__(self) -> str:
-		return f"{self.filename}:{self.line + 1}:{self.column + 1}"
+		line, column = self.file.line_and_column(self.offset)
+		return f"{self.filename}:{line + 1}:{column + 1}"
 
 def colourise(msg: str, colour: str) -> str:
 	if sys.stdout.isatty():
@@ -56,34 +132,52 @@ def colourise(msg: str, colour: str) -> str:
 TAB_WIDTH = 4
 
 def print_context(loc: Location, colour: str) -> None:
+	line, column = loc.file.line_and_column(loc.offset)
+
 	# print the gutter
-	gutter_width = 4 + len(str(1 + loc.line))
+	gutter_width = 4 + len(str(1 + line))
 
-	# we have the filename, so just read the file again
-	file_lines = open(loc.filename, "rb").read().splitlines()
-	if len(file_lines) > loc.line:
-		offending_code: str = file_lines[loc.line].decode("utf-8")
+	if loc.file.line_count() > line:
+		offending_code: str = loc.file.get_line(line).decode("utf-8")
 		offending_code = offending_code.replace('\t', ' ' * TAB_WIDTH)
 		trimmed_code = offending_code.lstrip()
 
-		arrow = "    " + (' ' * (loc.column - (len(offending_code) - len(trimmed_code)))) + '^'
+		arrow = "    " + (' ' * (column - (len(offending_code) - len(trimmed_code)))) + '^'
 
 		print(f"{' ' * (gutter_width - 2)}|")
-		print(     f" {1 + loc.line} |     {trimmed_code}")
+		print(     f" {1 + line} |     {trimmed_code}")
 		print(f"{' ' * (gutter_width - 2)}| {colourise(arrow, colour)}")
 
 
+def print_diagnostic(loc: Location, kind: str, colour: str, msg: str) -> None:
+	print(f"{loc}: {colourise(f'{kind}:', colour)} {colourise(msg, '1m')}")
+	print_context(loc, colour)
+
+
+# warnings and notes are not printed immediately; they are collected here and printed (in source
+# order) by flush_diagnostics, which happens at the end of compilation or just before an error.
+pending_diagnostics: List[Tuple[Location, str, str, str]] = []
+
+def flush_diagnostics() -> None:
+	global pending_diagnostics
+
+	# sort is stable, so diagnostics at the same location keep the order they were emitted in
+	pending_diagnostics.sort(key = lambda d: (d[0].filename, d[0].offset))
+	for loc, kind, colour, msg in pending_diagnostics:
+		print_diagnostic(loc, kind, colour, msg)
+
+	pending_diagnostics = []
+
+
 def print_error_msg(loc: Location, msg: str) -> None:
-	print(f"{loc}: {colourise('error:', '1;31m')} {colourise(msg, '1m')}")
-	print_context(loc, "1;31m")
+	flush_diagnostics()
+	print_diagnostic(loc, "error", "1;31m", msg)
 
 def print_warning(loc: Location, msg: str) -> None:
-	print(f"{loc}: {colourise('warning:', '1;35m')} {colourise(msg, '1m')}")
-	print_context(loc, "1;35m")
+	pending_diagnostics.append((loc, "warning", "1;35m", msg))
 
 def print_note(loc: Location, msg: str) -> None:
-	print(f"{loc}: {colourise('note:', '1;94m')} {colourise(msg, '1m')}")
-	print_context(loc, "1;94m")
+	pending_diagnostics.append((loc, "note", "1;94m", msg))
 
 
 
@@ -115,7 +209,7 @@ class TCException(Exception):
 	def throw(self) -> NoReturn:
 		print_error_msg(self.loc, self.msg)
 		for l, m in self.notes:
-			print_note(l, m)
+			print_diagnostic(l, "note", "1;94m", m)
 
 		sys.exit(1)
 
@@ -125,5 +219,6 @@ class CGException(Exception):
 		self.msg: str = msg
 
 	def throw(self) -> NoReturn:
+		flush_diagnostics()
 		print(f"{colourise('codegen failure:', '1;31m')} {colourise(self.msg, '1m')}")
 		sys.exit(1)
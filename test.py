@@ -24,11 +24,18 @@ def file_exists(path: str) -> bool:
 
 
 
-def compile_source(compiler: str, source: str, opt: bool) -> Tuple[str, bool]:
-	compile_flags = [ os.path.join('.', compiler), "--no-output", source ]
-	if opt:
-		compile_flags.append("--opt")
-
+# the unoptimised (.s.gold) and optimised (.s.opt) outputs are always checked. tests can also have
+# goldens for these other configurations (eg. foo.s.unroll1), which get checked if they exist.
+CONFIGS: Dict[str, List[str]] = {
+	"gold":     [],
+	"opt":      [ "--opt" ],
+	"unroll1":  [ "--opt", "--unroll", "1" ],
+	"unroll3":  [ "--opt", "--unroll", "3" ],
+	"ls":       [ "--linear-scan" ],
+}
+
+def compile_source(compiler: str, source: str, flags: List[str]) -> Tuple[str, bool]:
+	compile_flags = [ os.path.join('.', compiler), "--no-output", source, *flags ]
 	proc = sub.run(compile_flags, stdout=sub.PIPE, stderr=sub.STDOUT, text=True)
 	return proc.stdout, proc.returncode == 0
 
@@ -65,17 +72,16 @@ def run_one(compiler: str, gcc_bin: str, gem5: Tuple[str, List[str]], source: st
 
 
 	# check for the required test files
-	expected_asm_files = {
-		False: replace_ext(source, ".s.gold"),
-		True:  replace_ext(source, ".s.opt")
-	}
+	expected_asm_files = { k: replace_ext(source, f".s.{k}") for k in CONFIGS }
 
 	stdout_file = replace_ext(source, ".stdout")
 
-	if not file_exists(expected_asm_files[True]) or not file_exists(expected_asm_files[False]) or not file_exists(stdout_file):
+	if not file_exists(expected_asm_files["opt"]) or not file_exists(expected_asm_files["gold"]) or not file_exists(stdout_file):
 		print(colourise(f"\tskipped (missing files)", "1;35m"))
 		return 0
 
+	expected_asm_files = { k: v for k, v in expected_asm_files.items() if file_exists(v) }
+
 
 	expected_asms = { k: open(expected_asm_files[k], "r").read() for k in expected_asm_files }
 	expected_stdout  = open(stdout_file, "r").read()
@@ -86,9 +92,8 @@ def run_one(compiler: str, gcc_bin: str, gem5: Tuple[str, List[str]], source: st
 	cleanup = [
 		exe_file,
 		f"{stdout_file}.actual",
-		f"{stdout_file}.opt.actual",
-		f"{replace_ext(source, '.s.opt.actual')}",
-		f"{replace_ext(source, '.s.gold.actual')}"
+		*[ f"{stdout_file}.{k}.actual" for k in CONFIGS ],
+		*[ f"{replace_ext(source, f'.s.{k}.actual')}" for k in CONFIGS ]
 	]
 
 	for file in cleanup:
@@ -103,10 +108,10 @@ def run_one(compiler: str, gcc_bin: str, gem5: Tuple[str, List[str]], source: st
 		stdin_file = None
 
 
-	def perform(opt: bool) -> bool:
-		print(f"    test ({'opt' if opt else 'reg'})  jlite: ", end="", flush=True)
+	def perform(config: str) -> bool:
+		print(f"    test ({'reg' if config == 'gold' else config})".ljust(20) + "jlite: ", end="", flush=True)
 
-		asm, ok = compile_source(compiler, source, opt)
+		asm, ok = compile_source(compiler, source, CONFIGS[config])
 		if ok:
 			print(colourise(f"ok", "1;32m"), end="", flush=True)
 		else:
@@ -134,14 +139,14 @@ def run_one(compiler: str, gcc_bin: str, gem5: Tuple[str, List[str]], source: st
 
 
 		# check that the asm matches
-		expected_asm = expected_asms[opt]
+		expected_asm = expected_asms[config]
 		if asm == expected_asm:
 			print(colourise(f"match", "1;32m"), end="", flush=True)
 		else:
 			print(f"{colourise(f'mismatch', '1;31m')}", end="", flush=True)
 
-			open(f"{expected_asm_files[opt]}.actual", "w").write(asm)
-			to_see.append(f"    > see {expected_asm_files[opt]}.actual")
+			open(f"{expected_asm_files[config]}.actual", "w").write(asm)
+			to_see.append(f"    > see {expected_asm_files[config]}.actual")
 
 			# don't skip, keep running...
 			failed = True
@@ -161,8 +166,9 @@ def run_one(compiler: str, gcc_bin: str, gem5: Tuple[str, List[str]], source: st
 		else:
 			print(f"{colourise(f'mismatch', '1;31m')}", end="", flush=True)
 
-			open(f"{stdout_file}{'.opt' if opt else ''}.actual", "w").write(out)
-			to_see.append(f"    > see {stdout_file}{'.opt' if opt else ''}.actual")
+			suffix = "" if config == "gold" else f".{config}"
+			open(f"{stdout_file}{suffix}.actual", "w").write(out)
+			to_see.append(f"    > see {stdout_file}{suffix}.actual")
 			failed = True
 
 		print("")
@@ -174,8 +180,8 @@ def run_one(compiler: str, gcc_bin: str, gem5: Tuple[str, List[str]], source: st
 
 	failed = False
 	print("")
-	for opt in [ False, True ]:
-		failed |= not perform(opt)
+	for config in expected_asm_files:
+		failed |= not perform(config)
 
 
 	return -1 if failed else 1